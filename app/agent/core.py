@@ -1,13 +1,22 @@
 """Agent core orchestration using Ollama."""
 import ollama
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 import pandas as pd
 import json
 import logging
+import uuid
 
 from config import settings
-from agent.tools import TOOLS, execute_tool
-from agent.prompts import SYSTEM_PROMPT, INITIAL_ANALYSIS_PROMPT
+from analysis.data_loader import (
+    validate_production_data,
+    get_summary_stats,
+    build_dataset_profile
+)
+from analysis.sketches import DatasetSketches
+from analysis.anomaly import AnomalyState
+from agent.tools import TOOLS, execute_tool, get_rollups
+from agent.history import Conversation
+from agent.prompts import SYSTEM_PROMPT, INITIAL_ANALYSIS_PROMPT, BATCH_SUMMARY_PROMPT, build_data_context
 
 logger = logging.getLogger(__name__)
 
@@ -41,21 +50,85 @@ class ProductionAnalystAgent:
         if session_id not in self.sessions:
             self.sessions[session_id] = {
                 "df": None,
-                "messages": [],
-                "analysis_cache": {},
-                "charts": []
+                "profile": None,
+                "conversation": Conversation(SYSTEM_PROMPT),
+                "analysis_cache": {}
             }
         return self.sessions[session_id]
 
-    def load_data(self, session_id: str, df: pd.DataFrame) -> None:
-        """Load DataFrame into session."""
+    def load_data(
+        self,
+        session_id: str,
+        df: pd.DataFrame,
+        profile: Optional[Dict[str, Any]] = None,
+        sketches: Optional[DatasetSketches] = None,
+        anomaly_state: Optional[AnomalyState] = None
+    ) -> None:
+        """
+        Load DataFrame into session, profiling it unless a profile is supplied.
+
+        Sketches are built on first use by the distributions analysis unless
+        passed in (e.g. from the registry).
+        """
         session = self.get_or_create_session(session_id)
         session["df"] = df
+        session["profile"] = profile if profile is not None else build_dataset_profile(df, sketches)
         session["analysis_cache"] = {}
-        session["charts"] = []
-        session["messages"] = []  # Reset conversation for new data
+        if sketches is not None:
+            session["analysis_cache"]["_sketches"] = sketches
+        if anomaly_state is not None:
+            session["analysis_cache"]["_anomaly_state"] = anomaly_state
+        session["conversation"].reset()  # Reset conversation for new data
+
+        # Precompute time rollups so window/trend questions skip the raw rows
+        get_rollups(df, session["analysis_cache"])
+
+    def create_analysis(
+        self,
+        df: pd.DataFrame,
+        on_progress: Optional[Callable[[str], None]] = None,
+        profile: Optional[Dict[str, Any]] = None,
+        sketches: Optional[DatasetSketches] = None,
+        anomaly_state: Optional[AnomalyState] = None
+    ) -> Dict[str, Any]:
+        """
+        Load a dataset into a new session and produce the initial health report.
+
+        Returns a dict with session_id, summary, charts and raw_stats, or
+        'error'. `on_progress` receives the current stage name. Pass the
+        `profile`, `sketches` and `anomaly_state` kept by the dataset
+        registry to skip scanning the frame again.
+        """
+        if profile is None:
+            profile = build_dataset_profile(df, sketches)
+
+        # Validate schema (warning only)
+        valid, message = validate_production_data(df, profile)
+        if not valid:
+            logger.warning(f"Schema validation warning: {message}")
+
+        # Create session and load data
+        session_id = str(uuid.uuid4())
+        self.load_data(session_id, df, profile, sketches, anomaly_state)
+        logger.info(f"Created session: {session_id}")
+
+        # Run initial analysis
+        result = self.run_initial_analysis(session_id, on_progress)
+        if "error" in result:
+            return {"error": result["error"], "session_id": session_id}
 
-    def run_initial_analysis(self, session_id: str) -> Dict[str, Any]:
+        return {
+            "session_id": session_id,
+            "summary": result.get("response", "Analysis complete"),
+            "charts": result.get("charts", []),
+            "raw_stats": get_summary_stats(df, profile)
+        }
+
+    def run_initial_analysis(
+        self,
+        session_id: str,
+        on_progress: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """Run initial analysis when data is first uploaded."""
         session = self.get_or_create_session(session_id)
 
@@ -63,19 +136,12 @@ class ProductionAnalystAgent:
             return {"error": "No data loaded for this session"}
 
         # Add data context to the prompt
-        df = session["df"]
-        data_context = f"""
-The uploaded dataset contains:
-- {len(df)} records
-- Columns: {', '.join(df.columns.tolist())}
-- Numeric columns: {', '.join(df.select_dtypes(include=['number']).columns.tolist())}
-"""
-
-        session["messages"] = [
-            {"role": "user", "content": data_context + "\n\n" + INITIAL_ANALYSIS_PROMPT}
-        ]
+        data_context = build_data_context(session["profile"])
 
-        return self._run_agent_loop(session_id)
+        session["conversation"].reset()
+        session["conversation"].append_user(data_context + "\n\n" + INITIAL_ANALYSIS_PROMPT)
+
+        return self._run_agent_loop(session_id, on_progress=on_progress)
 
     def chat(self, session_id: str, message: str) -> Dict[str, Any]:
         """Process a follow-up chat message."""
@@ -84,26 +150,53 @@ The uploaded dataset contains:
         if session["df"] is None:
             return {"error": "No data loaded. Please upload a CSV file first."}
 
-        session["messages"].append({"role": "user", "content": message})
+        session["conversation"].append_user(message)
 
         return self._run_agent_loop(session_id)
 
-    def _run_agent_loop(self, session_id: str, max_iterations: int = 10) -> Dict[str, Any]:
+    def summarize_batch(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Write one consolidated report for several pre-analyzed datasets.
+
+        The analyses are already done, so this is a single LLM call without
+        tools or a session.
+        """
+        try:
+            response = self.client.chat(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": BATCH_SUMMARY_PROMPT + "\n\n" + json.dumps(results, default=str)}
+                ],
+                options={"temperature": 0.7}
+            )
+        except Exception as e:
+            logger.error(f"Ollama API error: {e}")
+            return {"error": f"LLM API error: {str(e)}"}
+
+        return {"response": response.get("message", {}).get("content", "")}
+
+    def _run_agent_loop(
+        self,
+        session_id: str,
+        max_iterations: int = 10,
+        on_progress: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """Run the agent loop until completion or max iterations."""
         session = self.sessions[session_id]
-        charts_generated = []
+        conversation = session["conversation"]
+        chart_keys = []
         iterations = 0
 
         while iterations < max_iterations:
             iterations += 1
 
+            if on_progress:
+                on_progress("llm")
             try:
                 response = self.client.chat(
                     model=self.model,
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        *session["messages"]
-                    ],
+                    messages=conversation.ollama_messages(),
                     tools=TOOLS,
                     options={"temperature": 0.7}
                 )
@@ -116,11 +209,7 @@ The uploaded dataset contains:
             tool_calls = message.get("tool_calls", [])
 
             # Add assistant response to history
-            session["messages"].append({
-                "role": "assistant",
-                "content": content,
-                "tool_calls": tool_calls if tool_calls else None
-            })
+            conversation.append_assistant(content, tool_calls)
 
             # If no tool calls, we're done
             if not tool_calls:
@@ -140,6 +229,8 @@ The uploaded dataset contains:
                         tool_args = {}
 
                 logger.info(f"Executing tool: {tool_name} with args: {tool_args}")
+                if on_progress:
+                    on_progress("charting" if tool_name == "create_chart" else "analyzing")
 
                 # Execute the tool
                 result = execute_tool(
@@ -149,29 +240,14 @@ The uploaded dataset contains:
                     session["analysis_cache"]
                 )
 
-                # Track charts
-                if result.get("type") == "chart" and result.get("image"):
-                    charts_generated.append(result["image"])
-
-                # Add tool result to messages
-                session["messages"].append({
-                    "role": "tool",
-                    "content": json.dumps(result, default=str)
-                })
-
-        # Store charts in session
-        session["charts"].extend(charts_generated)
-
-        # Get final text response
-        final_response = ""
-        for msg in reversed(session["messages"]):
-            if msg["role"] == "assistant" and msg.get("content"):
-                final_response = msg["content"]
-                break
+                # Add tool result to history; chart images are stored once by key
+                chart_key = conversation.append_tool_result(result)
+                if chart_key:
+                    chart_keys.append(chart_key)
 
         return {
-            "response": final_response,
-            "charts": charts_generated,
+            "response": conversation.last_assistant_content(),
+            "charts": [conversation.chart(key) for key in chart_keys],
             "session_id": session_id
         }
 
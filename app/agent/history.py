@@ -0,0 +1,102 @@
+"""Compact conversation history with deduplicated chart payloads."""
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional
+
+CHART_REF_PREFIX = "chart:"
+
+
+class PayloadStore:
+    """Content-addressed store so each large payload (e.g. a chart image) is kept once."""
+
+    def __init__(self):
+        self._payloads: Dict[str, str] = {}
+
+    def intern(self, payload: str) -> str:
+        """Store a payload and return its content-hash key."""
+        key = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        self._payloads.setdefault(key, payload)
+        return key
+
+    def get(self, key: str) -> str:
+        return self._payloads[key]
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(p) for p in self._payloads.values())
+
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    """One conversation entry. Tool results hold a chart key, never the image."""
+    role: str
+    content: str
+    tool_calls: Optional[List[Dict[str, Any]]] = None
+    chart_key: Optional[str] = None
+
+    def to_ollama(self) -> Dict[str, Any]:
+        message = {"role": self.role, "content": self.content}
+        if self.role == "assistant":
+            message["tool_calls"] = self.tool_calls
+        return message
+
+
+class Conversation:
+    """
+    Append-only message history for one session.
+
+    Tool results are serialized once when appended, with chart images
+    replaced by a `chart:<key>` reference into the payload store. The
+    Ollama-facing message list is built incrementally and reused between
+    turns instead of being rebuilt from scratch.
+    """
+
+    def __init__(self, system_prompt: str):
+        self.system_prompt = system_prompt
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new conversation (charts from earlier turns are dropped too)."""
+        self.messages: List[Message] = []
+        self.chart_keys: List[str] = []
+        self.payloads = PayloadStore()
+        self._ollama_messages: List[Dict[str, Any]] = [{"role": "system", "content": self.system_prompt}]
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append_user(self, content: str) -> None:
+        self.messages.append(Message("user", content))
+
+    def append_assistant(self, content: str, tool_calls: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.messages.append(Message("assistant", content, tool_calls or None))
+
+    def append_tool_result(self, result: Dict[str, Any]) -> Optional[str]:
+        """Append a tool result, interning any chart image. Returns the chart key."""
+        chart_key = None
+        if result.get("type") == "chart" and result.get("image"):
+            chart_key = self.payloads.intern(result["image"])
+            self.chart_keys.append(chart_key)
+            result = {**result, "image": f"{CHART_REF_PREFIX}{chart_key}"}
+        self.messages.append(Message("tool", json.dumps(result, default=str), chart_key=chart_key))
+        return chart_key
+
+    def ollama_messages(self) -> List[Dict[str, Any]]:
+        """System prompt plus all messages, extending the cached list with new entries only."""
+        for message in self.messages[len(self._ollama_messages) - 1:]:
+            self._ollama_messages.append(message.to_ollama())
+        return self._ollama_messages
+
+    def chart(self, key: str) -> str:
+        """Resolve a chart key to its image data URI."""
+        return self.payloads.get(key)
+
+    def last_assistant_content(self) -> str:
+        for message in reversed(self.messages):
+            if message.role == "assistant" and message.content:
+                return message.content
+        return ""
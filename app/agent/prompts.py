@@ -22,8 +22,20 @@ WHEN ANSWERING FOLLOW-UP QUESTIONS:
 - Offer to generate relevant visualizations when helpful
 
 You have access to these tools:
-- analyze_data: Run statistical analysis (failure_rates, risk_factors, machine_comparison, failure_types)
-- create_chart: Generate visualizations (failure_by_type, risk_factors, failure_distribution, machine_comparison)
+- analyze_data: Run statistical analysis (failure_rates, risk_factors, high_risk_machines, failure_types, failure_modes, distributions, anomalies, time_windows)
+- create_chart: Generate visualizations (failure_by_type, risk_factors, failure_distribution, machine_comparison, failure_trend, failure_mode_heatmap, anomaly_ranking)
+
+For questions about recent behaviour ("last 24h vs last week", "is it getting worse?") use analyze_data with analysis_type="time_windows" (window/baseline_window such as "24h"/"7d") and the failure_trend chart. If the result says synthetic_time is true, the data has no timestamps and times are inferred from the record sequence - say so.
+
+When the data has several failure flags (e.g. TWF, HDF, PWF, OSF, RNF) or a failure type column, use analyze_data with analysis_type="failure_modes" to compare failure modes side by side, and the failure_mode_heatmap chart to show which factors drive each mode.
+
+For percentile questions ("99th-percentile torque for failing machines") use analyze_data with analysis_type="distributions", optionally with columns (e.g. ["torque"]) and quantiles (e.g. [0.99]). Results are per failure class ("all", "failure", "no_failure" and each failure type) and come from sketches - they are approximate within the reported rank_error, so present them as approximate.
+
+To find machines that are drifting or behaving abnormally before they fail, use analyze_data with analysis_type="anomalies" and the anomaly_ranking chart. Each machine has a rolling z-score (latest reading vs its recent readings), EWMA drift of its leading sensor (in fleet standard deviations) and a Mahalanobis distance from the fleet; a risk_score of 1 or more means at least one of these crossed its threshold (listed in flags).
+
+Machine rankings accept top_k (how many machines), threshold (minimum failure rate) and min_samples (ignore machines with too few records) - use them when the user asks for "top N" machines or wants to exclude sparsely sampled machines.
+
+Large datasets are analyzed on a stratified sample by default. Those results are marked "approximate" and carry 95% confidence intervals (ci_low/ci_high); sampled machine rankings are ordered by ci_low and min_samples counts effective samples - mention that they are estimates, and call analyze_data with exact=true if the user needs exact figures.
 
 Always be specific and reference actual values from the data. Never make up numbers."""
 
@@ -38,3 +50,40 @@ Structure your response as:
 4. **Recommendations** (specific actions to reduce failures)
 
 Include at least 2 charts that support your findings."""
+
+
+BATCH_SUMMARY_PROMPT = """Below are analysis results for several production datasets (one per plant or line), already computed - do not ask for more data.
+
+Write ONE consolidated cross-plant report:
+1. **Executive Summary** (2-3 sentences comparing overall health across plants)
+2. **Plant Ranking** (plants ordered by failure rate, with records and failures for each)
+3. **Common Risk Factors** (factors that recur across plants, and any plant-specific outliers)
+4. **Machines Requiring Attention** (the most critical machines, named with their plant)
+5. **Recommendations** (actions that apply fleet-wide vs to specific plants)
+
+Only use numbers present in the results."""
+
+
+def build_data_context(profile: dict) -> str:
+    """Describe an uploaded dataset for the initial analysis prompt from its profile."""
+    lines = [
+        "The uploaded dataset contains:",
+        f"- {profile['row_count']} records",
+        f"- Columns: {', '.join(profile['columns'])}",
+        f"- Numeric columns: {', '.join(profile['numeric_columns'])}",
+    ]
+    if profile["roles"]:
+        roles = ', '.join(f"{role}={col}" for role, col in profile["roles"].items())
+        lines.append(f"- Column roles: {roles}")
+
+    columns = profile["column_profiles"]
+    target = columns.get(profile["roles"].get("target"))
+    if target and target.get("mean") is not None:
+        lines.append(f"- Overall failure rate: {target['mean']:.2%}")
+    machine = profile["roles"].get("machine")
+    if machine:
+        lines.append(f"- Distinct machines: {columns[machine]['cardinality']}")
+    with_nulls = [f"{name} ({c['nulls']})" for name, c in columns.items() if c["nulls"]]
+    if with_nulls:
+        lines.append(f"- Columns with missing values: {', '.join(with_nulls)}")
+    return "\n" + "\n".join(lines) + "\n"
@@ -1,19 +1,45 @@
 """Tool definitions and execution for the Production Analyst agent."""
+from functools import partial
 from typing import Any, Dict
 import pandas as pd
 import json
 
+from config import settings
+from profiling import allocation_span
+from analysis.data_loader import build_sketches
+from analysis.sketches import DatasetSketches
 from analysis.production import (
     analyze_failure_rates,
     identify_risk_factors,
     get_high_risk_machines,
-    analyze_failure_types
+    compute_machine_aggregates,
+    analyze_failure_types,
+    analyze_failure_modes
 )
+from analysis.sampling import (
+    build_sample,
+    approximate_failure_rates,
+    approximate_risk_factors,
+    approximate_high_risk_machines
+)
+from analysis.timeseries import build_rollups, window_failure_rates, failure_trend
+from analysis.anomaly import build_anomaly_state, rank_anomalies
 from analysis.visualizations import (
-    create_failure_rate_by_type_chart,
-    create_risk_factors_chart,
-    create_failure_distribution_chart,
-    create_machine_comparison_chart
+    CHART_FORMATS,
+    aggregate_failure_by_type,
+    failure_by_type_from_rates,
+    render_failure_by_type,
+    aggregate_risk_factors,
+    render_risk_factors,
+    aggregate_failure_distribution,
+    render_failure_distribution,
+    aggregate_machine_comparison,
+    render_machine_comparison,
+    create_failure_trend_chart,
+    aggregate_failure_mode_heatmap,
+    render_failure_mode_heatmap,
+    aggregate_anomaly_ranking,
+    render_anomaly_ranking
 )
 
 
@@ -29,8 +55,42 @@ TOOLS = [
                 "properties": {
                     "analysis_type": {
                         "type": "string",
-                        "enum": ["failure_rates", "risk_factors", "high_risk_machines", "failure_types", "all"],
-                        "description": "Type of analysis to run. Use 'all' for comprehensive analysis."
+                        "enum": ["failure_rates", "risk_factors", "high_risk_machines", "failure_types", "failure_modes", "distributions", "anomalies", "time_windows", "all"],
+                        "description": "Type of analysis to run. Use 'all' for comprehensive analysis. Use 'failure_modes' for rates, high-risk machines and risk factors per failure mode (e.g. TWF/HDF/PWF/OSF/RNF). Use 'distributions' for percentiles of sensor columns overall and per failure class, and distinct counts. Use 'anomalies' to rank machines by leading risk from sensor drift and outliers before they fail. Use 'time_windows' to compare the most recent window against a longer baseline."
+                    },
+                    "columns": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Columns for distributions, matched by name fragment, e.g. ['torque']. Default: all numeric columns."
+                    },
+                    "quantiles": {
+                        "type": "array",
+                        "items": {"type": "number"},
+                        "description": "Quantiles (0-1) for distributions, e.g. [0.5, 0.99] (default 0.5, 0.9, 0.95, 0.99)."
+                    },
+                    "window": {
+                        "type": "string",
+                        "description": "Recent window for time_windows, e.g. '24h', '3d' (default '24h')."
+                    },
+                    "baseline_window": {
+                        "type": "string",
+                        "description": "Baseline window for time_windows, e.g. '7d' (default '7d')."
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Number of machines to return for machine rankings, per failure mode for failure_modes (default 10)."
+                    },
+                    "threshold": {
+                        "type": "number",
+                        "description": "Failure-rate threshold (0-1) for high_risk_machines (default 0.05)."
+                    },
+                    "min_samples": {
+                        "type": "integer",
+                        "description": "Minimum records a machine needs before it is ranked (default 1). Raise this to ignore machines with too little data."
+                    },
+                    "exact": {
+                        "type": "boolean",
+                        "description": "Force an exact recompute over every row. Large datasets are otherwise analyzed on a stratified sample and results include 95% confidence intervals."
                     }
                 },
                 "required": ["analysis_type"]
@@ -47,8 +107,30 @@ TOOLS = [
                 "properties": {
                     "chart_type": {
                         "type": "string",
-                        "enum": ["failure_by_type", "risk_factors", "failure_distribution", "machine_comparison"],
+                        "enum": ["failure_by_type", "risk_factors", "failure_distribution", "machine_comparison", "failure_trend", "failure_mode_heatmap", "anomaly_ranking"],
                         "description": "Type of chart to generate"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["png", "svg"],
+                        "description": "Image format. 'svg' is a fast vector output for bar and pie charts (default 'png')."
+                    },
+                    "granularity": {
+                        "type": "string",
+                        "enum": ["hourly", "daily"],
+                        "description": "Time bucket for failure_trend (default 'daily')."
+                    },
+                    "window": {
+                        "type": "string",
+                        "description": "Limit failure_trend to a recent window, e.g. '7d'."
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Number of machines to show in machine_comparison or anomaly_ranking (default 10)."
+                    },
+                    "min_samples": {
+                        "type": "integer",
+                        "description": "Minimum records a machine needs to appear in machine_comparison or anomaly_ranking (default 1)."
                     }
                 },
                 "required": ["chart_type"]
@@ -58,11 +140,70 @@ TOOLS = [
 ]
 
 
+def _get_sample(df: pd.DataFrame, analysis_cache: Dict[str, Any]) -> Dict[str, Any]:
+    """Build (once per dataset) the stratified sample for approximate analyses."""
+    if "_sample" not in analysis_cache:
+        analysis_cache["_sample"] = build_sample(
+            df,
+            settings.approx_sample_size,
+            settings.approx_min_stratum_size
+        )
+    return analysis_cache["_sample"]
+
+
+def _get_machine_aggregates(df: pd.DataFrame, analysis_cache: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Per-machine aggregates, grouped once per dataset and reused by rankings."""
+    if "_machine_aggregates" not in analysis_cache:
+        analysis_cache["_machine_aggregates"] = compute_machine_aggregates(df)
+    return analysis_cache["_machine_aggregates"]
+
+
+def _get_sketches(df: pd.DataFrame, analysis_cache: Dict[str, Any]) -> DatasetSketches:
+    """Quantile/cardinality sketches: from the registry, or built once on first use."""
+    if "_sketches" not in analysis_cache:
+        analysis_cache["_sketches"] = build_sketches(df)
+    return analysis_cache["_sketches"]
+
+
+def _get_anomaly_state(df: pd.DataFrame, analysis_cache: Dict[str, Any]):
+    """Per-machine anomaly state, built once per dataset (None without machine/sensor columns)."""
+    if "_anomaly_state" not in analysis_cache:
+        analysis_cache["_anomaly_state"] = build_anomaly_state(df)
+    return analysis_cache["_anomaly_state"]
+
+
+def get_rollups(df: pd.DataFrame, analysis_cache: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Hourly/daily rollups, built once per dataset and reused by time-window queries."""
+    if "_rollups" not in analysis_cache:
+        analysis_cache["_rollups"] = build_rollups(df, settings.sequence_interval_minutes)
+    return analysis_cache["_rollups"]
+
+
+def _ranking_args(tool_args: Dict[str, Any]) -> Dict[str, Any]:
+    """Top-K / min-sample options shared by ranking analyses and charts."""
+    return {
+        "top_k": int(tool_args.get("top_k") or 10),
+        "min_samples": int(tool_args.get("min_samples") or 1),
+    }
+
+
 def execute_tool(
     tool_name: str,
     tool_args: Dict[str, Any],
     df: pd.DataFrame,
     analysis_cache: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Execute a tool, tracking its allocations when the request is profiled."""
+    span_name = f"tool:{tool_name}:{tool_args.get('analysis_type') or tool_args.get('chart_type')}"
+    with allocation_span(span_name):
+        return _execute_tool(tool_name, tool_args, df, analysis_cache)
+
+
+def _execute_tool(
+    tool_name: str,
+    tool_args: Dict[str, Any],
+    df: pd.DataFrame,
+    analysis_cache: Dict[str, Any]
 ) -> Dict[str, Any]:
     """
     Execute a tool and return the result.
@@ -79,28 +220,79 @@ def execute_tool(
     try:
         if tool_name == "analyze_data":
             analysis_type = tool_args.get("analysis_type", "all")
+            approximate = not tool_args.get("exact", False) and len(df) > settings.approx_row_threshold
+            ranking = _ranking_args(tool_args)
+            # Models send "threshold": null as often as they omit it; 0 is a valid threshold
+            threshold = tool_args.get("threshold")
+            threshold = 0.05 if threshold is None else float(threshold)
+            if not 0 <= threshold <= 1:
+                return {"type": "error", "message": "Threshold must be a failure rate between 0 and 1"}
+
+            if approximate:
+                sample = _get_sample(df, analysis_cache)
+                failure_rates = partial(approximate_failure_rates, sample, **ranking)
+                risk_factors = partial(approximate_risk_factors, sample)
+                high_risk_machines = partial(approximate_high_risk_machines, sample, threshold, **ranking)
+            else:
+                failure_rates = partial(analyze_failure_rates, df, **ranking)
+                risk_factors = partial(identify_risk_factors, df)
+
+                def high_risk_machines():
+                    aggregates = _get_machine_aggregates(df, analysis_cache)
+                    return get_high_risk_machines(df, threshold, aggregates=aggregates, **ranking)
 
             if analysis_type == "all":
                 result = {
-                    "failure_rates": analyze_failure_rates(df),
-                    "risk_factors": identify_risk_factors(df),
-                    "high_risk_machines": get_high_risk_machines(df),
+                    "failure_rates": failure_rates(),
+                    "risk_factors": risk_factors(),
+                    "high_risk_machines": high_risk_machines(),
                     "failure_types": analyze_failure_types(df)
                 }
                 # Cache all results
                 analysis_cache.update(result)
             elif analysis_type == "failure_rates":
-                result = analyze_failure_rates(df)
+                result = failure_rates()
                 analysis_cache["failure_rates"] = result
             elif analysis_type == "risk_factors":
-                result = identify_risk_factors(df)
+                result = risk_factors()
                 analysis_cache["risk_factors"] = result
             elif analysis_type == "high_risk_machines":
-                result = get_high_risk_machines(df)
+                result = high_risk_machines()
                 analysis_cache["high_risk_machines"] = result
             elif analysis_type == "failure_types":
                 result = analyze_failure_types(df)
                 analysis_cache["failure_types"] = result
+            elif analysis_type == "failure_modes":
+                # One vectorized pass over all failure modes; exact even on large datasets
+                result = analyze_failure_modes(df, **ranking)
+                analysis_cache["failure_modes"] = result
+            elif analysis_type == "distributions":
+                # Answered from the sketches in constant memory, without sorting the rows
+                quantiles = [float(q) for q in tool_args.get("quantiles") or []]
+                if any(not 0 <= q <= 1 for q in quantiles):
+                    return {"type": "error", "message": "Quantiles must be between 0 and 1"}
+                columns = tool_args.get("columns")
+                if isinstance(columns, str):
+                    columns = [columns]
+                result = _get_sketches(df, analysis_cache).summary(columns, quantiles or None)
+                analysis_cache["distributions"] = result
+            elif analysis_type == "anomalies":
+                state = _get_anomaly_state(df, analysis_cache)
+                if state is None:
+                    return {"type": "error", "message": "Anomaly scoring needs a machine/product column and numeric sensor columns"}
+                result = rank_anomalies(state, **ranking)
+                analysis_cache["anomalies"] = result
+            elif analysis_type == "time_windows":
+                rollups = get_rollups(df, analysis_cache)
+                if rollups is None:
+                    return {"type": "error", "message": "Time-window analysis needs a numeric target/failure column"}
+                result = window_failure_rates(
+                    rollups,
+                    tool_args.get("window") or "24h",
+                    tool_args.get("baseline_window") or "7d",
+                    **ranking
+                )
+                analysis_cache["time_windows"] = result
             else:
                 return {"type": "error", "message": f"Unknown analysis type: {analysis_type}"}
 
@@ -108,18 +300,53 @@ def execute_tool(
 
         elif tool_name == "create_chart":
             chart_type = tool_args.get("chart_type")
+            fmt = tool_args.get("format") or settings.chart_format
+            if fmt not in CHART_FORMATS:
+                return {"type": "error", "message": f"Unknown chart format: {fmt}"}
+            chart_data = analysis_cache.setdefault("_chart_data", {})
             chart = None
 
             if chart_type == "failure_by_type":
-                chart = create_failure_rate_by_type_chart(df)
+                if "failure_by_type" not in chart_data:
+                    # Reuse the failure-rate analysis when it already ran
+                    by_type = (analysis_cache.get("failure_rates") or {}).get("by_product_type")
+                    chart_data["failure_by_type"] = (
+                        failure_by_type_from_rates(by_type) if by_type else aggregate_failure_by_type(df)
+                    )
+                chart = render_failure_by_type(chart_data["failure_by_type"], fmt)
             elif chart_type == "risk_factors":
                 # Use cached risk factors if available
                 risk_factors = analysis_cache.get("risk_factors") or identify_risk_factors(df)
-                chart = create_risk_factors_chart(risk_factors)
+                chart = render_risk_factors(aggregate_risk_factors(risk_factors), fmt)
             elif chart_type == "failure_distribution":
-                chart = create_failure_distribution_chart(df)
+                if "failure_distribution" not in chart_data:
+                    chart_data["failure_distribution"] = aggregate_failure_distribution(df)
+                chart = render_failure_distribution(chart_data["failure_distribution"], fmt)
             elif chart_type == "machine_comparison":
-                chart = create_machine_comparison_chart(df)
+                aggregates = _get_machine_aggregates(df, analysis_cache)
+                if aggregates is not None:
+                    ranking = _ranking_args(tool_args)
+                    data = aggregate_machine_comparison(
+                        None, ranking["top_k"], ranking["min_samples"], aggregates=aggregates
+                    )
+                    chart = render_machine_comparison(data, fmt)
+            elif chart_type == "failure_trend":
+                # Trend lines are always rendered with matplotlib
+                rollups = get_rollups(df, analysis_cache)
+                if rollups is not None:
+                    granularity = tool_args.get("granularity") or "daily"
+                    trend = failure_trend(rollups, granularity, tool_args.get("window"))
+                    chart = create_failure_trend_chart(trend, granularity)
+            elif chart_type == "failure_mode_heatmap":
+                if "failure_mode_heatmap" not in chart_data:
+                    failure_modes = analysis_cache.get("failure_modes") or analyze_failure_modes(df)
+                    chart_data["failure_mode_heatmap"] = aggregate_failure_mode_heatmap(failure_modes)
+                chart = render_failure_mode_heatmap(chart_data["failure_mode_heatmap"], fmt)
+            elif chart_type == "anomaly_ranking":
+                state = _get_anomaly_state(df, analysis_cache)
+                if state is not None:
+                    data = aggregate_anomaly_ranking(rank_anomalies(state, **_ranking_args(tool_args)))
+                    chart = render_anomaly_ranking(data, fmt)
             else:
                 return {"type": "error", "message": f"Unknown chart type: {chart_type}"}
 
@@ -0,0 +1,261 @@
+"""Anomaly and drift scoring of per-machine sensor streams."""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any
+
+from config import settings
+from analysis.data_loader import normalize_columns
+from analysis.production import _find_column, FAILURE_MODE_COLUMNS
+from analysis.ranking import top_k_indices, _to_python
+from analysis.timeseries import is_sequence_column, _event_times
+
+# A machine is flagged when its latest reading is this many standard
+# deviations from its trailing window, or its EWMA has drifted this many
+# fleet standard deviations from its long-run mean
+Z_THRESHOLD = 3.0
+DRIFT_THRESHOLD = 1.0
+# One-sided 99% normal quantile, for the Mahalanobis flag
+MAHALANOBIS_Z = 2.326
+
+
+def mahalanobis_threshold(dims: int) -> float:
+    """Square root of the chi-square 99th percentile (Wilson-Hilferty approximation)."""
+    h = 2 / (9 * dims)
+    return float(np.sqrt(dims * (1 - h + MAHALANOBIS_Z * np.sqrt(h)) ** 3))
+
+
+def sensor_columns(df: pd.DataFrame) -> List[str]:
+    """Numeric sensor columns: everything except targets, failure flags and sequence IDs."""
+    target_col = _find_column(df, ['target', 'failure'])
+    return [
+        c for c in df.select_dtypes(include=['number']).columns
+        if c != target_col and c.upper() not in FAILURE_MODE_COLUMNS
+        and not is_sequence_column(c)
+    ]
+
+
+def _group_sum(codes: np.ndarray, values: np.ndarray, groups: int) -> np.ndarray:
+    """Per-group column sums of a 2-D array, one bincount per column."""
+    return np.column_stack([
+        np.bincount(codes, weights=values[:, j], minlength=groups) for j in range(values.shape[1])
+    ]) if values.shape[1] else np.zeros((groups, 0))
+
+
+class AnomalyState:
+    """
+    Incremental per-machine sensor statistics for anomaly scoring.
+
+    Holds running sums (fleet covariance, per-machine mean/variance), EWMA
+    numerators/denominators and the last `window` + 1 readings of each
+    machine. `update` folds in new rows in time order with grouped NumPy
+    reductions, so scoring new data never revisits old rows.
+    """
+
+    def __init__(
+        self,
+        sensors: List[str],
+        machine_col: str,
+        target_col: str | None = None,
+        window: int | None = None,
+        span: int | None = None
+    ):
+        self.sensors = sensors
+        self.machine_col = machine_col
+        self.target_col = target_col
+        self.window = window or settings.anomaly_window
+        self.span = span or settings.anomaly_ewma_span
+        self.decay = 1 - 2 / (self.span + 1)
+
+        p = len(sensors)
+        self.rows = 0
+        self.fleet_sum = np.zeros(p)
+        self.fleet_outer = np.zeros((p, p))
+        self.machine_ids = pd.Index([])
+        self.count = np.zeros(0, dtype=np.int64)
+        self.failures = np.zeros(0)
+        self.sum = np.zeros((0, p))
+        self.sumsq = np.zeros((0, p))
+        self.ewma_num = np.zeros((0, p))
+        self.ewma_den = np.zeros(0)
+        self.tail = pd.DataFrame(columns=["_code", *sensors])
+
+    def _add_machines(self, ids: pd.Series) -> None:
+        new = pd.Index(ids.unique()).difference(self.machine_ids)
+        if not len(new):
+            return
+        self.machine_ids = self.machine_ids.append(new)
+        extra, p = len(new), len(self.sensors)
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.failures = np.concatenate([self.failures, np.zeros(extra)])
+        self.ewma_den = np.concatenate([self.ewma_den, np.zeros(extra)])
+        for name in ("sum", "sumsq", "ewma_num"):
+            setattr(self, name, np.vstack([getattr(self, name), np.zeros((extra, p))]))
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Fold in new rows (normalized columns, oldest first)."""
+        df = df[df[self.machine_col].notna()]
+        if df.empty:
+            return
+
+        self._add_machines(df[self.machine_col])
+        groups = len(self.machine_ids)
+        codes = self.machine_ids.get_indexer(df[self.machine_col])
+
+        values = df[self.sensors].to_numpy(dtype=float)
+        # Gaps take the running fleet mean (or this batch's mean on the first batch)
+        fill = self.fleet_sum / self.rows if self.rows else np.nan_to_num(np.nanmean(values, axis=0))
+        values = np.where(np.isnan(values), fill, values)
+
+        counts = np.bincount(codes, minlength=groups)
+        self.rows += len(values)
+        self.fleet_sum += values.sum(axis=0)
+        self.fleet_outer += values.T @ values
+        self.count += counts
+        self.sum += _group_sum(codes, values, groups)
+        self.sumsq += _group_sum(codes, values ** 2, groups)
+        if self.target_col:
+            self.failures += np.bincount(
+                codes, weights=df[self.target_col].fillna(0).to_numpy(dtype=float), minlength=groups
+            )
+
+        # EWMA in closed form: each reading is weighted by decay ** (readings after it)
+        position = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+        weights = self.decay ** (counts[codes] - 1 - position)
+        carry = self.decay ** counts
+        self.ewma_num = self.ewma_num * carry[:, None] + _group_sum(codes, values * weights[:, None], groups)
+        self.ewma_den = self.ewma_den * carry + np.bincount(codes, weights=weights, minlength=groups)
+
+        batch = pd.DataFrame(values, columns=self.sensors)
+        batch.insert(0, "_code", codes)
+        tail = batch if self.tail.empty else pd.concat([self.tail, batch], ignore_index=True)
+        self.tail = tail.groupby("_code", sort=False).tail(self.window + 1).reset_index(drop=True)
+
+    def scores(self) -> Dict[str, np.ndarray]:
+        """
+        Per-machine scores from the current state.
+
+        Returns arrays aligned with `machine_ids`: rolling_z (max |z| of the
+        latest reading against the trailing window), drift (per-sensor EWMA
+        minus long-run mean, in fleet standard deviations) and mahalanobis
+        (mean distance of the trailing readings from the fleet).
+        """
+        groups, p = len(self.machine_ids), len(self.sensors)
+        fleet_mean = self.fleet_sum / self.rows
+        fleet_cov = self.fleet_outer / self.rows - np.outer(fleet_mean, fleet_mean)
+        fleet_std = np.sqrt(np.clip(np.diag(fleet_cov), 0, None))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            long_run = self.sum / self.count[:, None]
+            ewma = self.ewma_num / self.ewma_den[:, None]
+            drift = np.nan_to_num((ewma - long_run) / fleet_std, nan=0.0, posinf=0.0, neginf=0.0)
+
+            codes = self.tail["_code"].to_numpy(dtype=np.int64)
+            readings = self.tail[self.sensors].to_numpy(dtype=float)
+            latest = self.tail.groupby("_code", sort=False).cumcount(ascending=False).to_numpy() == 0
+            prior_n = np.bincount(codes[~latest], minlength=groups)
+            prior_sum = _group_sum(codes[~latest], readings[~latest], groups)
+            prior_sumsq = _group_sum(codes[~latest], readings[~latest] ** 2, groups)
+            prior_mean = prior_sum / prior_n[:, None]
+            prior_var = (prior_sumsq - prior_n[:, None] * prior_mean ** 2) / (prior_n[:, None] - 1)
+            last = np.full((groups, p), np.nan)
+            last[codes[latest]] = readings[latest]
+            z = (last - prior_mean) / np.sqrt(np.clip(prior_var, 0, None))
+            z = np.nan_to_num(z, nan=0.0, posinf=0.0, neginf=0.0)
+            z[prior_n < 2] = 0.0
+
+            centered = readings - fleet_mean
+            distance = np.sqrt(np.clip(np.einsum('ij,jk,ik->i', centered, np.linalg.pinv(fleet_cov), centered), 0, None))
+            mahalanobis = np.bincount(codes, weights=distance, minlength=groups) / np.bincount(codes, minlength=groups)
+
+        return {
+            "rolling_z": np.abs(z).max(axis=1) if p else np.zeros(groups),
+            "z": z,
+            "drift": drift,
+            "mahalanobis": np.nan_to_num(mahalanobis),
+        }
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize columns and order rows by event time for streaming."""
+    df = normalize_columns(df)
+    times, _, _ = _event_times(df, settings.sequence_interval_minutes)
+    return df.iloc[np.argsort(times.to_numpy(), kind='stable')]
+
+
+def build_anomaly_state(
+    df: pd.DataFrame,
+    window: int | None = None,
+    span: int | None = None
+) -> AnomalyState | None:
+    """Anomaly state for a dataset, or None without machine and sensor columns."""
+    df = _prepare(df)
+    machine_col = _find_column(df, ['product', 'machine'])
+    sensors = sensor_columns(df)
+    if not machine_col or not sensors:
+        return None
+
+    target_col = _find_column(df, ['target', 'failure'])
+    if target_col and not pd.api.types.is_numeric_dtype(df[target_col]):
+        target_col = None
+
+    state = AnomalyState(sensors, machine_col, target_col, window, span)
+    state.update(df)
+    return state
+
+
+def update_anomaly_state(state: AnomalyState, df: pd.DataFrame) -> AnomalyState:
+    """Fold newly arrived rows into an existing state and return it."""
+    state.update(_prepare(df))
+    return state
+
+
+def rank_anomalies(state: AnomalyState, top_k: int = 10, min_samples: int = 1) -> Dict[str, Any]:
+    """
+    Rank machines by leading (pre-failure) risk.
+
+    The risk score is the largest ratio of a machine's rolling z-score,
+    absolute EWMA drift or Mahalanobis distance to its flag threshold, so
+    any score of 1 or more means the machine is flagged on some measure.
+    """
+    scores = state.scores()
+    abs_drift = np.abs(scores["drift"])
+    eligible = state.count >= max(min_samples, 1)
+
+    measures = {"rolling_z": scores["rolling_z"], "drift": abs_drift.max(axis=1), "mahalanobis": scores["mahalanobis"]}
+    thresholds = {
+        "rolling_z": Z_THRESHOLD,
+        "drift": DRIFT_THRESHOLD,
+        "mahalanobis": round(mahalanobis_threshold(len(state.sensors)), 3),
+    }
+    ratios = np.column_stack([measures[name] / limit for name, limit in thresholds.items()])
+    risk = ratios.max(axis=1)
+    flags = {name: (measures[name] > limit) & eligible for name, limit in thresholds.items()}
+
+    records = []
+    for i in top_k_indices(risk, top_k, eligible, tiebreak=ratios.sum(axis=1)):
+        leading = int(abs_drift[i].argmax())
+        record = {
+            "machine_id": _to_python(state.machine_ids[i]),
+            "risk_score": round(float(risk[i]), 4),
+            "rolling_z": round(float(scores["rolling_z"][i]), 3),
+            "z_sensor": state.sensors[int(np.abs(scores["z"][i]).argmax())],
+            "drift": round(float(scores["drift"][i, leading]), 3),
+            "leading_sensor": state.sensors[leading],
+            "mahalanobis": round(float(scores["mahalanobis"][i]), 3),
+            "sample_count": int(state.count[i]),
+            "flags": [name for name in thresholds if flags[name][i]],
+        }
+        if state.target_col:
+            record["failure_rate"] = float(state.failures[i] / state.count[i])
+        records.append(record)
+
+    return {
+        "rows_scored": state.rows,
+        "machines_scored": int(eligible.sum()),
+        "sensors": state.sensors,
+        "window": state.window,
+        "ewma_span": state.span,
+        "thresholds": thresholds,
+        "flagged_machines": {name: int(mask.sum()) for name, mask in flags.items()},
+        "top_machines": records,
+    }
@@ -0,0 +1,115 @@
+"""Parallel analysis of many datasets for the batch endpoint."""
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any
+
+import numpy as np
+
+from config import settings
+from analysis.data_loader import (
+    load_data_from_bytes,
+    load_data_from_path,
+    validate_production_data,
+    get_summary_stats,
+    build_dataset_profile
+)
+from analysis.production import (
+    analyze_failure_rates,
+    identify_risk_factors,
+    get_high_risk_machines,
+    analyze_failure_types
+)
+
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Lazily create the shared process pool for batch analyses.
+
+    Workers are spawned rather than forked: the server already runs threads
+    (job workers, the profiler's sampler) whose held locks a forked child
+    would inherit and could deadlock on.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.batch_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def reset_process_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Discard a broken process pool so the next batch builds a fresh one.
+
+    A worker that dies (e.g. OOM-killed) breaks the whole pool; without a
+    reset every later batch would fail with BrokenProcessPool. Only the
+    given pool is dropped, so a pool another request already rebuilt survives.
+    """
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _json_default(value: Any) -> Any:
+    """JSON fallback for numpy scalars and other non-native values."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def to_ndjson_line(record: Dict[str, Any]) -> str:
+    """Serialize one record as a newline-terminated JSON line."""
+    return json.dumps(record, default=_json_default) + "\n"
+
+
+def analyze_dataset(name: str, content: bytes | None = None, path: str | None = None) -> Dict[str, Any]:
+    """
+    Parse and analyze one dataset without the LLM.
+
+    Runs in a worker process, so it takes raw bytes or a file path rather
+    than a DataFrame and returns only plain JSON-serializable data.
+    """
+    if content is not None:
+        df = load_data_from_bytes(content, name)
+    else:
+        df = load_data_from_path(path)
+
+    profile = build_dataset_profile(df)
+    valid, message = validate_production_data(df, profile)
+    result = {
+        "name": name,
+        "schema_valid": valid,
+        "raw_stats": get_summary_stats(df, profile),
+        "failure_rates": analyze_failure_rates(df),
+        "risk_factors": identify_risk_factors(df),
+        "high_risk_machines": get_high_risk_machines(df),
+        "failure_types": analyze_failure_types(df),
+    }
+    if not valid:
+        result["schema_warning"] = message
+    # Round-trip through JSON so numpy values never cross the process boundary
+    return json.loads(json.dumps(result, default=_json_default))
+
+
+def summarize_for_llm(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact per-dataset digest used in the consolidated LLM prompt."""
+    rates = result.get("failure_rates", {})
+    return {
+        "name": result["name"],
+        "records": rates.get("total_records"),
+        "overall_failure_rate": rates.get("overall_failure_rate"),
+        "total_failures": rates.get("total_failures"),
+        "total_machines": rates.get("total_machines"),
+        "by_product_type": rates.get("by_product_type"),
+        "top_risk_factors": [
+            {k: f[k] for k in ("factor", "correlation")}
+            for f in result.get("risk_factors", [])[:3] if "factor" in f
+        ],
+        "high_risk_machines": result.get("high_risk_machines", [])[:5],
+        "failure_types": result.get("failure_types"),
+    }
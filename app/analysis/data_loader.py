@@ -1,7 +1,154 @@
 """Data loading and validation utilities."""
 import pandas as pd
-from io import StringIO
-from typing import Tuple, Dict, Any
+from io import StringIO, BytesIO
+from pathlib import Path
+from typing import Tuple, Dict, Any, List, Optional
+
+from profiling import allocation_span
+from analysis.sketches import DatasetSketches
+
+# Upload formats accepted by the loaders, keyed by file suffix
+FILE_FORMATS = {
+    '.csv': ('csv', None),
+    '.csv.gz': ('csv', 'gzip'),
+    '.csv.gzip': ('csv', 'gzip'),
+    '.csv.zst': ('csv', 'zstd'),
+    '.csv.zstd': ('csv', 'zstd'),
+    '.parquet': ('parquet', None),
+    '.pq': ('parquet', None),
+    '.arrow': ('arrow', None),
+    '.feather': ('arrow', None),
+    '.ipc': ('arrow', None),
+}
+
+# Non-numeric columns the analyses look up by name; numeric columns are always kept
+ANALYSIS_COLUMN_PATTERNS = [
+    'target', 'failure', 'product', 'machine', 'type', 'category', 'defect', 'time', 'date'
+]
+
+# Rows read to infer CSV column types before projecting
+CSV_SNIFF_ROWS = 1000
+
+# Column roles recorded in the dataset profile; first matching column wins,
+# mirroring the lookups the analyses do
+COLUMN_ROLE_PATTERNS = {
+    "target": ['target', 'failure'],
+    "machine": ['product', 'machine'],
+    "type": ['type', 'category'],
+    "failure_type": ['failure_type', 'failure_mode', 'defect'],
+    "time": ['timestamp', 'datetime', 'date', 'time'],
+}
+# Failure type labels that mean "no failure"
+NO_FAILURE_LABELS = {'no failure', 'none', 'ok', 'normal'}
+PROFILE_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+PROFILE_SAMPLE_VALUES = 5
+# Rows fed to the sketches at a time during ingestion
+SKETCH_CHUNK_ROWS = 100_000
+
+
+def detect_file_format(filename: str) -> Tuple[str, str | None] | None:
+    """Return (format, compression) for a filename, or None if unsupported."""
+    name = filename.lower()
+    # Longest suffix first so '.csv.gz' wins over '.gz'
+    for suffix in sorted(FILE_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return FILE_FORMATS[suffix]
+    return None
+
+
+def select_analysis_columns(columns: List[str], numeric_columns: List[str]) -> List[str]:
+    """Pick the columns the analyses need: numeric ones plus name-matched roles."""
+    numeric = set(numeric_columns)
+    return [
+        c for c in columns
+        if c in numeric or any(p in c.lower() for p in ANALYSIS_COLUMN_PATTERNS)
+    ]
+
+
+def _require_pyarrow():
+    """Import pyarrow, raising a readable error if it is not installed."""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ValueError("Parquet/Arrow support requires the 'pyarrow' package") from e
+    return pyarrow
+
+
+def _numeric_arrow_fields(schema) -> List[str]:
+    """Names of integer, float and boolean fields in an Arrow schema."""
+    import pyarrow.types as pat
+    return [
+        f.name for f in schema
+        if pat.is_integer(f.type) or pat.is_floating(f.type) or pat.is_boolean(f.type)
+    ]
+
+
+def _read_csv(source, compression: str | None, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Read a (possibly compressed) CSV, projecting to analysis columns."""
+    if columns is None:
+        sample = pd.read_csv(source, compression=compression, nrows=CSV_SNIFF_ROWS)
+        columns = select_analysis_columns(
+            list(sample.columns),
+            list(sample.select_dtypes(include=['number', 'bool']).columns)
+        )
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    return pd.read_csv(source, compression=compression, usecols=columns)
+
+
+def _read_parquet(source, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Read a Parquet file, projecting to analysis columns."""
+    _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source)
+    if columns is None:
+        schema = parquet_file.schema_arrow
+        columns = select_analysis_columns(schema.names, _numeric_arrow_fields(schema))
+    return parquet_file.read(columns=columns).to_pandas()
+
+
+def _read_arrow(source, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Read an Arrow IPC / Feather file, projecting to analysis columns."""
+    pa = _require_pyarrow()
+    import pyarrow.feather as feather
+
+    if columns is None:
+        with pa.ipc.open_file(source) as reader:
+            schema = reader.schema
+        columns = select_analysis_columns(schema.names, _numeric_arrow_fields(schema))
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    return feather.read_table(source, columns=columns).to_pandas()
+
+
+def _read_data(source, filename: str, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Dispatch to the reader for a file's format."""
+    detected = detect_file_format(filename)
+    if detected is None:
+        accepted = ', '.join(FILE_FORMATS)
+        raise ValueError(f"Unsupported file type: {filename}. Accepted: {accepted}")
+
+    file_format, compression = detected
+    if file_format == 'parquet':
+        return _read_parquet(source, columns)
+    if file_format == 'arrow':
+        return _read_arrow(source, columns)
+    return _read_csv(source, compression, columns)
+
+
+def load_data_from_bytes(content: bytes, filename: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load an uploaded CSV, compressed CSV, Parquet or Arrow file.
+
+    Only the columns the analyses use are parsed unless `columns` is given.
+    """
+    return _read_data(BytesIO(content), filename, columns)
+
+
+def load_data_from_path(file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Load a CSV, compressed CSV, Parquet or Arrow file from disk."""
+    return _read_data(str(Path(file_path)), file_path, columns)
 
 
 def load_csv_from_bytes(content: bytes) -> pd.DataFrame:
@@ -14,56 +161,204 @@ def load_csv_from_path(file_path: str) -> pd.DataFrame:
     return pd.read_csv(file_path)
 
 
-def validate_production_data(df: pd.DataFrame) -> Tuple[bool, str]:
+def validate_production_data(df: pd.DataFrame, profile: Dict[str, Any] | None = None) -> Tuple[bool, str]:
     """
     Validate DataFrame has expected production data columns.
     Flexible - works with various column naming conventions.
+
+    Pass the dataset `profile` to check its column list instead of the frame.
     """
+    columns = profile["raw_columns"] if profile is not None else list(df.columns)
     required_patterns = ['target', 'failure', 'product', 'type']
-    df_cols_lower = [c.lower() for c in df.columns]
+    df_cols_lower = [c.lower() for c in columns]
 
     found = sum(1 for p in required_patterns if any(p in c for c in df_cols_lower))
 
     if found >= 2:
         return True, "Schema valid"
-    return False, f"Expected production data columns. Found: {list(df.columns)}"
+    return False, f"Expected production data columns. Found: {columns}"
+
+
+def _normalized_names(columns: pd.Index) -> pd.Index:
+    """
+    Column names with spaces and brackets replaced by single underscores.
+
+    Names that collide once normalized (e.g. 'Torque [Nm]' and 'Torque (Nm)')
+    get a numeric suffix on each repeat ('Torque_Nm_2'), so no column is lost.
+    """
+    columns = columns.astype(str).str.replace(r'[\[\]\(\) ]', '_', regex=True)
+    columns = columns.str.replace(r'_+', '_', regex=True).str.strip('_')
+    if columns.is_unique:
+        return columns
+
+    taken, seen, names = set(columns), set(), []
+    for name in columns:
+        if name in seen:
+            suffix = 2
+            while f"{name}_{suffix}" in taken:
+                suffix += 1
+            name = f"{name}_{suffix}"
+            taken.add(name)
+        seen.add(name)
+        names.append(name)
+    return pd.Index(names)
 
 
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Normalize column names for consistent processing."""
-    df = df.copy()
-    # Replace spaces and special chars with underscores
-    df.columns = df.columns.str.replace(r'[\[\]\(\) ]', '_', regex=True)
-    df.columns = df.columns.str.replace(r'_+', '_', regex=True)
-    df.columns = df.columns.str.strip('_')
+    with allocation_span("normalize_columns"):
+        df = df.copy()
+        # Replace spaces and special chars with underscores
+        df.columns = _normalized_names(df.columns)
     return df
 
 
-def get_summary_stats(df: pd.DataFrame) -> Dict[str, Any]:
-    """Get basic summary statistics."""
-    df = normalize_columns(df)
+def _to_native(value: Any) -> Any:
+    """Plain Python value for a profile entry (numpy scalars, timestamps, NaN)."""
+    if pd.isna(value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, (int, float, str, bool)):
+        return value
+    return str(value)
+
+
+def column_roles(columns: List[str]) -> Dict[str, str]:
+    """Map each role in COLUMN_ROLE_PATTERNS to its first matching column."""
+    roles = {}
+    for role, patterns in COLUMN_ROLE_PATTERNS.items():
+        for name in columns:
+            if any(p in name.lower() for p in patterns):
+                roles[role] = name
+                break
+    return roles
+
+
+def _failure_classes(chunk: pd.DataFrame, roles: Dict[str, str]) -> Dict[str, Any]:
+    """Boolean row masks per failure class: target 1/0 and each failure type label."""
+    classes = {}
+    target = roles.get("target")
+    if target and pd.api.types.is_numeric_dtype(chunk[target]):
+        classes["failure"] = (chunk[target] == 1).to_numpy()
+        classes["no_failure"] = (chunk[target] == 0).to_numpy()
+
+    failure_type = roles.get("failure_type")
+    if failure_type and failure_type != target:
+        labels = chunk[failure_type].astype(str)
+        for label in labels.unique():
+            if label.lower() not in NO_FAILURE_LABELS and label.lower() != 'nan':
+                classes[label] = (labels == label).to_numpy()
+    return classes
+
+
+def build_sketches(df: pd.DataFrame, chunk_rows: int = SKETCH_CHUNK_ROWS) -> DatasetSketches:
+    """
+    Stream a dataset through quantile and cardinality sketches in chunks.
+
+    Numeric columns (except the target) get quantile sketches overall and
+    per failure class; every column gets a distinct-count sketch. Keys use
+    normalized column names.
+    """
+    names = list(_normalized_names(df.columns))
+    roles = column_roles(names)
+    numeric = [
+        name for name, raw in zip(names, df.columns)
+        if pd.api.types.is_numeric_dtype(df[raw]) and not pd.api.types.is_bool_dtype(df[raw])
+        and name != roles.get("target")
+    ]
+
+    sketches = DatasetSketches()
+    with allocation_span("build_sketches"):
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows].set_axis(names, axis=1)
+            sketches.update(chunk, numeric, _failure_classes(chunk, roles))
+    return sketches
+
+
+def build_dataset_profile(df: pd.DataFrame, sketches: DatasetSketches | None = None) -> Dict[str, Any]:
+    """
+    Profile a dataset once at ingestion so later consumers skip the raw rows.
+
+    Records column roles, dtypes, null counts, cardinalities, numeric
+    min/max/mean/quantiles and a few distinct values per column. Column-wise
+    reductions run once over the whole frame rather than per column. When
+    the dataset's `sketches` are passed in (e.g. by the registry),
+    cardinalities and quantiles come from them; otherwise they are computed
+    exactly, which is cheaper than sketching at ingestion. Keys use
+    normalized column names; the result is JSON-serializable.
+    """
+    names = list(_normalized_names(df.columns))
+    raw_names = dict(zip(names, df.columns))
+    roles = column_roles(names)
+
+    numeric = df.select_dtypes(include=['number'])
+    numeric_names = [n for n in names if raw_names[n] in numeric.columns]
+    booleans = df.select_dtypes(include=['bool']).columns
+    # Booleans get min/max/mean (e.g. a boolean failure flag) but no quantiles
+    summary = pd.concat([numeric, df[booleans].astype('int8')], axis=1).agg(['min', 'max', 'mean'])
+    nulls = df.isna().sum()
+    if sketches is None:
+        cardinality = df.nunique()
+        quantiles = numeric.quantile(PROFILE_QUANTILES) if len(numeric.columns) else None
+
+    column_profiles = {}
+    for name in names:
+        raw = raw_names[name]
+        column = {
+            "dtype": str(df[raw].dtype),
+            "role": next((role for role, col in roles.items() if col == name), None),
+            "nulls": int(nulls[raw]),
+            "cardinality": sketches.distinct(name) if sketches is not None else int(cardinality[raw]),
+            "samples": [_to_native(v) for v in df[raw].dropna().unique()[:PROFILE_SAMPLE_VALUES]],
+        }
+        if raw in summary.columns:
+            column.update({stat: _to_native(summary.at[stat, raw]) for stat in ('min', 'max', 'mean')})
+        if sketches is not None:
+            quantile_sketch = sketches.quantile_sketches.get(name, {}).get("all")
+            if quantile_sketch is not None and quantile_sketch.count:
+                column["quantiles"] = {
+                    f"p{round(q * 100)}": v
+                    for q, v in zip(PROFILE_QUANTILES, quantile_sketch.quantiles(PROFILE_QUANTILES))
+                }
+        elif quantiles is not None and raw in quantiles.columns:
+            column["quantiles"] = {
+                f"p{round(q * 100)}": _to_native(quantiles.at[q, raw]) for q in PROFILE_QUANTILES
+            }
+        column_profiles[name] = column
+
+    return {
+        "row_count": len(df),
+        "columns": names,
+        "raw_columns": [str(c) for c in df.columns],
+        "numeric_columns": numeric_names,
+        "roles": roles,
+        "column_profiles": column_profiles,
+    }
+
+
+def get_summary_stats(df: pd.DataFrame, profile: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    Get basic summary statistics.
+
+    Read from the dataset `profile` when given, otherwise profile `df` first.
+    """
+    if profile is None:
+        profile = build_dataset_profile(df)
 
     stats = {
-        "total_records": len(df),
-        "columns": list(df.columns),
-        "numeric_columns": list(df.select_dtypes(include=['number']).columns),
+        "total_records": profile["row_count"],
+        "columns": profile["columns"],
+        "numeric_columns": profile["numeric_columns"],
     }
 
-    # Try to find failure/target column
-    target_col = None
-    for col in df.columns:
-        if 'target' in col.lower() or 'failure' in col.lower():
-            target_col = col
-            break
-
-    if target_col and df[target_col].dtype in ['int64', 'float64', 'bool']:
-        stats["failure_rate"] = float(df[target_col].mean())
-        stats["total_failures"] = int(df[target_col].sum())
-
-    # Try to find machine/product column
-    for col in df.columns:
-        if 'product' in col.lower() or 'machine' in col.lower():
-            stats["unique_machines"] = int(df[col].nunique())
-            break
+    target = profile["column_profiles"].get(profile["roles"].get("target"))
+    if target and target.get("mean") is not None:
+        stats["failure_rate"] = float(target["mean"])
+        stats["total_failures"] = int(round(target["mean"] * (profile["row_count"] - target["nulls"])))
+
+    machine = profile["roles"].get("machine")
+    if machine:
+        stats["unique_machines"] = profile["column_profiles"][machine]["cardinality"]
 
     return stats
@@ -1,7 +1,13 @@
 """Production data analysis functions."""
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Any
-from analysis.data_loader import normalize_columns
+from typing import Dict, List, Any, Tuple
+from analysis.data_loader import normalize_columns, NO_FAILURE_LABELS
+from analysis.ranking import machine_aggregates, rank_machines
+
+# Per-mode binary failure flags in the AI4I schema: tool wear, heat
+# dissipation, power, overstrain and random failures
+FAILURE_MODE_COLUMNS = ['TWF', 'HDF', 'PWF', 'OSF', 'RNF']
 
 
 def _find_column(df: pd.DataFrame, patterns: List[str]) -> str | None:
@@ -13,7 +19,7 @@ def _find_column(df: pd.DataFrame, patterns: List[str]) -> str | None:
     return None
 
 
-def analyze_failure_rates(df: pd.DataFrame) -> Dict[str, Any]:
+def analyze_failure_rates(df: pd.DataFrame, top_k: int = 10, min_samples: int = 1) -> Dict[str, Any]:
     """Analyze failure rates overall and by machine/type."""
     df = normalize_columns(df)
 
@@ -38,13 +44,19 @@ def analyze_failure_rates(df: pd.DataFrame) -> Dict[str, Any]:
         result["by_product_type"] = df.groupby(type_col)[target_col].mean().to_dict()
 
     if product_col:
-        machine_rates = df.groupby(product_col)[target_col].agg(['mean', 'count', 'sum'])
-        machine_rates.columns = ['failure_rate', 'sample_count', 'failures']
+        aggregates = machine_aggregates(df, target_col, product_col)
         # Get high risk machines (above average)
         avg_rate = result["overall_failure_rate"]
-        high_risk = machine_rates[machine_rates['failure_rate'] > avg_rate * 1.5]
-        result["high_risk_machines"] = high_risk.head(10).to_dict('index')
-        result["total_machines"] = len(machine_rates)
+        high_risk = rank_machines(aggregates, k=top_k, threshold=avg_rate * 1.5, min_samples=min_samples)
+        result["high_risk_machines"] = {
+            m["machine_id"]: {
+                "failure_rate": m["failure_rate"],
+                "sample_count": m["sample_count"],
+                "failures": m["total_failures"]
+            }
+            for m in high_risk
+        }
+        result["total_machines"] = len(aggregates["machine_id"])
 
     return result
 
@@ -78,25 +90,38 @@ def identify_risk_factors(df: pd.DataFrame) -> List[Dict[str, Any]]:
     return sorted(correlations, key=lambda x: abs(x['correlation']), reverse=True)
 
 
-def get_high_risk_machines(df: pd.DataFrame, threshold: float = 0.05) -> List[Dict[str, Any]]:
-    """Get machines with failure rate above threshold."""
+def compute_machine_aggregates(df: pd.DataFrame) -> Dict[str, Any] | None:
+    """Per-machine aggregates for ranking, or None without target/machine columns."""
     df = normalize_columns(df)
 
     target_col = _find_column(df, ['target', 'failure'])
     product_col = _find_column(df, ['product', 'machine'])
 
     if not target_col or not product_col:
-        return []
+        return None
+
+    return machine_aggregates(df, target_col, product_col)
 
-    machine_stats = df.groupby(product_col).agg({
-        target_col: ['mean', 'sum', 'count']
-    }).reset_index()
-    machine_stats.columns = ['machine_id', 'failure_rate', 'total_failures', 'sample_count']
 
-    high_risk = machine_stats[machine_stats['failure_rate'] > threshold]
-    high_risk = high_risk.sort_values('failure_rate', ascending=False)
+def get_high_risk_machines(
+    df: pd.DataFrame,
+    threshold: float = 0.05,
+    top_k: int = 10,
+    min_samples: int = 1,
+    aggregates: Dict[str, Any] | None = None
+) -> List[Dict[str, Any]]:
+    """
+    Get the top-K machines with failure rate above threshold.
+
+    Pass `aggregates` from `compute_machine_aggregates` to rank without
+    regrouping the data.
+    """
+    if aggregates is None:
+        aggregates = compute_machine_aggregates(df)
+    if aggregates is None:
+        return []
 
-    return high_risk.head(10).to_dict('records')
+    return rank_machines(aggregates, k=top_k, threshold=threshold, min_samples=min_samples)
 
 
 def analyze_failure_types(df: pd.DataFrame) -> Dict[str, int]:
@@ -108,3 +133,136 @@ def analyze_failure_types(df: pd.DataFrame) -> Dict[str, int]:
         return {"error": "No failure type column found"}
 
     return df[failure_type_col].value_counts().to_dict()
+
+
+def _is_binary(series: pd.Series) -> bool:
+    """True for numeric/boolean columns holding only 0/1 values."""
+    if not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)):
+        return False
+    return bool(series.dropna().isin([0, 1]).all())
+
+
+def failure_mode_matrix(df: pd.DataFrame) -> Tuple[List[str], np.ndarray, List[str]] | None:
+    """
+    Binary failure-mode matrix for an already normalized DataFrame.
+
+    Uses the target column plus any TWF/HDF/PWF/OSF/RNF-style flag columns.
+    Without flag columns, the failure type column is one-hot encoded instead.
+
+    Returns:
+        (mode names, n_rows x n_modes float matrix, source columns to
+        exclude from features), or None if no failure columns exist
+    """
+    target_col = _find_column(df, ['target', 'failure'])
+    if target_col and not _is_binary(df[target_col]):
+        target_col = None
+
+    flag_cols = [
+        c for c in df.columns
+        if c.upper() in FAILURE_MODE_COLUMNS and c != target_col and _is_binary(df[c])
+    ]
+    names = ([target_col] if target_col else []) + flag_cols
+    columns = [df[c].fillna(0).to_numpy(dtype=float) for c in names]
+    source_cols = list(names)
+
+    failure_type_col = _find_column(df, ['failure_type', 'failure_mode', 'defect'])
+    if not flag_cols and failure_type_col:
+        labels = df[failure_type_col].astype(str)
+        for label in labels.unique():
+            if label.lower() in NO_FAILURE_LABELS or label.lower() == 'nan':
+                continue
+            names.append(label)
+            columns.append((labels == label).to_numpy(dtype=float))
+        source_cols.append(failure_type_col)
+
+    if not names:
+        return None
+    return names, np.column_stack(columns), source_cols
+
+
+def correlation_matrix(features: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlations of every feature column with every target column.
+
+    One centered matrix product instead of a `Series.corr` call per pair.
+    Missing feature values are imputed with the column mean; constant
+    columns give NaN.
+    """
+    means = np.nanmean(features, axis=0)
+    features = np.where(np.isnan(features), means, features) - means
+    targets = targets - targets.mean(axis=0)
+
+    covariance = features.T @ targets
+    scale = np.outer(np.sqrt((features ** 2).sum(axis=0)), np.sqrt((targets ** 2).sum(axis=0)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(scale > 0, covariance / scale, np.nan)
+
+
+def analyze_failure_modes(df: pd.DataFrame, top_k: int = 10, min_samples: int = 1) -> Dict[str, Any]:
+    """
+    Failure rates and risk factors for every failure mode in one pass.
+
+    Rates overall, by product type and per machine come from a single
+    groupby over the failure-mode matrix; feature correlations come from
+    one features x modes correlation matrix.
+    """
+    df = normalize_columns(df)
+
+    modes = failure_mode_matrix(df)
+    if modes is None:
+        return {"error": "No failure mode columns found"}
+    names, matrix, source_cols = modes
+
+    product_col = _find_column(df, ['product', 'machine'])
+    type_col = _find_column(df, ['type', 'category'])
+    mode_frame = pd.DataFrame(matrix, columns=names, index=df.index)
+
+    rates = matrix.mean(axis=0)
+    counts = matrix.sum(axis=0)
+    result = {
+        "total_records": len(df),
+        "failure_modes": names,
+        "overall_rates": {name: float(rate) for name, rate in zip(names, rates)},
+        "failure_counts": {name: int(count) for name, count in zip(names, counts)},
+    }
+
+    if type_col and type_col not in source_cols:
+        by_type = mode_frame.groupby(df[type_col]).mean()
+        result["by_product_type"] = {
+            str(t): {name: float(v) for name, v in row.items()} for t, row in by_type.iterrows()
+        }
+
+    if product_col:
+        grouped = mode_frame.groupby(df[product_col], sort=False)
+        sums = grouped.sum()
+        sample_count = grouped.size().to_numpy(dtype=np.int64)
+        machine_ids = sums.index.to_numpy()
+        result["high_risk_machines"] = {
+            name: rank_machines(
+                {"machine_id": machine_ids, "failures": sums[name].to_numpy(), "sample_count": sample_count},
+                k=top_k, threshold=rate * 1.5, min_samples=min_samples
+            )
+            for name, rate in zip(names, rates)
+        }
+
+    feature_cols = [
+        c for c in df.select_dtypes(include=['number']).columns
+        if c not in source_cols and c.upper() not in FAILURE_MODE_COLUMNS
+    ]
+    if feature_cols:
+        corr = correlation_matrix(df[feature_cols].to_numpy(dtype=float), matrix)
+        result["correlations"] = {
+            "features": feature_cols,
+            "modes": names,
+            "matrix": [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in corr],
+        }
+        top_factors = {}
+        for j, name in enumerate(names):
+            column = np.nan_to_num(np.abs(corr[:, j]), nan=-1.0)
+            top_factors[name] = [
+                {"factor": feature_cols[i], "correlation": round(float(corr[i, j]), 4)}
+                for i in np.argsort(-column)[:3] if not np.isnan(corr[i, j])
+            ]
+        result["top_factors"] = top_factors
+
+    return result
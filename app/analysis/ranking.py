@@ -0,0 +1,93 @@
+"""Top-K machine ranking over precomputed per-machine aggregates."""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any
+
+
+def _to_python(value: Any) -> Any:
+    """Unwrap numpy scalars so records serialize cleanly."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def machine_aggregates(df: pd.DataFrame, target_col: str, product_col: str) -> Dict[str, np.ndarray]:
+    """Per-machine failure and sample counts from a single groupby pass."""
+    grouped = df.groupby(product_col, sort=False)[target_col].agg(['sum', 'count'])
+    return {
+        "machine_id": grouped.index.to_numpy(),
+        "failures": grouped['sum'].to_numpy(dtype=float),
+        "sample_count": grouped['count'].to_numpy(dtype=np.int64),
+    }
+
+
+def top_k_indices(scores: np.ndarray, k: int, mask: np.ndarray | None = None,
+                  tiebreak: np.ndarray | None = None) -> np.ndarray:
+    """
+    Indices of the k highest scores (optionally among `mask`), best first.
+
+    Uses argpartition so only the selected entries are sorted. Entries tied
+    with the k-th score are all kept until after the tiebreak, so which of
+    them make the cut is decided by `tiebreak` (then index), not by the
+    partition.
+    """
+    candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+    if k <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if len(candidates) > k:
+        candidate_scores = scores[candidates]
+        kth = candidate_scores[np.argpartition(-candidate_scores, k - 1)[k - 1]]
+        candidates = candidates[candidate_scores >= kth]
+
+    secondary = tiebreak[candidates] if tiebreak is not None else np.zeros(len(candidates))
+    # lexsort is stable, so remaining ties keep index order
+    return candidates[np.lexsort((-secondary, -scores[candidates]))][:k]
+
+
+def rank_machines(
+    aggregates: Dict[str, np.ndarray],
+    k: int = 10,
+    threshold: float | None = None,
+    min_samples: int = 1,
+    rank_by: str = "failure_rate",
+    count_key: str = "sample_count"
+) -> List[Dict[str, Any]]:
+    """
+    Rank machines by failure rate.
+
+    Args:
+        aggregates: Output of `machine_aggregates` (extra per-machine arrays
+            such as confidence bounds are carried into the records)
+        k: Number of machines to return
+        threshold: Only machines with a failure rate above this are returned
+        min_samples: Minimum records a machine needs to be ranked
+        rank_by: Per-machine array to order by, e.g. "ci_low" for estimates
+        count_key: Per-machine array `min_samples` applies to, e.g.
+            "effective_samples" for weighted samples
+
+    Returns:
+        Records with machine_id, failure_rate, total_failures, sample_count
+    """
+    counts = aggregates["sample_count"]
+    failures = aggregates["failures"]
+    rates = aggregates.get("failure_rate")
+    if rates is None:
+        rates = np.divide(failures, counts, out=np.zeros(len(counts)), where=counts > 0)
+    scores = rates if rank_by == "failure_rate" else aggregates[rank_by]
+
+    mask = aggregates[count_key] >= max(min_samples, 1)
+    if threshold is not None:
+        mask &= rates > threshold
+
+    extra = [key for key in aggregates if key not in ("machine_id", "failures", "sample_count", "failure_rate")]
+    records = []
+    for i in top_k_indices(scores, k, mask, tiebreak=failures):
+        record = {
+            "machine_id": _to_python(aggregates["machine_id"][i]),
+            "failure_rate": float(rates[i]),
+            "total_failures": int(round(failures[i])),
+            "sample_count": int(counts[i]),
+        }
+        for key in extra:
+            record[key] = _to_python(aggregates[key][i])
+        records.append(record)
+    return records
@@ -0,0 +1,307 @@
+"""Server-side registry of datasets stored under the data directory."""
+import copy
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+import pandas as pd
+
+from config import settings
+from analysis.data_loader import detect_file_format, load_data_from_path, build_dataset_profile, build_sketches
+from analysis.sketches import DatasetSketches
+from analysis.anomaly import AnomalyState, build_anomaly_state, update_anomaly_state
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per chunk when fingerprinting a file
+FINGERPRINT_CHUNK_SIZE = 1 << 20
+INDEX_FILENAME = "registry.json"
+
+
+def fingerprint_file(path: Path) -> str:
+    """SHA-256 of a file's contents, streamed in chunks."""
+    return fingerprint_with_prefix(path, 0)[0]
+
+
+def fingerprint_with_prefix(path: Path, prefix_bytes: int) -> Tuple[str, str | None]:
+    """
+    SHA-256 of a whole file and of its first `prefix_bytes` bytes, in one pass.
+
+    The prefix digest is None when the file is not longer than the prefix or
+    the prefix does not end at a line break, so a matching prefix digest
+    means whole lines were appended to the old contents.
+    """
+    digest = hashlib.sha256()
+    prefix_digest, read = None, 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FINGERPRINT_CHUNK_SIZE), b''):
+            if 0 < prefix_bytes and read < prefix_bytes <= read + len(chunk):
+                head = chunk[:prefix_bytes - read]
+                digest.update(head)
+                if head.endswith(b"\n"):
+                    prefix_digest = digest.copy().hexdigest()
+                digest.update(chunk[prefix_bytes - read:])
+            else:
+                digest.update(chunk)
+            read += len(chunk)
+    return digest.hexdigest(), prefix_digest
+
+
+def _cache_put(cache: OrderedDict, key: str, value: Any, max_items: int) -> None:
+    """Insert into an LRU dict, evicting the least recently used entries."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_items:
+        cache.popitem(last=False)
+
+
+class DatasetRegistry:
+    """
+    Registry of files under `data_dir` that can be analyzed by reference.
+
+    Each registered file is parsed once and cached as an uncompressed Arrow
+    file, which later reads memory-map instead of re-parsing. The dataset
+    profile is built at the same time and kept in the index, and the
+    quantile/cardinality sketches are saved next to the cache. A changed mtime
+    triggers a re-fingerprint and re-parse on the next load. Only the most
+    recently used frames stay in memory.
+
+    Anomaly state is built on first request and kept per dataset. When a
+    plain CSV only gains rows, the new rows are folded into a copy of that
+    state instead of re-scoring the whole file.
+    """
+
+    def __init__(
+        self,
+        data_dir: str | None = None,
+        cache_dir: str | None = None,
+        max_frames: int | None = None
+    ):
+        self.data_dir = Path(data_dir or settings.data_dir).resolve()
+        self.cache_dir = Path(cache_dir or settings.dataset_cache_dir or self.data_dir / ".cache")
+        self.max_frames = max_frames or settings.dataset_frame_cache_size
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self._frames: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._anomaly_states: OrderedDict[str, AnomalyState | None] = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _index_path(self) -> Path:
+        return self.cache_dir / INDEX_FILENAME
+
+    def _load_index(self) -> None:
+        """Restore registered datasets from a previous run."""
+        try:
+            datasets = json.loads(self._index_path().read_text())
+        except FileNotFoundError:
+            datasets = {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable dataset index: {e}")
+            datasets = {}
+        # Entries left half-written by an older version have never been parsed
+        self.datasets = {k: r for k, r in datasets.items() if "fingerprint" in r and "rows" in r}
+
+    def _save_index(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._index_path().with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.datasets, indent=2))
+        tmp_path.replace(self._index_path())
+
+    def _resolve(self, path: str) -> Path:
+        """Resolve a path relative to data_dir, rejecting anything outside it."""
+        full_path = (self.data_dir / path).resolve()
+        if not full_path.is_relative_to(self.data_dir):
+            raise ValueError(f"Path must be inside the data directory: {path}")
+        if not full_path.is_file():
+            raise FileNotFoundError(f"Dataset file not found: {path}")
+        if detect_file_format(full_path.name) is None:
+            raise ValueError(f"Unsupported file type: {path}")
+        return full_path
+
+    def _cache_path(self, record: Dict[str, Any]) -> Path:
+        return self.cache_dir / f"{record['dataset_id']}-{record['fingerprint'][:16]}.arrow"
+
+    def _sketches_path(self, record: Dict[str, Any]) -> Path:
+        return self.cache_dir / f"{record['dataset_id']}-{record['fingerprint'][:16]}.sketches.json"
+
+    def _parse(self, record: Dict[str, Any]) -> pd.DataFrame:
+        """Parse the source file into the columnar cache and return the frame."""
+        df = load_data_from_path(str(self.data_dir / record["path"]))
+        record["rows"] = len(df)
+        record["columns"] = list(df.columns)
+        sketches = build_sketches(df)
+        record["profile"] = build_dataset_profile(df, sketches)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self.cache_dir.glob(f"{record['dataset_id']}-*"):
+            stale.unlink(missing_ok=True)
+        self._sketches_path(record).write_text(json.dumps(sketches.to_dict()))
+
+        try:
+            import pyarrow.feather as feather
+        except ImportError:
+            # No Arrow cache available - keep the parsed frame in memory only
+            return df
+
+        feather.write_feather(df, self._cache_path(record), compression='uncompressed')
+        return self._read_cache(record)
+
+    def _read_cache(self, record: Dict[str, Any]) -> pd.DataFrame | None:
+        """Memory-map the Arrow cache for a record, if it exists."""
+        cache_path = self._cache_path(record)
+        if not cache_path.exists():
+            return None
+        try:
+            import pyarrow.feather as feather
+        except ImportError:
+            return None
+        table = feather.read_table(cache_path, memory_map=True)
+        return table.to_pandas(split_blocks=True)
+
+    def _remember(self, dataset_id: str, df: pd.DataFrame) -> None:
+        """Keep a parsed frame in memory, evicting the least recently used."""
+        _cache_put(self._frames, dataset_id, df, self.max_frames)
+
+    def _commit(self, record: Dict[str, Any], df: pd.DataFrame) -> pd.DataFrame:
+        """Store an updated record once its file has been parsed successfully."""
+        self.datasets[record["dataset_id"]] = record
+        self._save_index()
+        self._remember(record["dataset_id"], df)
+        return df
+
+    def _refresh(self, record: Dict[str, Any], full_path: Path) -> pd.DataFrame:
+        """
+        Re-fingerprint and re-parse a dataset whose source changed.
+
+        Works on a copy of the record, so a file that fails to parse leaves
+        the index as it was.
+        """
+        previous = record
+        record = dict(record)
+        stat = full_path.stat()
+        appendable = detect_file_format(full_path.name) == ('csv', None) and "fingerprint" in previous
+        fingerprint, prefix = fingerprint_with_prefix(full_path, previous.get("size_bytes", 0) if appendable else 0)
+        record["size_bytes"] = stat.st_size
+        record["mtime_ns"] = stat.st_mtime_ns
+
+        df = None
+        if fingerprint == record.get("fingerprint"):
+            # Touched but unchanged - reuse the existing cache
+            df = self._read_cache(record)
+        record["fingerprint"] = fingerprint
+        if df is None:
+            logger.info(f"Parsing dataset {record['dataset_id']} from {record['path']}")
+            df = self._parse(record)
+
+        dataset_id = record["dataset_id"]
+        state = self._anomaly_states.pop(dataset_id, None)
+        if fingerprint != previous.get("fingerprint"):
+            if state is not None and prefix == previous["fingerprint"] and len(df) >= previous["rows"]:
+                # Rows were only appended: score just the new ones, on a copy so
+                # sessions holding the old state keep a consistent snapshot
+                logger.info(f"Updating anomaly state of {dataset_id} with {len(df) - previous['rows']} new rows")
+                state = update_anomaly_state(copy.deepcopy(state), df.iloc[previous["rows"]:])
+            else:
+                state = None
+        if state is not None:
+            _cache_put(self._anomaly_states, dataset_id, state, self.max_frames)
+
+        return self._commit(record, df)
+
+    def register(self, path: str) -> Dict[str, Any]:
+        """Register a file under data_dir and parse it into the cache."""
+        full_path = self._resolve(path)
+        relative_path = full_path.relative_to(self.data_dir).as_posix()
+        dataset_id = hashlib.sha256(relative_path.encode('utf-8')).hexdigest()[:16]
+
+        with self._lock:
+            record = self.datasets.get(dataset_id) or {
+                "dataset_id": dataset_id,
+                "path": relative_path,
+                "registered_at": datetime.now(timezone.utc).isoformat(),
+            }
+            self._refresh(record, full_path)
+            return dict(self.datasets[dataset_id])
+
+    def get(self, dataset_id: str) -> Dict[str, Any]:
+        """Return the metadata for a registered dataset."""
+        if dataset_id not in self.datasets:
+            raise KeyError(f"Unknown dataset: {dataset_id}")
+        return dict(self.datasets[dataset_id])
+
+    def profile(self, dataset_id: str) -> Dict[str, Any] | None:
+        """Return the profile built when the dataset was last parsed."""
+        return self.get(dataset_id).get("profile")
+
+    def sketches(self, dataset_id: str) -> DatasetSketches | None:
+        """Return the sketches saved when the dataset was last parsed, if any."""
+        record = self.get(dataset_id)
+        try:
+            return DatasetSketches.from_dict(json.loads(self._sketches_path(record).read_text()))
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return metadata for all registered datasets."""
+        return [dict(r) for r in self.datasets.values()]
+
+    def load(self, dataset_id: str) -> pd.DataFrame:
+        """Return the parsed frame for a dataset, re-parsing if the file changed."""
+        with self._lock:
+            if dataset_id not in self.datasets:
+                raise KeyError(f"Unknown dataset: {dataset_id}")
+            record = self.datasets[dataset_id]
+            full_path = self._resolve(record["path"])
+
+            if full_path.stat().st_mtime_ns != record.get("mtime_ns"):
+                return self._refresh(record, full_path)
+            df = self._frames.get(dataset_id)
+            if df is None:
+                df = self._read_cache(record)
+            if df is None:
+                staged = dict(record)
+                return self._commit(staged, self._parse(staged))
+            self._remember(dataset_id, df)
+            return df
+
+    def anomaly_state(self, dataset_id: str) -> AnomalyState | None:
+        """
+        Anomaly state for a dataset's current contents, built on first use.
+
+        Returns None when the data has no machine or sensor columns.
+        """
+        with self._lock:
+            df = self.load(dataset_id)
+            if dataset_id not in self._anomaly_states:
+                self._anomaly_states[dataset_id] = build_anomaly_state(df)
+            state = self._anomaly_states[dataset_id]
+            _cache_put(self._anomaly_states, dataset_id, state, self.max_frames)
+            return state
+
+    def source_path(self, dataset_id: str) -> str:
+        """
+        Path a worker process should read for a dataset.
+
+        Returns the columnar cache when it is current, so other processes can
+        memory-map it rather than re-parse the source file.
+        """
+        with self._lock:
+            if dataset_id not in self.datasets:
+                raise KeyError(f"Unknown dataset: {dataset_id}")
+            record = self.datasets[dataset_id]
+            full_path = self._resolve(record["path"])
+
+            if full_path.stat().st_mtime_ns != record.get("mtime_ns"):
+                self._refresh(record, full_path)
+                record = self.datasets[dataset_id]
+            cache_path = self._cache_path(record)
+            return str(cache_path if cache_path.exists() else full_path)
+
+
+# Global registry instance
+registry = DatasetRegistry()
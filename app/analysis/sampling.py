@@ -0,0 +1,266 @@
+"""Approximate analysis on stratified samples of very large datasets."""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any
+
+from analysis.data_loader import normalize_columns
+from analysis.production import _find_column
+from analysis.ranking import rank_machines
+
+WEIGHT_COL = "_weight"
+Z_95 = 1.959964
+
+
+def stratified_sample(
+    df: pd.DataFrame,
+    strata: List[str],
+    sample_size: int,
+    min_stratum_size: int = 0,
+    seed: int = 0
+) -> pd.DataFrame:
+    """
+    Draw a stratified reservoir sample with per-row inverse-probability weights.
+
+    Each stratum gets a proportional share of `sample_size`, topped up to
+    `min_stratum_size` so rare strata (e.g. failures) are not starved. Rows are
+    chosen by smallest random priority within their stratum, which is the
+    reservoir-sampling rule applied to the whole column at once.
+    """
+    codes = df.groupby(strata, sort=False, dropna=False).ngroup().to_numpy() if strata \
+        else np.zeros(len(df), dtype=np.int64)
+    population = np.bincount(codes)
+
+    allocation = np.round(sample_size * population / len(df)).astype(np.int64)
+    allocation = np.minimum(np.maximum(allocation, min_stratum_size), population)
+
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(df)), codes))
+    group_starts = np.concatenate(([0], np.cumsum(population)[:-1]))
+    sorted_codes = codes[order]
+    rank_in_stratum = np.arange(len(df)) - group_starts[sorted_codes]
+    chosen = np.sort(order[rank_in_stratum < allocation[sorted_codes]])
+
+    sample = df.iloc[chosen].copy()
+    sample[WEIGHT_COL] = population[codes[chosen]] / allocation[codes[chosen]]
+    return sample
+
+
+def build_sample(
+    df: pd.DataFrame,
+    sample_size: int,
+    min_stratum_size: int = 0,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Build the stratified sample used by the approximate analyses.
+
+    Strata are product type x failure flag, so the overall and per-type
+    failure rates remain exact; per-machine rates and correlations are
+    estimated from the weighted sample.
+    """
+    df = normalize_columns(df)
+
+    target_col = _find_column(df, ['target', 'failure'])
+    type_col = _find_column(df, ['type', 'category'])
+    strata = [c for c in (type_col, target_col) if c]
+
+    return {
+        "frame": stratified_sample(df, strata, sample_size, min_stratum_size, seed),
+        "population": len(df),
+        "strata": strata,
+    }
+
+
+def _effective_n(weights: np.ndarray) -> float:
+    """Kish effective sample size for a set of weights."""
+    total = weights.sum()
+    return float(total * total / (weights * weights).sum()) if total > 0 else 0.0
+
+
+def _wilson_interval(rate: np.ndarray, n_eff: np.ndarray) -> tuple:
+    """95% Wilson score interval for a proportion at effective sample size n_eff."""
+    n_eff = np.maximum(n_eff, 1e-9)
+    z2 = Z_95 * Z_95
+    denom = 1 + z2 / n_eff
+    center = (rate + z2 / (2 * n_eff)) / denom
+    half = Z_95 * np.sqrt(rate * (1 - rate) / n_eff + z2 / (4 * n_eff * n_eff)) / denom
+    return np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+
+
+def _weighted_group_rates(sample: pd.DataFrame, group_col: str, target_col: str) -> pd.DataFrame:
+    """Weighted failure rate, estimated count and 95% CI per group."""
+    w = sample[WEIGHT_COL]
+    grouped = pd.DataFrame({
+        "key": sample[group_col],
+        "w": w,
+        "w2": w * w,
+        "wy": w * sample[target_col],
+    }).groupby("key", sort=False).sum()
+
+    rate = (grouped["wy"] / grouped["w"]).to_numpy()
+    n_eff = (grouped["w"] ** 2 / grouped["w2"]).to_numpy()
+    low, high = _wilson_interval(rate, n_eff)
+    return pd.DataFrame({
+        "failure_rate": rate,
+        "sample_count": grouped["w"].round().astype(np.int64).to_numpy(),
+        "effective_samples": n_eff,
+        "failures": grouped["wy"].round().astype(np.int64).to_numpy(),
+        "ci_low": low,
+        "ci_high": high,
+    }, index=grouped.index)
+
+
+def _weighted_machine_aggregates(sample: pd.DataFrame, product_col: str, target_col: str) -> Dict[str, np.ndarray]:
+    """Weighted per-machine rates in the aggregate form `rank_machines` expects."""
+    rates = _weighted_group_rates(sample, product_col, target_col)
+    return {
+        "machine_id": rates.index.to_numpy(),
+        "failures": rates["failures"].to_numpy(dtype=float),
+        "sample_count": rates["sample_count"].to_numpy(),
+        "failure_rate": rates["failure_rate"].to_numpy(),
+        "ci_low": rates["ci_low"].to_numpy(),
+        "ci_high": rates["ci_high"].to_numpy(),
+        "effective_samples": rates["effective_samples"].to_numpy().round(1),
+    }
+
+
+def _rank_sampled_machines(aggregates: Dict[str, np.ndarray], top_k: int, threshold: float, min_samples: int):
+    """
+    Rank sampled machines conservatively.
+
+    Failure rows are oversampled, so a machine with one sampled failure and
+    few other rows gets a point estimate near 1. Requiring `min_samples` of
+    effective (not weighted) sample size and ordering by the Wilson lower
+    bound keeps such machines from topping the list.
+    """
+    return rank_machines(
+        aggregates, k=top_k, threshold=threshold, min_samples=min_samples,
+        rank_by="ci_low", count_key="effective_samples"
+    )
+
+
+def _approximation_info(sample_info: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "approximate": True,
+        "sample_size": len(sample_info["frame"]),
+        "population_size": sample_info["population"],
+        "confidence_level": 0.95,
+    }
+
+
+def approximate_failure_rates(sample_info: Dict[str, Any], top_k: int = 10, min_samples: int = 1) -> Dict[str, Any]:
+    """Sample-based counterpart of `analyze_failure_rates`."""
+    sample = sample_info["frame"]
+
+    target_col = _find_column(sample, ['target', 'failure'])
+    product_col = _find_column(sample, ['product', 'machine'])
+    type_col = _find_column(sample, ['type', 'category'])
+
+    result = {
+        "total_records": sample_info["population"],
+        "analysis_available": False,
+        **_approximation_info(sample_info),
+    }
+
+    if not target_col:
+        result["error"] = "No target/failure column found"
+        return result
+
+    w = sample[WEIGHT_COL]
+    result["analysis_available"] = True
+    # Exact: the failure flag is a sampling stratum
+    result["overall_failure_rate"] = float((w * sample[target_col]).sum() / w.sum())
+    result["total_failures"] = int(round((w * sample[target_col]).sum()))
+
+    if type_col:
+        result["by_product_type"] = _weighted_group_rates(sample, type_col, target_col)["failure_rate"].to_dict()
+
+    if product_col:
+        aggregates = _weighted_machine_aggregates(sample, product_col, target_col)
+        avg_rate = result["overall_failure_rate"]
+        high_risk = _rank_sampled_machines(aggregates, top_k, avg_rate * 1.5, min_samples)
+        result["high_risk_machines"] = {
+            m["machine_id"]: {
+                "failure_rate": m["failure_rate"],
+                "sample_count": m["sample_count"],
+                "failures": m["total_failures"],
+                "ci_low": m["ci_low"],
+                "ci_high": m["ci_high"],
+                "effective_samples": m["effective_samples"]
+            }
+            for m in high_risk
+        }
+        # Same key as the exact analysis; only machines seen in the sample are counted
+        result["total_machines"] = len(aggregates["machine_id"])
+
+    return result
+
+
+def _weighted_corr(x: np.ndarray, y: np.ndarray, w: np.ndarray) -> float:
+    """Weighted Pearson correlation, ignoring rows where x is missing."""
+    mask = ~np.isnan(x)
+    x, y, w = x[mask], y[mask], w[mask]
+    if w.sum() == 0:
+        return float('nan')
+    mx = np.average(x, weights=w)
+    my = np.average(y, weights=w)
+    cov = np.average((x - mx) * (y - my), weights=w)
+    var_x = np.average((x - mx) ** 2, weights=w)
+    var_y = np.average((y - my) ** 2, weights=w)
+    if var_x == 0 or var_y == 0:
+        return float('nan')
+    return float(cov / np.sqrt(var_x * var_y))
+
+
+def approximate_risk_factors(sample_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Sample-based counterpart of `identify_risk_factors` with Fisher-z CIs."""
+    sample = sample_info["frame"]
+
+    target_col = _find_column(sample, ['target', 'failure'])
+    if not target_col:
+        return [{"error": "No target column found"}]
+
+    numeric_cols = sample.select_dtypes(include=['number']).columns.tolist()
+    numeric_cols = [c for c in numeric_cols if c not in (target_col, WEIGHT_COL)]
+
+    w = sample[WEIGHT_COL].to_numpy()
+    y = sample[target_col].to_numpy(dtype=float)
+    half_width = Z_95 / np.sqrt(max(_effective_n(w) - 3, 1))
+
+    correlations = []
+    for col in numeric_cols:
+        corr = _weighted_corr(sample[col].to_numpy(dtype=float), y, w)
+        if np.isnan(corr):
+            continue
+        z = np.arctanh(np.clip(corr, -0.999999, 0.999999))
+        correlations.append({
+            "factor": col,
+            "correlation": round(corr, 4),
+            "strength": "strong" if abs(corr) > 0.3 else "moderate" if abs(corr) > 0.1 else "weak",
+            "direction": "positive" if corr > 0 else "negative",
+            "ci_low": round(float(np.tanh(z - half_width)), 4),
+            "ci_high": round(float(np.tanh(z + half_width)), 4),
+            "approximate": True,
+        })
+
+    return sorted(correlations, key=lambda x: abs(x['correlation']), reverse=True)
+
+
+def approximate_high_risk_machines(
+    sample_info: Dict[str, Any],
+    threshold: float = 0.05,
+    top_k: int = 10,
+    min_samples: int = 1
+) -> List[Dict[str, Any]]:
+    """Sample-based counterpart of `get_high_risk_machines` with Wilson CIs."""
+    sample = sample_info["frame"]
+
+    target_col = _find_column(sample, ['target', 'failure'])
+    product_col = _find_column(sample, ['product', 'machine'])
+
+    if not target_col or not product_col:
+        return []
+
+    aggregates = _weighted_machine_aggregates(sample, product_col, target_col)
+    high_risk = _rank_sampled_machines(aggregates, top_k, threshold, min_samples)
+    return [{**m, "approximate": True} for m in high_risk]
@@ -0,0 +1,303 @@
+"""Mergeable streaming sketches: KLL quantiles and HyperLogLog cardinality."""
+import base64
+import math
+from typing import Dict, List, Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+# KLL accuracy parameter; ~1.3% normalized rank error at k=200
+DEFAULT_K = 200
+# HyperLogLog uses 2**precision one-byte registers; ~1.6% standard error at 12
+DEFAULT_PRECISION = 12
+DEFAULT_QUANTILES = [0.5, 0.9, 0.95, 0.99]
+ALL_ROWS = "all"
+
+
+def kll_rank_error(k: int) -> float:
+    """Normalized rank error bound of a KLL sketch (DataSketches' empirical fit)."""
+    return 2.296 / k ** 0.9723
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch over floats.
+
+    Items live in a stack of compactors; level h items each stand for 2**h
+    inputs. A full level is sorted and every other item promoted, so memory
+    stays O(k) plus a few items per level however many values are added.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self) -> None:
+        # Lazy compaction: only compact while the sketch as a whole is over
+        # budget, lowest full level first, so spare capacity keeps more items
+        while sum(len(items) for items in self.levels) > sum(map(self._capacity, range(len(self.levels)))):
+            level = next(h for h, items in enumerate(self.levels) if len(items) > self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind so promoted weight is exact
+            keep, items = items[:len(items) % 2], items[len(items) % 2:]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self._rng.integers(2)::2]])
+
+    def update(self, values: Iterable[float]) -> None:
+        """Add a batch of values; NaNs are ignored."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Fold another sketch into this one (in place) and return self."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.k = min(self.k, other.k)
+        self._compress()
+        return self
+
+    def quantiles(self, qs: Iterable[float]) -> List[float | None]:
+        """Approximate values at each quantile in `qs` (0-1); None when empty."""
+        qs = list(qs)
+        if self.count == 0:
+            return [None] * len(qs)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, cumulative = items[order], np.cumsum(weights[order])
+
+        result = []
+        for q in qs:
+            if q <= 0:
+                result.append(self.min)
+            elif q >= 1:
+                result.append(self.max)
+            else:
+                i = min(int(np.searchsorted(cumulative, q * cumulative[-1])), len(items) - 1)
+                result.append(float(items[i]))
+        return result
+
+    def quantile(self, q: float) -> float | None:
+        return self.quantiles([q])[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "levels": [items.tolist() for items in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(data["k"])
+        sketch.count = data["count"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        sketch.levels = [np.asarray(items, dtype=float) for items in data["levels"]]
+        return sketch
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length() for uint64 arrays."""
+    length = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values = np.where(high, values >> np.uint64(shift), values)
+    return length + (values > 0)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-value counter over 64-bit pandas value hashes."""
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values: Iterable[Any]) -> None:
+        """Add a batch of values; NaNs are ignored."""
+        values = pd.Series(values).dropna()
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold another counter into this one (in place) and return self."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog counters with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            raw = m * math.log(m / zeros)
+        return int(round(raw))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers.tobytes()).decode('ascii'),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        counter = cls(data["precision"])
+        counter.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return counter
+
+
+def _quantile_label(q: float) -> str:
+    return f"p{q * 100:g}"
+
+
+class DatasetSketches:
+    """
+    Sketches for one dataset, fed chunk by chunk.
+
+    Keeps a KLL sketch per numeric column and failure class (plus "all" rows)
+    and a HyperLogLog counter per column. Sketches of different chunks,
+    files or sessions can be merged.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, precision: int = DEFAULT_PRECISION):
+        self.k = k
+        self.precision = precision
+        self.rows = 0
+        self.quantile_sketches: Dict[str, Dict[str, KLLSketch]] = {}
+        self.cardinality: Dict[str, HyperLogLog] = {}
+
+    def update(
+        self,
+        chunk: pd.DataFrame,
+        numeric_columns: List[str],
+        classes: Dict[str, np.ndarray]
+    ) -> None:
+        """
+        Add one chunk of rows.
+
+        Args:
+            chunk: Rows to add, with normalized column names
+            numeric_columns: Columns to keep quantile sketches for
+            classes: Failure class name -> boolean row mask for this chunk
+        """
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            self.cardinality.setdefault(col, HyperLogLog(self.precision)).update(chunk[col])
+
+        for col in numeric_columns:
+            values = chunk[col].to_numpy(dtype=float, na_value=np.nan)
+            per_class = self.quantile_sketches.setdefault(col, {})
+            per_class.setdefault(ALL_ROWS, KLLSketch(self.k)).update(values)
+            for name, mask in classes.items():
+                if mask.any():
+                    per_class.setdefault(name, KLLSketch(self.k)).update(values[mask])
+
+    def merge(self, other: "DatasetSketches") -> "DatasetSketches":
+        """Fold another dataset's sketches into this one (in place) and return self."""
+        self.rows += other.rows
+        for col, counter in other.cardinality.items():
+            self.cardinality.setdefault(col, HyperLogLog(counter.precision)).merge(counter)
+        for col, per_class in other.quantile_sketches.items():
+            mine = self.quantile_sketches.setdefault(col, {})
+            for name, sketch in per_class.items():
+                mine.setdefault(name, KLLSketch(sketch.k)).merge(sketch)
+        return self
+
+    def distinct(self, column: str) -> int | None:
+        counter = self.cardinality.get(column)
+        return counter.estimate() if counter is not None else None
+
+    def summary(self, columns: List[str] | None = None, quantiles: List[float] | None = None) -> Dict[str, Any]:
+        """
+        Approximate quantiles per column and failure class, plus distinct counts.
+
+        `columns` filters by case-insensitive substring, like the column
+        lookups elsewhere in the analyses.
+        """
+        quantiles = quantiles or DEFAULT_QUANTILES
+        patterns = [c.lower() for c in columns or []]
+        selected = [
+            col for col in self.quantile_sketches
+            if not patterns or any(p in col.lower() for p in patterns)
+        ]
+
+        distributions = {}
+        for col in selected:
+            distributions[col] = {}
+            for name, sketch in self.quantile_sketches[col].items():
+                values = sketch.quantiles(quantiles)
+                distributions[col][name] = {
+                    "count": sketch.count,
+                    "min": sketch.min if sketch.count else None,
+                    "max": sketch.max if sketch.count else None,
+                    **{_quantile_label(q): v for q, v in zip(quantiles, values)},
+                }
+
+        return {
+            "records": self.rows,
+            "approximate": True,
+            "rank_error": round(kll_rank_error(self.k), 4),
+            "distributions": distributions,
+            "distinct_counts": {
+                col: counter.estimate() for col, counter in self.cardinality.items()
+                if not patterns or any(p in col.lower() for p in patterns)
+            },
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "precision": self.precision,
+            "rows": self.rows,
+            "quantiles": {
+                col: {name: sketch.to_dict() for name, sketch in per_class.items()}
+                for col, per_class in self.quantile_sketches.items()
+            },
+            "cardinality": {col: counter.to_dict() for col, counter in self.cardinality.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DatasetSketches":
+        sketches = cls(data["k"], data["precision"])
+        sketches.rows = data["rows"]
+        sketches.quantile_sketches = {
+            col: {name: KLLSketch.from_dict(s) for name, s in per_class.items()}
+            for col, per_class in data["quantiles"].items()
+        }
+        sketches.cardinality = {col: HyperLogLog.from_dict(c) for col, c in data["cardinality"].items()}
+        return sketches
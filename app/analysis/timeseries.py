@@ -0,0 +1,229 @@
+"""Time-windowed failure analysis answered from precomputed rollups."""
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any
+
+from analysis.data_loader import normalize_columns
+from analysis.production import _find_column
+from analysis.ranking import rank_machines
+
+# Most specific first: an exact or partial 'timestamp' beats a bare 'time'
+TIME_PATTERNS = ['timestamp', 'datetime', 'date', 'time']
+# Matched against the start of name tokens, so 'audio' is not a 'udi' column
+SEQUENCE_PATTERNS = ['udi', 'sequence', 'seq']
+GRANULARITIES = {"hourly": "h", "daily": "D"}
+WINDOW_UNITS = {'m': 'minutes', 'min': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+# Rollup column holding a sensor's non-null reading count, for means that skip gaps
+COUNT_SUFFIX = "__count"
+
+
+def parse_window(window: str) -> pd.Timedelta:
+    """Parse a window such as '24h', '7d' or '2w'."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)\s*', window)
+    if not match or match.group(2).lower() not in WINDOW_UNITS:
+        raise ValueError(f"Invalid window '{window}'. Use e.g. '24h', '7d', '2w'")
+    return pd.Timedelta(**{WINDOW_UNITS[match.group(2).lower()]: float(match.group(1))})
+
+
+def is_sequence_column(name: str) -> bool:
+    """Whether a column name denotes a row sequence/ID such as UDI."""
+    tokens = re.split(r'[^a-z0-9]+', str(name).lower())
+    return any(token.startswith(p) for token in tokens for p in SEQUENCE_PATTERNS)
+
+
+def _find_time_column(df: pd.DataFrame) -> str | None:
+    """
+    Find a datetime column, parsing name-matched text columns if needed.
+
+    Numeric name matches (e.g. `Cycle_time_s`) are skipped. Names equal to
+    a pattern win over names merely containing it, and earlier patterns win
+    over later ones.
+    """
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            return col
+    candidates = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+    for pattern in TIME_PATTERNS:
+        exact = [c for c in candidates if str(c).lower() == pattern]
+        partial = [c for c in candidates if pattern in str(c).lower()]
+        if exact or partial:
+            return (exact or partial)[0]
+    return None
+
+
+def _event_times(df: pd.DataFrame, sequence_interval_minutes: float) -> tuple:
+    """
+    Event timestamps for each row and the column they came from.
+
+    Real timestamps are used when present. Otherwise a sequence column such
+    as UDI is treated as one reading every `sequence_interval_minutes`.
+    """
+    time_col = _find_time_column(df)
+    if time_col:
+        times = pd.to_datetime(df[time_col], errors='coerce', utc=True).dt.tz_localize(None)
+        if times.notna().any():
+            return times, time_col, False
+
+    seq_col = next((c for c in df.columns if is_sequence_column(c)), None)
+    if seq_col and pd.api.types.is_numeric_dtype(df[seq_col]):
+        sequence = df[seq_col] - df[seq_col].min()
+    else:
+        seq_col = None
+        sequence = pd.Series(np.arange(len(df)), index=df.index)
+    times = pd.Timestamp(0) + pd.to_timedelta(sequence * sequence_interval_minutes, unit='m')
+    return times, seq_col or "row order", True
+
+
+def build_rollups(df: pd.DataFrame, sequence_interval_minutes: float = 1.0) -> Dict[str, Any] | None:
+    """
+    Build hourly and daily rollup tables once per dataset.
+
+    Each rollup row holds record count, failure count, sensor sums and
+    non-null sensor reading counts for one
+    (time bucket, machine) pair, so any window or trend query only touches
+    the rollups rather than the raw rows. Rows without a machine ID are kept
+    (under a null machine); rows whose timestamp cannot be parsed are left
+    out and counted in `dropped_rows`.
+    """
+    df = normalize_columns(df)
+
+    target_col = _find_column(df, ['target', 'failure'])
+    if not target_col or not pd.api.types.is_numeric_dtype(df[target_col]):
+        return None
+    product_col = _find_column(df, ['product', 'machine'])
+
+    times, time_source, synthetic = _event_times(df, sequence_interval_minutes)
+    sensors = [
+        c for c in df.select_dtypes(include=['number']).columns
+        if c != target_col and not is_sequence_column(c)
+    ]
+
+    frame = pd.DataFrame({"bucket": times.dt.floor('h'), "records": 1, "failures": df[target_col]})
+    keys = ["bucket"]
+    if product_col:
+        frame["machine_id"] = df[product_col]
+        keys.append("machine_id")
+    for col in sensors:
+        frame[col] = df[col]
+        frame[col + COUNT_SUFFIX] = df[col].notna().astype(np.int64)
+    dropped = int(frame["bucket"].isna().sum())
+    frame = frame[frame["bucket"].notna()]
+
+    # dropna=False so rows with a null machine ID still count towards the totals
+    hourly = frame.groupby(keys, sort=True, dropna=False).sum().reset_index()
+    daily = hourly.assign(bucket=hourly["bucket"].dt.floor('D')) \
+        .groupby(keys, sort=True, dropna=False).sum().reset_index()
+
+    return {
+        "hourly": hourly,
+        "daily": daily,
+        "sensors": sensors,
+        "by_machine": bool(product_col),
+        "time_source": time_source,
+        "synthetic_time": synthetic,
+        "dropped_rows": dropped,
+        "start": hourly["bucket"].min(),
+        "end": hourly["bucket"].max(),
+    }
+
+
+def _window_slice(rollups: Dict[str, Any], window: pd.Timedelta) -> pd.DataFrame:
+    """Hourly rollup rows for the `window` ending at the last bucket."""
+    hourly = rollups["hourly"]
+    end = rollups["end"]
+    start = end - window + pd.Timedelta(hours=1)
+    return hourly[(hourly["bucket"] >= start) & (hourly["bucket"] <= end)]
+
+
+def _sensor_means(totals: pd.Series, sensors: List[str]) -> Dict[str, float | None]:
+    """Mean of each sensor over its non-null readings (None when it has none)."""
+    return {
+        s: float(totals[s] / totals[s + COUNT_SUFFIX]) if totals[s + COUNT_SUFFIX] else None
+        for s in sensors
+    }
+
+
+def _summarize(rows: pd.DataFrame, sensors: List[str]) -> Dict[str, Any]:
+    totals = rows.drop(columns=["bucket", "machine_id"], errors="ignore").sum()
+    records = int(totals["records"])
+    failures = int(totals["failures"])
+    return {
+        "records": records,
+        "failures": failures,
+        "failure_rate": failures / records if records else None,
+        "sensor_means": _sensor_means(totals, sensors) if records else {},
+    }
+
+
+def window_failure_rates(
+    rollups: Dict[str, Any],
+    window: str = "24h",
+    baseline_window: str = "7d",
+    top_k: int = 10,
+    min_samples: int = 1
+) -> Dict[str, Any]:
+    """
+    Compare failure rates in the most recent window against a longer baseline.
+
+    Windows end at the latest reading in the data, e.g. "24h" vs "7d" answers
+    "failure rate per machine in the last day vs the last week".
+    """
+    window_td = parse_window(window)
+    baseline_td = parse_window(baseline_window)
+    sensors = rollups["sensors"]
+
+    current = _window_slice(rollups, window_td)
+    baseline = _window_slice(rollups, baseline_td)
+
+    result = {
+        "window": window,
+        "baseline_window": baseline_window,
+        "window_start": str(rollups["end"] - window_td + pd.Timedelta(hours=1)),
+        "window_end": str(rollups["end"] + pd.Timedelta(hours=1)),
+        "time_source": rollups["time_source"],
+        "synthetic_time": rollups["synthetic_time"],
+        "rows_without_timestamp": rollups["dropped_rows"],
+        "current": _summarize(current, sensors),
+        "baseline": _summarize(baseline, sensors),
+    }
+    if result["current"]["failure_rate"] is not None and result["baseline"]["failure_rate"] is not None:
+        result["failure_rate_change"] = result["current"]["failure_rate"] - result["baseline"]["failure_rate"]
+
+    if rollups["by_machine"] and len(current):
+        per_machine = current.groupby("machine_id", sort=False)[["records", "failures"]].sum()
+        base_machine = baseline.groupby("machine_id", sort=False)[["records", "failures"]].sum()
+        base_machine = base_machine.reindex(per_machine.index)
+        base_rate = (base_machine["failures"] / base_machine["records"]).to_numpy()
+        aggregates = {
+            "machine_id": per_machine.index.to_numpy(),
+            "failures": per_machine["failures"].to_numpy(dtype=float),
+            "sample_count": per_machine["records"].to_numpy(dtype=np.int64),
+            "baseline_failure_rate": np.where(np.isnan(base_rate), None, base_rate),
+        }
+        result["top_machines"] = rank_machines(aggregates, k=top_k, min_samples=min_samples)
+
+    return result
+
+
+def failure_trend(rollups: Dict[str, Any], granularity: str = "daily", window: str | None = None) -> List[Dict[str, Any]]:
+    """Failure rate and sensor means per hour or day, optionally limited to a recent window."""
+    table = rollups["daily"] if granularity == "daily" else rollups["hourly"]
+    if window:
+        start = rollups["end"] - parse_window(window) + pd.Timedelta(hours=1)
+        table = table[table["bucket"] >= start.floor(GRANULARITIES.get(granularity, 'h'))]
+
+    sensors = rollups["sensors"]
+    counts = [s + COUNT_SUFFIX for s in sensors]
+    periods = table.groupby("bucket", sort=True)[["records", "failures", *sensors, *counts]].sum()
+    trend = []
+    for bucket, row in periods.iterrows():
+        records = int(row["records"])
+        trend.append({
+            "period": str(bucket),
+            "records": records,
+            "failures": int(row["failures"]),
+            "failure_rate": float(row["failures"] / records) if records else None,
+            "sensor_means": _sensor_means(row, sensors) if records else {},
+        })
+    return trend
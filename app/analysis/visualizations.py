@@ -1,26 +1,55 @@
-"""Visualization generation functions."""
+"""
+Visualization generation functions.
+
+Each chart is split into an `aggregate_*` stage, which reduces the data to a
+small JSON-serializable payload, and a `render_*` stage, which draws only
+that payload. Renderers produce PNG via matplotlib or, with fmt="svg", build
+the SVG markup directly without matplotlib's layout engine.
+"""
 import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend for server
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pandas as pd
 import io
 import base64
+import math
+from html import escape
 from typing import List, Dict, Any
 
 from analysis.data_loader import normalize_columns
+from analysis.ranking import machine_aggregates, rank_machines
+from profiling import allocation_span
+
+CHART_FORMATS = ("png", "svg")
+
+# matplotlib's Set3 palette, used for pie slices in both renderers
+SET3_COLORS = [
+    '#8dd3c7', '#ffffb3', '#bebada', '#fb8072', '#80b1d3', '#fdb462',
+    '#b3de69', '#fccde5', '#d9d9d9', '#bc80bd', '#ccebc5', '#ffed6f'
+]
+
+SVG_WIDTH = 800
+SVG_HEIGHT = 480
+SVG_FONT = 'font-family="DejaVu Sans, Arial, sans-serif"'
 
 
 def _fig_to_base64(fig) -> str:
     """Convert matplotlib figure to base64 string."""
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight', dpi=100, facecolor='white')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close(fig)
+    with allocation_span("render_png"):
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=100, facecolor='white')
+        buf.seek(0)
+        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
     return f"data:image/png;base64,{img_base64}"
 
 
+def _svg_to_base64(svg: str) -> str:
+    """Wrap SVG markup as a base64 data URI."""
+    img_base64 = base64.b64encode(svg.encode('utf-8')).decode('utf-8')
+    return f"data:image/svg+xml;base64,{img_base64}"
+
+
 def _find_column(df: pd.DataFrame, patterns: List[str]) -> str | None:
     """Find column matching any of the patterns."""
     for col in df.columns:
@@ -30,8 +59,133 @@ def _find_column(df: pd.DataFrame, patterns: List[str]) -> str | None:
     return None
 
 
-def create_failure_rate_by_type_chart(df: pd.DataFrame) -> str | None:
-    """Create bar chart of failure rates by product type."""
+def _relative_colors(values: List[float], average: float) -> List[str]:
+    """Red above 1.5x average, orange above average, green otherwise."""
+    return ['#e74c3c' if v > average * 1.5 else '#f39c12' if v > average else '#2ecc71' for v in values]
+
+
+# --- SVG fast path -----------------------------------------------------------
+
+def _svg_document(body: List[str], title: str) -> str:
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{SVG_HEIGHT}" '
+        f'viewBox="0 0 {SVG_WIDTH} {SVG_HEIGHT}" {SVG_FONT}>'
+        f'<rect width="100%" height="100%" fill="white"/>'
+        f'<text x="{SVG_WIDTH / 2}" y="28" text-anchor="middle" font-size="18" font-weight="bold">{escape(title)}</text>'
+        + ''.join(body) + '</svg>'
+    )
+
+
+def _svg_bar_chart(
+    labels: List[str],
+    values: List[float],
+    colors: List[str],
+    title: str,
+    value_label: str,
+    category_label: str,
+    value_format: str = '{:.1f}',
+    reference: float | None = None,
+    reference_label: str | None = None,
+    horizontal: bool = False
+) -> str:
+    """Render a vertical or horizontal bar chart as SVG markup."""
+    left, right, top, bottom = (170, 40, 50, 60) if horizontal else (70, 30, 50, 110)
+    plot_w = SVG_WIDTH - left - right
+    plot_h = SVG_HEIGHT - top - bottom
+
+    low = min(0.0, *values)
+    high = max(0.0, *values, reference or 0.0) * 1.15 or 1.0
+    if low < 0:
+        low *= 1.15
+    span = high - low
+
+    body = []
+    n = len(values)
+    slot = (plot_h if horizontal else plot_w) / n
+    bar = slot * 0.7
+
+    if horizontal:
+        zero_x = left + (0 - low) / span * plot_w
+        for i, (label, value, color) in enumerate(zip(labels, values, colors)):
+            y = top + i * slot + (slot - bar) / 2
+            x = zero_x if value >= 0 else zero_x + value / span * plot_w
+            width = abs(value) / span * plot_w
+            body.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{width:.1f}" height="{bar:.1f}" '
+                        f'fill="{color}" stroke="black"/>')
+            body.append(f'<text x="{left - 8}" y="{y + bar / 2 + 4:.1f}" text-anchor="end" font-size="12">{escape(label)}</text>')
+            text_x = x + width + 4 if value >= 0 else x - 4
+            anchor = 'start' if value >= 0 else 'end'
+            body.append(f'<text x="{text_x:.1f}" y="{y + bar / 2 + 4:.1f}" text-anchor="{anchor}" font-size="11">'
+                        f'{value_format.format(value)}</text>')
+        body.append(f'<line x1="{zero_x:.1f}" y1="{top}" x2="{zero_x:.1f}" y2="{top + plot_h}" stroke="black"/>')
+        body.append(f'<text x="{left + plot_w / 2}" y="{SVG_HEIGHT - 20}" text-anchor="middle" font-size="13">{escape(value_label)}</text>')
+    else:
+        zero_y = top + plot_h - (0 - low) / span * plot_h
+        rotate = n > 6
+        for i, (label, value, color) in enumerate(zip(labels, values, colors)):
+            x = left + i * slot + (slot - bar) / 2
+            height = abs(value) / span * plot_h
+            y = zero_y - height if value >= 0 else zero_y
+            body.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{bar:.1f}" height="{height:.1f}" '
+                        f'fill="{color}" stroke="black"/>')
+            body.append(f'<text x="{x + bar / 2:.1f}" y="{y - 4:.1f}" text-anchor="middle" font-size="11" '
+                        f'font-weight="bold">{value_format.format(value)}</text>')
+            label_y = top + plot_h + 16
+            if rotate:
+                body.append(f'<text x="{x + bar / 2:.1f}" y="{label_y}" text-anchor="end" font-size="11" '
+                            f'transform="rotate(-45 {x + bar / 2:.1f} {label_y})">{escape(label)}</text>')
+            else:
+                body.append(f'<text x="{x + bar / 2:.1f}" y="{label_y}" text-anchor="middle" font-size="12">{escape(label)}</text>')
+        body.append(f'<line x1="{left}" y1="{zero_y:.1f}" x2="{left + plot_w}" y2="{zero_y:.1f}" stroke="black"/>')
+        body.append(f'<line x1="{left}" y1="{top}" x2="{left}" y2="{top + plot_h}" stroke="black"/>')
+        body.append(f'<text x="18" y="{top + plot_h / 2}" text-anchor="middle" font-size="13" '
+                    f'transform="rotate(-90 18 {top + plot_h / 2})">{escape(value_label)}</text>')
+        body.append(f'<text x="{left + plot_w / 2}" y="{SVG_HEIGHT - 8}" text-anchor="middle" font-size="13">{escape(category_label)}</text>')
+        if reference is not None:
+            ref_y = zero_y - reference / span * plot_h
+            body.append(f'<line x1="{left}" y1="{ref_y:.1f}" x2="{left + plot_w}" y2="{ref_y:.1f}" '
+                        f'stroke="red" stroke-width="2" stroke-dasharray="8,4"/>')
+            if reference_label:
+                body.append(f'<text x="{left + plot_w - 4}" y="{ref_y - 6:.1f}" text-anchor="end" font-size="12" '
+                            f'fill="red">{escape(reference_label)}</text>')
+
+    return _svg_document(body, title)
+
+
+def _svg_pie_chart(labels: List[str], values: List[float], title: str) -> str:
+    """Render a pie chart with percentage labels as SVG markup."""
+    cx, cy, radius = SVG_WIDTH / 2 - 80, SVG_HEIGHT / 2 + 20, 170
+    total = float(sum(values))
+    body = []
+    angle = -math.pi / 2
+
+    for i, (label, value) in enumerate(zip(labels, values)):
+        share = value / total
+        sweep = share * 2 * math.pi
+        color = SET3_COLORS[i % len(SET3_COLORS)]
+        if share >= 0.9999:
+            body.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" fill="{color}" stroke="white"/>')
+        else:
+            x1, y1 = cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+            x2, y2 = cx + radius * math.cos(angle + sweep), cy + radius * math.sin(angle + sweep)
+            large = 1 if sweep > math.pi else 0
+            body.append(f'<path d="M{cx},{cy} L{x1:.1f},{y1:.1f} A{radius},{radius} 0 {large} 1 {x2:.1f},{y2:.1f} Z" '
+                        f'fill="{color}" stroke="white" stroke-width="2"/>')
+        mid = angle + sweep / 2
+        body.append(f'<text x="{cx + radius * 0.6 * math.cos(mid):.1f}" y="{cy + radius * 0.6 * math.sin(mid) + 4:.1f}" '
+                    f'text-anchor="middle" font-size="12">{share * 100:.1f}%</text>')
+        legend_y = 70 + i * 22
+        body.append(f'<rect x="{SVG_WIDTH - 220}" y="{legend_y - 11}" width="14" height="14" fill="{color}" stroke="black"/>')
+        body.append(f'<text x="{SVG_WIDTH - 200}" y="{legend_y}" font-size="12">{escape(str(label))}</text>')
+        angle += sweep
+
+    return _svg_document(body, title)
+
+
+# --- Failure rate by product type --------------------------------------------
+
+def aggregate_failure_by_type(df: pd.DataFrame) -> Dict[str, Any] | None:
+    """Failure rate (%) per product type."""
     df = normalize_columns(df)
 
     target_col = _find_column(df, ['target', 'failure'])
@@ -40,38 +194,85 @@ def create_failure_rate_by_type_chart(df: pd.DataFrame) -> str | None:
     if not target_col or not type_col:
         return None
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-
     rates = df.groupby(type_col)[target_col].mean() * 100
+    return {"labels": [str(t) for t in rates.index], "values": [float(r) for r in rates.values]}
+
+
+def failure_by_type_from_rates(by_product_type: Dict[Any, float]) -> Dict[str, Any]:
+    """Build the failure-by-type payload from `analyze_failure_rates` output."""
+    return {
+        "labels": [str(t) for t in by_product_type],
+        "values": [float(r) * 100 for r in by_product_type.values()],
+    }
+
+
+def render_failure_by_type(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render bar chart of failure rates by product type."""
+    if not data or not data["values"]:
+        return None
+
+    labels, rates = data["labels"], data["values"]
     colors = ['#2ecc71' if r < 3 else '#f39c12' if r < 5 else '#e74c3c' for r in rates]
 
-    bars = ax.bar(rates.index, rates.values, color=colors, edgecolor='black')
+    if fmt == "svg":
+        return _svg_to_base64(_svg_bar_chart(
+            labels, rates, colors, 'Failure Rate by Product Type',
+            'Failure Rate (%)', 'Product Type', value_format='{:.1f}%'
+        ))
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
+    bars = ax.bar(labels, rates, color=colors, edgecolor='black')
     ax.set_ylabel('Failure Rate (%)', fontsize=12)
     ax.set_xlabel('Product Type', fontsize=12)
     ax.set_title('Failure Rate by Product Type', fontsize=14, fontweight='bold')
 
     # Add value labels
-    for bar, val in zip(bars, rates.values):
+    for bar, val in zip(bars, rates):
         ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.2,
                 f'{val:.1f}%', ha='center', fontweight='bold')
 
-    ax.set_ylim(0, max(rates.values) * 1.2)
+    ax.set_ylim(0, max(max(rates) * 1.2, 1e-9))
 
     return _fig_to_base64(fig)
 
 
-def create_risk_factors_chart(risk_factors: List[Dict[str, Any]]) -> str | None:
-    """Create horizontal bar chart of risk factor correlations."""
+def create_failure_rate_by_type_chart(df: pd.DataFrame, fmt: str = "png") -> str | None:
+    """Create bar chart of failure rates by product type."""
+    return render_failure_by_type(aggregate_failure_by_type(df), fmt)
+
+
+# --- Risk factors ------------------------------------------------------------
+
+def aggregate_risk_factors(risk_factors: List[Dict[str, Any]], top_n: int = 8) -> Dict[str, Any] | None:
+    """Top correlations from `identify_risk_factors` output."""
     if not risk_factors or 'error' in risk_factors[0]:
         return None
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    return {
+        "labels": [f['factor'].replace('_', ' ')[:20] for f in risk_factors[:top_n]],
+        "values": [float(f['correlation']) for f in risk_factors[:top_n]],
+    }
+
+
+def render_risk_factors(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render horizontal bar chart of risk factor correlations."""
+    if not data or not data["values"]:
+        return None
 
-    # Take top 8 factors
-    factors = [f['factor'].replace('_', ' ')[:20] for f in risk_factors[:8]]
-    correlations = [f['correlation'] for f in risk_factors[:8]]
+    factors, correlations = data["labels"], data["values"]
     colors = ['#e74c3c' if c > 0 else '#3498db' for c in correlations]
 
+    if fmt == "svg":
+        return _svg_to_base64(_svg_bar_chart(
+            factors, correlations, colors, 'Risk Factors: Correlation with Machine Failure',
+            'Correlation with Failure', '', value_format='{:.3f}', horizontal=True
+        ))
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
     ax.barh(factors, correlations, color=colors, edgecolor='black')
     ax.set_xlabel('Correlation with Failure', fontsize=12)
     ax.set_title('Risk Factors: Correlation with Machine Failure', fontsize=14, fontweight='bold')
@@ -84,12 +285,19 @@ def create_risk_factors_chart(risk_factors: List[Dict[str, Any]]) -> str | None:
                 va='center', ha='left' if corr >= 0 else 'right',
                 fontsize=10)
 
-    plt.tight_layout()
+    fig.tight_layout()
     return _fig_to_base64(fig)
 
 
-def create_failure_distribution_chart(df: pd.DataFrame) -> str | None:
-    """Create pie chart of failure type distribution."""
+def create_risk_factors_chart(risk_factors: List[Dict[str, Any]], fmt: str = "png") -> str | None:
+    """Create horizontal bar chart of risk factor correlations."""
+    return render_risk_factors(aggregate_risk_factors(risk_factors), fmt)
+
+
+# --- Failure type distribution -----------------------------------------------
+
+def aggregate_failure_distribution(df: pd.DataFrame) -> Dict[str, Any] | None:
+    """Counts of each failure type among failed records."""
     df = normalize_columns(df)
 
     failure_type_col = _find_column(df, ['failure_type', 'failure_mode', 'defect'])
@@ -100,24 +308,32 @@ def create_failure_distribution_chart(df: pd.DataFrame) -> str | None:
 
     # Filter to only failures if we have a target column
     if target_col:
-        failure_df = df[df[target_col] == 1]
+        failure_types = df.loc[df[target_col] == 1, failure_type_col]
     else:
-        failure_df = df
+        failure_types = df[failure_type_col]
+
+    failure_counts = failure_types.value_counts()
+    return {"labels": [str(t) for t in failure_counts.index], "values": [int(c) for c in failure_counts.values]}
 
-    if len(failure_df) == 0:
+
+def render_failure_distribution(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render pie chart of failure type distribution."""
+    if not data or not data["values"]:
         return None
 
-    fig, ax = plt.subplots(figsize=(10, 8))
+    if fmt == "svg":
+        return _svg_to_base64(_svg_pie_chart(data["labels"], data["values"], 'Distribution of Failure Types'))
 
-    failure_counts = failure_df[failure_type_col].value_counts()
-    colors = plt.cm.Set3(range(len(failure_counts)))
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
 
-    wedges, texts, autotexts = ax.pie(
-        failure_counts.values,
-        labels=failure_counts.index,
+    n = len(data["values"])
+    ax.pie(
+        data["values"],
+        labels=data["labels"],
         autopct='%1.1f%%',
-        colors=colors,
-        explode=[0.03] * len(failure_counts),
+        colors=[SET3_COLORS[i % len(SET3_COLORS)] for i in range(n)],
+        explode=[0.03] * n,
         shadow=True
     )
     ax.set_title('Distribution of Failure Types', fontsize=14, fontweight='bold')
@@ -125,32 +341,309 @@ def create_failure_distribution_chart(df: pd.DataFrame) -> str | None:
     return _fig_to_base64(fig)
 
 
-def create_machine_comparison_chart(df: pd.DataFrame, top_n: int = 10) -> str | None:
-    """Create bar chart comparing top machines by failure rate."""
-    df = normalize_columns(df)
+def create_failure_distribution_chart(df: pd.DataFrame, fmt: str = "png") -> str | None:
+    """Create pie chart of failure type distribution."""
+    return render_failure_distribution(aggregate_failure_distribution(df), fmt)
 
-    target_col = _find_column(df, ['target', 'failure'])
-    product_col = _find_column(df, ['product', 'machine'])
 
-    if not target_col or not product_col:
+# --- Machine comparison ------------------------------------------------------
+
+def aggregate_machine_comparison(
+    df: pd.DataFrame | None,
+    top_n: int = 10,
+    min_samples: int = 1,
+    aggregates: Dict[str, Any] | None = None
+) -> Dict[str, Any] | None:
+    """Top machines by failure rate (%) plus the overall average."""
+    if aggregates is None:
+        df = normalize_columns(df)
+
+        target_col = _find_column(df, ['target', 'failure'])
+        product_col = _find_column(df, ['product', 'machine'])
+
+        if not target_col or not product_col:
+            return None
+
+        aggregates = machine_aggregates(df, target_col, product_col)
+
+    top_machines = rank_machines(aggregates, k=top_n, min_samples=min_samples)
+    if not top_machines:
+        return None
+
+    return {
+        "labels": [str(m["machine_id"]) for m in top_machines],
+        "values": [m["failure_rate"] * 100 for m in top_machines],
+        "overall_avg": float(aggregates["failures"].sum() / max(aggregates["sample_count"].sum(), 1) * 100),
+        "top_n": top_n,
+    }
+
+
+def render_machine_comparison(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render bar chart comparing top machines by failure rate."""
+    if not data or not data["values"]:
         return None
 
-    fig, ax = plt.subplots(figsize=(12, 6))
+    machine_ids, machine_rates = data["labels"], data["values"]
+    overall_avg = data["overall_avg"]
+    colors = _relative_colors(machine_rates, overall_avg)
+    title = f'Top {data["top_n"]} Machines by Failure Rate'
 
-    machine_rates = df.groupby(product_col)[target_col].mean().nlargest(top_n) * 100
-    overall_avg = df[target_col].mean() * 100
+    if fmt == "svg":
+        return _svg_to_base64(_svg_bar_chart(
+            machine_ids, machine_rates, colors, title, 'Failure Rate (%)', 'Machine ID',
+            reference=overall_avg, reference_label=f'Overall Avg: {overall_avg:.1f}%'
+        ))
 
-    colors = ['#e74c3c' if r > overall_avg * 1.5 else '#f39c12' if r > overall_avg else '#2ecc71'
-              for r in machine_rates]
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
 
-    bars = ax.bar(range(len(machine_rates)), machine_rates.values, color=colors, edgecolor='black')
+    ax.bar(range(len(machine_rates)), machine_rates, color=colors, edgecolor='black')
     ax.set_xticks(range(len(machine_rates)))
-    ax.set_xticklabels(machine_rates.index, rotation=45, ha='right')
+    ax.set_xticklabels(machine_ids, rotation=45, ha='right')
     ax.set_ylabel('Failure Rate (%)', fontsize=12)
     ax.set_xlabel('Machine ID', fontsize=12)
-    ax.set_title(f'Top {top_n} Machines by Failure Rate', fontsize=14, fontweight='bold')
+    ax.set_title(title, fontsize=14, fontweight='bold')
     ax.axhline(y=overall_avg, color='red', linestyle='--', linewidth=2, label=f'Overall Avg: {overall_avg:.1f}%')
     ax.legend()
 
-    plt.tight_layout()
+    fig.tight_layout()
+    return _fig_to_base64(fig)
+
+
+def create_machine_comparison_chart(
+    df: pd.DataFrame,
+    top_n: int = 10,
+    min_samples: int = 1,
+    aggregates: Dict[str, Any] | None = None,
+    fmt: str = "png"
+) -> str | None:
+    """Create bar chart comparing top machines by failure rate."""
+    return render_machine_comparison(aggregate_machine_comparison(df, top_n, min_samples, aggregates), fmt)
+
+
+# --- Failure trend -----------------------------------------------------------
+
+def create_failure_trend_chart(trend: List[Dict[str, Any]], granularity: str = "daily") -> str | None:
+    """Create line chart of failure rate over time with record volume bars."""
+    points = [t for t in trend if t.get("failure_rate") is not None]
+    if not points:
+        return None
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+
+    periods = [t["period"] for t in points]
+    rates = [t["failure_rate"] * 100 for t in points]
+    records = [t["records"] for t in points]
+    x = range(len(points))
+
+    volume_ax = ax.twinx()
+    volume_ax.bar(x, records, color='#bdc3c7', alpha=0.5, label='Records')
+    volume_ax.set_ylabel('Records', fontsize=12)
+
+    ax.plot(x, rates, color='#e74c3c', marker='o', linewidth=2, label='Failure Rate')
+    ax.set_zorder(volume_ax.get_zorder() + 1)
+    ax.patch.set_visible(False)
+    ax.set_ylabel('Failure Rate (%)', fontsize=12)
+    ax.set_xlabel('Period', fontsize=12)
+    ax.set_title(f'Failure Rate Trend ({granularity.title()})', fontsize=14, fontweight='bold')
+
+    # Thin out tick labels on long series
+    step = max(1, len(points) // 20)
+    ax.set_xticks(list(x)[::step])
+    ax.set_xticklabels(periods[::step], rotation=45, ha='right')
+
+    fig.tight_layout()
+    return _fig_to_base64(fig)
+
+
+# --- Failure mode correlation heatmap ----------------------------------------
+
+def _diverging_color(value: float | None) -> str:
+    """White at 0 shading to red (+1) or blue (-1); grey for missing values."""
+    if value is None:
+        return '#d9d9d9'
+    t = min(abs(value), 1.0)
+    target = (231, 76, 60) if value > 0 else (52, 152, 219)
+    r, g, b = (round(255 + (c - 255) * t) for c in target)
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def _svg_heatmap(row_labels: List[str], col_labels: List[str], matrix: List[List[float | None]], title: str) -> str:
+    """Render a labelled correlation grid as SVG markup."""
+    left, right, top, bottom = 190, 30, 50, 90
+    cell_w = (SVG_WIDTH - left - right) / len(col_labels)
+    cell_h = (SVG_HEIGHT - top - bottom) / len(row_labels)
+
+    body = []
+    for i, (label, row) in enumerate(zip(row_labels, matrix)):
+        y = top + i * cell_h
+        body.append(f'<text x="{left - 8}" y="{y + cell_h / 2 + 4:.1f}" text-anchor="end" font-size="12">{escape(label)}</text>')
+        for j, value in enumerate(row):
+            x = left + j * cell_w
+            body.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{cell_w:.1f}" height="{cell_h:.1f}" '
+                        f'fill="{_diverging_color(value)}" stroke="white"/>')
+            text = '' if value is None else f'{value:.2f}'
+            body.append(f'<text x="{x + cell_w / 2:.1f}" y="{y + cell_h / 2 + 4:.1f}" text-anchor="middle" '
+                        f'font-size="11">{text}</text>')
+    label_y = SVG_HEIGHT - bottom + 16
+    for j, label in enumerate(col_labels):
+        x = left + j * cell_w + cell_w / 2
+        body.append(f'<text x="{x:.1f}" y="{label_y}" text-anchor="end" font-size="12" '
+                    f'transform="rotate(-30 {x:.1f} {label_y})">{escape(label)}</text>')
+
+    return _svg_document(body, title)
+
+
+def aggregate_failure_mode_heatmap(failure_modes: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Features x failure modes correlation grid from `analyze_failure_modes` output."""
+    correlations = (failure_modes or {}).get("correlations")
+    if not correlations or not correlations["features"]:
+        return None
+
+    return {
+        "features": [f.replace('_', ' ')[:24] for f in correlations["features"]],
+        "modes": [str(m)[:20] for m in correlations["modes"]],
+        "matrix": correlations["matrix"],
+    }
+
+
+def render_failure_mode_heatmap(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render heatmap of feature correlations with each failure mode."""
+    if not data or not data["matrix"]:
+        return None
+
+    title = 'Risk Factors by Failure Mode'
+    features, modes, matrix = data["features"], data["modes"], data["matrix"]
+
+    if fmt == "svg":
+        return _svg_to_base64(_svg_heatmap(features, modes, matrix, title))
+
+    values = [[float('nan') if v is None else v for v in row] for row in matrix]
+    fig = Figure(figsize=(max(8, len(modes) * 1.4), max(5, len(features) * 0.6)))
+    ax = fig.subplots()
+
+    image = ax.imshow(values, cmap='RdBu_r', vmin=-1, vmax=1, aspect='auto')
+    ax.set_xticks(range(len(modes)))
+    ax.set_xticklabels(modes, rotation=30, ha='right')
+    ax.set_yticks(range(len(features)))
+    ax.set_yticklabels(features)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    fig.colorbar(image, ax=ax, label='Correlation')
+
+    for i, row in enumerate(matrix):
+        for j, value in enumerate(row):
+            if value is not None:
+                ax.text(j, i, f'{value:.2f}', ha='center', va='center', fontsize=9)
+
+    fig.tight_layout()
+    return _fig_to_base64(fig)
+
+
+def create_failure_mode_heatmap(failure_modes: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Create heatmap of feature correlations with each failure mode."""
+    return render_failure_mode_heatmap(aggregate_failure_mode_heatmap(failure_modes), fmt)
+
+
+# --- Anomaly ranking ---------------------------------------------------------
+
+def aggregate_anomaly_ranking(anomalies: Dict[str, Any], top_n: int = 10) -> Dict[str, Any] | None:
+    """Top machines by anomaly risk score from `rank_anomalies` output."""
+    machines = (anomalies or {}).get("top_machines")
+    if not machines:
+        return None
+
+    machines = machines[:top_n]
+    return {
+        "labels": [f"{m['machine_id']} ({m['leading_sensor'].replace('_', ' ')[:16]})" for m in machines],
+        "values": [float(m["risk_score"]) for m in machines],
+        "flag_counts": [len(m["flags"]) for m in machines],
+    }
+
+
+def render_anomaly_ranking(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render horizontal bar chart of machines ranked by anomaly risk."""
+    if not data or not data["values"]:
+        return None
+
+    labels, scores = data["labels"], data["values"]
+    colors = ['#e74c3c' if f >= 2 else '#f39c12' if f == 1 else '#2ecc71' for f in data["flag_counts"]]
+    title = 'Machines by Anomaly Risk'
+
+    if fmt == "svg":
+        return _svg_to_base64(_svg_bar_chart(
+            labels, scores, colors, title, 'Risk Score (1.0 = flag threshold)', '',
+            value_format='{:.2f}', horizontal=True
+        ))
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
+    ax.barh(labels, scores, color=colors, edgecolor='black')
+    ax.invert_yaxis()  # Highest risk on top
+    ax.axvline(x=1.0, color='red', linestyle='--', linewidth=2, label='Flag threshold')
+    ax.set_xlabel('Risk Score (1.0 = flag threshold)', fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.legend()
+
+    fig.tight_layout()
     return _fig_to_base64(fig)
+
+
+def create_anomaly_ranking_chart(anomalies: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Create horizontal bar chart of machines ranked by anomaly risk."""
+    return render_anomaly_ranking(aggregate_anomaly_ranking(anomalies), fmt)
+
+
+# --- Plant comparison --------------------------------------------------------
+
+def aggregate_plant_comparison(plants: List[Dict[str, Any]]) -> Dict[str, Any] | None:
+    """Failure rate (%) per plant from batch digests, plus the combined average."""
+    plants = [p for p in plants if p.get("overall_failure_rate") is not None]
+    if not plants:
+        return None
+
+    rates = [p["overall_failure_rate"] * 100 for p in plants]
+    total_records = sum(p.get("records") or 0 for p in plants)
+    total_failures = sum(p.get("total_failures") or 0 for p in plants)
+    return {
+        "labels": [str(p["name"])[:30] for p in plants],
+        "values": rates,
+        "overall_avg": total_failures / total_records * 100 if total_records else sum(rates) / len(rates),
+    }
+
+
+def render_plant_comparison(data: Dict[str, Any], fmt: str = "png") -> str | None:
+    """Render bar chart comparing overall failure rate across plants."""
+    if not data or not data["values"]:
+        return None
+
+    names, rates = data["labels"], data["values"]
+    overall_avg = data["overall_avg"]
+    colors = _relative_colors(rates, overall_avg)
+
+    if fmt == "svg":
+        return _svg_to_base64(_svg_bar_chart(
+            names, rates, colors, 'Failure Rate by Plant', 'Failure Rate (%)', 'Dataset',
+            reference=overall_avg, reference_label=f'Combined Avg: {overall_avg:.1f}%'
+        ))
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+
+    ax.bar(range(len(rates)), rates, color=colors, edgecolor='black')
+    ax.set_xticks(range(len(rates)))
+    ax.set_xticklabels(names, rotation=45, ha='right')
+    ax.set_ylabel('Failure Rate (%)', fontsize=12)
+    ax.set_xlabel('Dataset', fontsize=12)
+    ax.set_title('Failure Rate by Plant', fontsize=14, fontweight='bold')
+    ax.axhline(y=overall_avg, color='red', linestyle='--', linewidth=2, label=f'Combined Avg: {overall_avg:.1f}%')
+    ax.legend()
+
+    fig.tight_layout()
+    return _fig_to_base64(fig)
+
+
+def create_plant_comparison_chart(plants: List[Dict[str, Any]], fmt: str = "png") -> str | None:
+    """Create bar chart comparing overall failure rate across datasets/plants."""
+    return render_plant_comparison(aggregate_plant_comparison(plants), fmt)
@@ -12,6 +12,41 @@ class Settings(BaseSettings):
     data_dir: str = "/data"
     log_level: str = "INFO"
 
+    # Dataset registry (defaults to <data_dir>/.cache)
+    dataset_cache_dir: str = ""
+    # Parsed dataset frames kept in memory (least recently used are evicted)
+    dataset_frame_cache_size: int = 4
+
+    # Approximate analysis on stratified samples above this many rows
+    approx_row_threshold: int = 1_000_000
+    approx_sample_size: int = 200_000
+    approx_min_stratum_size: int = 2_000
+
+    # Minutes between readings when only a sequence column (e.g. UDI) orders the data
+    sequence_interval_minutes: float = 1.0
+
+    # Anomaly scoring: trailing readings per machine for rolling z-scores,
+    # and EWMA span (in readings) for drift
+    anomaly_window: int = 50
+    anomaly_ewma_span: int = 20
+
+    # Worker processes for the batch analysis endpoint
+    batch_workers: int = 4
+
+    # Default chart image format: "png" (matplotlib) or "svg" (fast vector path)
+    chart_format: str = "png"
+
+    # Request profiling (artifacts default to <data_dir>/.profiles)
+    profiling_enabled: bool = False
+    profile_dir: str = ""
+    profile_sample_interval_ms: float = 5.0
+
+    # Background jobs (state defaults to <data_dir>/.jobs)
+    jobs_dir: str = ""
+    job_workers: int = 2
+    # Comma-separated hosts (or host:port) job callbacks may be sent to
+    callback_allowed_hosts: str = "n8n"
+
     class Config:
         env_file = ".env"
         extra = "ignore"
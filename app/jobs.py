@@ -0,0 +1,218 @@
+"""Background job queue for long-running analyses."""
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import settings
+from analysis.data_loader import load_data_from_bytes
+from analysis.registry import registry
+from agent.core import agent
+
+logger = logging.getLogger(__name__)
+
+# Stages a job moves through; "completed" and "failed" are terminal
+JOB_STAGES = ["queued", "parsing", "analyzing", "charting", "llm", "completed", "failed"]
+TERMINAL_STATUSES = {"completed", "failed"}
+CALLBACK_TIMEOUT_SECONDS = 10.0
+CALLBACK_SCHEMES = {"http", "https"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def validate_callback_url(url: str) -> None:
+    """
+    Reject callback URLs that are not http(s) or not on an allowed host.
+
+    Callbacks are sent from the server, so an open target would let clients
+    reach internal services. Hosts come from CALLBACK_ALLOWED_HOSTS; an entry
+    with a port only matches that port.
+    """
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        raise ValueError(f"Invalid callback URL: {url}")
+    if parts.scheme not in CALLBACK_SCHEMES or not host:
+        raise ValueError("Callback URL must be an http or https URL")
+
+    allowed = {h.strip().lower() for h in settings.callback_allowed_hosts.split(",") if h.strip()}
+    if host.lower() not in allowed and (port is None or f"{host.lower()}:{port}" not in allowed):
+        raise ValueError(f"Callback host not allowed: {host}")
+
+
+class JobManager:
+    """
+    Runs analyses on a bounded worker pool with state persisted to disk.
+
+    Each job keeps its status document, uploaded input and result as files
+    under `jobs_dir`, so unfinished jobs are re-queued after a restart.
+    """
+
+    def __init__(self, jobs_dir: str | None = None, max_workers: int | None = None):
+        self.jobs_dir = Path(jobs_dir or settings.jobs_dir or Path(settings.data_dir) / ".jobs")
+        self.max_workers = max_workers or settings.job_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Lazy initialization of the worker pool."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        return self._executor
+
+    def _path(self, job_id: str, suffix: str) -> Path:
+        return self.jobs_dir / f"{job_id}{suffix}"
+
+    def _write_json(self, path: Path, data: Dict[str, Any]) -> None:
+        """Write JSON atomically so a crash never leaves a partial file."""
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(data, default=str))
+        tmp_path.replace(path)
+
+    def _update(self, job_id: str, **changes: Any) -> Dict[str, Any]:
+        with self._lock:
+            job = self.get(job_id)
+            job.update(changes, updated_at=_now())
+            self._write_json(self._path(job_id, ".json"), job)
+            return job
+
+    def submit(
+        self,
+        filename: Optional[str] = None,
+        content: Optional[bytes] = None,
+        dataset_id: Optional[str] = None,
+        callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Persist a new job and queue it; returns the job status immediately.
+
+        Raises ValueError for a callback URL that is not allowed.
+        """
+        if callback_url:
+            validate_callback_url(callback_url)
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": "queued",
+            "filename": filename,
+            "dataset_id": dataset_id,
+            "callback_url": callback_url,
+            "session_id": None,
+            "error": None,
+            "created_at": _now(),
+            "updated_at": _now(),
+        }
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        if content is not None:
+            self._path(job_id, ".input").write_bytes(content)
+        self._write_json(self._path(job_id, ".json"), job)
+
+        self.executor.submit(self._run, job_id)
+        logger.info(f"Queued job {job_id}")
+        return job
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        """Return a job's status document."""
+        try:
+            return json.loads(self._path(job_id, ".json").read_text())
+        except FileNotFoundError:
+            raise KeyError(f"Unknown job: {job_id}")
+
+    def result(self, job_id: str) -> Dict[str, Any] | None:
+        """Return a completed job's analysis result, or None if not available."""
+        try:
+            return json.loads(self._path(job_id, ".result.json").read_text())
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return status documents for all known jobs, newest first."""
+        jobs = []
+        for path in self.jobs_dir.glob("*.json"):
+            if path.name.endswith(".result.json"):
+                continue
+            try:
+                jobs.append(json.loads(path.read_text()))
+            except (OSError, json.JSONDecodeError):
+                continue
+        return sorted(jobs, key=lambda j: j["created_at"], reverse=True)
+
+    def recover(self) -> int:
+        """Re-queue jobs left unfinished by a previous run. Returns how many."""
+        recovered = 0
+        for job in self.list():
+            if job["status"] in TERMINAL_STATUSES:
+                continue
+            self._update(job["job_id"], status="queued", stage="queued")
+            self.executor.submit(self._run, job["job_id"])
+            recovered += 1
+        if recovered:
+            logger.info(f"Re-queued {recovered} unfinished jobs")
+        return recovered
+
+    def _run(self, job_id: str) -> None:
+        """Execute one job through parsing, analysis, charting and the LLM loop."""
+        try:
+            job = self._update(job_id, status="running", stage="parsing")
+
+            profile = sketches = anomaly_state = None
+            if job["dataset_id"]:
+                df = registry.load(job["dataset_id"])
+                profile = registry.profile(job["dataset_id"])
+                sketches = registry.sketches(job["dataset_id"])
+                anomaly_state = registry.anomaly_state(job["dataset_id"])
+            else:
+                content = self._path(job_id, ".input").read_bytes()
+                df = load_data_from_bytes(content, job["filename"])
+            logger.info(f"Job {job_id}: loaded {len(df)} rows")
+
+            self._update(job_id, stage="analyzing")
+            result = agent.create_analysis(
+                df,
+                on_progress=lambda stage: self._update(job_id, stage=stage),
+                profile=profile,
+                sketches=sketches,
+                anomaly_state=anomaly_state
+            )
+            if "error" in result:
+                raise RuntimeError(result["error"])
+
+            self._write_json(self._path(job_id, ".result.json"), {**result, "insights": []})
+            job = self._update(job_id, status="completed", stage="completed", session_id=result["session_id"])
+            self._path(job_id, ".input").unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+            job = self._update(job_id, status="failed", stage="failed", error=str(e))
+
+        if job.get("callback_url"):
+            self._send_callback(job)
+
+    def _send_callback(self, job: Dict[str, Any]) -> None:
+        """POST the final job status (and result, if any) to the callback URL."""
+        payload = {**job, "result": self.result(job["job_id"])}
+        try:
+            # Jobs recovered from disk may predate the current allowlist
+            validate_callback_url(job["callback_url"])
+            response = httpx.post(job["callback_url"], json=payload, timeout=CALLBACK_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            self._update(job["job_id"], callback_status="delivered")
+        except Exception as e:
+            logger.warning(f"Callback for job {job['job_id']} failed: {e}")
+            self._update(job["job_id"], callback_status=f"failed: {e}")
+
+
+# Global job manager instance
+job_manager = JobManager()
@@ -1,12 +1,26 @@
 """FastAPI application for Production Line Health Advisor."""
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import uuid
+from fastapi.responses import StreamingResponse, FileResponse
+import asyncio
 import logging
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List, Optional
 
-from models.schemas import AnalysisResponse, ChatRequest, ChatResponse, HealthResponse
-from analysis.data_loader import load_csv_from_bytes, validate_production_data, get_summary_stats
+from models.schemas import (
+    AnalysisResponse, ChatRequest, ChatResponse, HealthResponse,
+    DatasetRegisterRequest, DatasetInfo, JobStatus, ProfilingSettings
+)
+from analysis.data_loader import load_data_from_bytes, detect_file_format
+from analysis.registry import registry
+from analysis.batch import get_process_pool, reset_process_pool, analyze_dataset, summarize_for_llm, to_ndjson_line
+from analysis.visualizations import create_plant_comparison_chart
 from agent.core import agent
+from jobs import job_manager, validate_callback_url
+from profiling import profiler, process_metrics, valid_request_id
 
 # Configure logging
 logging.basicConfig(
@@ -15,11 +29,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Resume background jobs left unfinished by a previous run."""
+    job_manager.recover()
+    yield
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Production Line Health Advisor",
     description="AI-powered analysis agent for manufacturing data. Uses Ollama (local LLM) - no API keys needed!",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -31,6 +54,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints that can be profiled per request
+PROFILED_PATHS = {"/webhook/analyze", "/webhook/chat"}
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile analyze/chat requests sent with `X-Profile: 1` or while profiling is enabled."""
+    # Every request is counted so profiles can report how many overlapped them
+    profiler.request_started()
+    try:
+        return await _profile_request(request, call_next)
+    finally:
+        profiler.request_finished()
+
+
+async def _profile_request(request: Request, call_next):
+    wants_profile = profiler.enabled or request.headers.get("x-profile", "").lower() in ("1", "true", "yes")
+    if request.url.path not in PROFILED_PATHS or not wants_profile:
+        return await call_next(request)
+
+    request_id = request.headers.get("x-request-id")
+    if not valid_request_id(request_id):
+        request_id = str(uuid.uuid4())
+    session = profiler.start(request_id)
+    if session is None:
+        response = await call_next(request)
+        response.headers["X-Profile-Status"] = "busy"
+        return response
+
+    saved = False
+    try:
+        response = await call_next(request)
+    finally:
+        # A failed artifact write must not replace the request's own response
+        try:
+            summary = profiler.stop(session)
+            saved = True
+            logger.info(f"Profiled {request.url.path} as {request_id} ({summary['duration_seconds']}s)")
+        except Exception as e:
+            logger.error(f"Saving profile {request_id} failed: {e}", exc_info=True)
+    if saved:
+        response.headers["X-Profile-ID"] = request_id
+    else:
+        response.headers["X-Profile-Status"] = "failed"
+    return response
+
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -42,51 +111,98 @@ async def health_check():
     )
 
 
-@app.post("/webhook/analyze", response_model=AnalysisResponse)
-async def analyze_csv(file: UploadFile = File(...)):
+@app.post("/datasets", response_model=DatasetInfo)
+async def register_dataset(request: DatasetRegisterRequest):
     """
-    Analyze an uploaded CSV file.
+    Register a file already stored under the data directory.
 
-    Upload a production/manufacturing CSV and get an AI-powered health report
-    with visualizations and actionable insights.
+    The file is fingerprinted and parsed once; analyses can then reference it
+    by `dataset_id` instead of re-uploading it.
     """
-    logger.info(f"Received file: {file.filename}")
+    try:
+        return DatasetInfo(**registry.register(request.path))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-    # Validate file type
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files accepted")
+@app.get("/datasets", response_model=List[DatasetInfo])
+async def list_datasets():
+    """List registered datasets."""
+    return [DatasetInfo(**record) for record in registry.list()]
 
+
+@app.get("/datasets/{dataset_id}", response_model=DatasetInfo)
+async def get_dataset(dataset_id: str):
+    """Get metadata for a registered dataset."""
     try:
-        # Read and parse CSV
-        contents = await file.read()
-        df = load_csv_from_bytes(contents)
-        logger.info(f"Loaded CSV with {len(df)} rows, {len(df.columns)} columns")
+        return DatasetInfo(**registry.get(dataset_id))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
 
-        # Validate schema (warning only)
-        valid, message = validate_production_data(df)
-        if not valid:
-            logger.warning(f"Schema validation warning: {message}")
 
-        # Create session and load data
-        session_id = str(uuid.uuid4())
-        agent.load_data(session_id, df)
-        logger.info(f"Created session: {session_id}")
+@app.post("/webhook/analyze", response_model=AnalysisResponse)
+async def analyze_csv(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None)
+):
+    """
+    Analyze an uploaded data file or a registered dataset.
+
+    Upload a production/manufacturing CSV (optionally gzip/zstd compressed),
+    Parquet or Arrow/Feather file, or pass the `dataset_id` of a registered
+    dataset, and get an AI-powered health report with visualizations and
+    actionable insights.
+    """
+    if file is None and not dataset_id:
+        raise HTTPException(status_code=400, detail="Provide a file upload or a dataset_id")
+
+    if file is not None:
+        logger.info(f"Received file: {file.filename}")
+
+        # Validate file type
+        if not file.filename or detect_file_format(file.filename) is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Only CSV (.csv, .csv.gz, .csv.zst), Parquet or Arrow/Feather files accepted"
+            )
+
+    try:
+        if file is not None:
+            # Read and parse, keeping only the columns the analyses use
+            contents = await file.read()
+            try:
+                df = load_data_from_bytes(contents, file.filename)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            logger.info(f"Loaded {file.filename} with {len(df)} rows, {len(df.columns)} columns")
+        else:
+            try:
+                df = registry.load(dataset_id)
+                # Registered datasets were profiled and sketched at ingestion
+                profile, sketches = registry.profile(dataset_id), registry.sketches(dataset_id)
+                anomaly_state = registry.anomaly_state(dataset_id)
+            except (KeyError, FileNotFoundError) as e:
+                raise HTTPException(status_code=404, detail=str(e.args[0]))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            logger.info(f"Loaded dataset {dataset_id} with {len(df)} rows, {len(df.columns)} columns")
 
-        # Run initial analysis
-        result = agent.run_initial_analysis(session_id)
+        if file is None:
+            result = agent.create_analysis(df, profile=profile, sketches=sketches, anomaly_state=anomaly_state)
+        else:
+            result = agent.create_analysis(df)
 
         if "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
 
-        # Get summary stats
-        stats = get_summary_stats(df)
-
         return AnalysisResponse(
-            session_id=session_id,
-            summary=result.get("response", "Analysis complete"),
+            session_id=result["session_id"],
+            summary=result["summary"],
             insights=[],  # Could parse from response if needed
-            charts=result.get("charts", []),
-            raw_stats=stats
+            charts=result["charts"],
+            raw_stats=result["raw_stats"]
         )
 
     except HTTPException:
@@ -96,6 +212,194 @@ async def analyze_csv(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+@app.post("/webhook/analyze/batch")
+async def analyze_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    dataset_ids: Optional[List[str]] = Form(None)
+):
+    """
+    Analyze many data files and/or registered datasets in one request.
+
+    Datasets are parsed and analyzed in parallel across a process pool. The
+    response is NDJSON: one `result` (or `error`) line per dataset as soon as
+    it finishes, then a single `summary` line with a consolidated cross-plant
+    LLM report and a shared comparison chart.
+    """
+    loop = asyncio.get_running_loop()
+    jobs = []
+    for file in files or []:
+        if not file.filename or detect_file_format(file.filename) is None:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+        jobs.append((file.filename, {"content": await file.read()}))
+    for dataset_id in dataset_ids or []:
+        try:
+            # source_path stats the file and may re-parse a changed one, so keep it off the event loop
+            path = await loop.run_in_executor(None, registry.source_path, dataset_id)
+            jobs.append((registry.get(dataset_id)["path"], {"path": path}))
+        except (KeyError, FileNotFoundError) as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if not jobs:
+        raise HTTPException(status_code=400, detail="Provide at least one file or dataset_id")
+
+    logger.info(f"Batch analysis of {len(jobs)} datasets")
+
+    async def stream_results():
+        pool = get_process_pool()
+
+        async def run(index: int, name: str, source: dict) -> dict:
+            try:
+                result = await loop.run_in_executor(pool, partial(analyze_dataset, name, **source))
+                return {"type": "result", "index": index, **result}
+            except BrokenProcessPool as e:
+                logger.error(f"Batch analysis of {name} failed: worker pool broke ({str(e)})")
+                reset_process_pool(pool)
+                return {"type": "error", "index": index, "name": name, "message": "Worker process died; retry the batch"}
+            except Exception as e:
+                logger.error(f"Batch analysis of {name} failed: {str(e)}")
+                return {"type": "error", "index": index, "name": name, "message": str(e)}
+
+        results = []
+        for next_done in asyncio.as_completed([run(i, name, source) for i, (name, source) in enumerate(jobs)]):
+            record = await next_done
+            if record["type"] == "result":
+                results.append(record)
+            yield to_ndjson_line(record)
+
+        summary = {"type": "summary", "datasets": len(jobs), "succeeded": len(results), "summary": "", "charts": []}
+        if results:
+            digests = [summarize_for_llm(r) for r in sorted(results, key=lambda r: r["index"])]
+            chart = await loop.run_in_executor(None, create_plant_comparison_chart, digests)
+            if chart:
+                summary["charts"].append(chart)
+            llm_result = await loop.run_in_executor(None, agent.summarize_batch, digests)
+            summary["summary"] = llm_result.get("response", "")
+            if "error" in llm_result:
+                summary["error"] = llm_result["error"]
+        yield to_ndjson_line(summary)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/analyze", response_model=JobStatus, status_code=202)
+async def submit_analysis_job(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None)
+):
+    """
+    Queue an analysis and return a job ID immediately.
+
+    Poll `/jobs/{job_id}` for progress and fetch `/jobs/{job_id}/result` when
+    it completes, or pass `callback_url` to receive the result by POST.
+    """
+    if file is None and not dataset_id:
+        raise HTTPException(status_code=400, detail="Provide a file upload or a dataset_id")
+
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if file is not None:
+        if not file.filename or detect_file_format(file.filename) is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Only CSV (.csv, .csv.gz, .csv.zst), Parquet or Arrow/Feather files accepted"
+            )
+        job = job_manager.submit(filename=file.filename, content=await file.read(), callback_url=callback_url)
+    else:
+        try:
+            registry.get(dataset_id)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+        job = job_manager.submit(dataset_id=dataset_id, callback_url=callback_url)
+
+    return JobStatus(**job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Get the status and current stage of a background job."""
+    try:
+        return JobStatus(**job_manager.get(job_id))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+
+@app.get("/jobs/{job_id}/result", response_model=AnalysisResponse)
+async def get_job_result(job_id: str):
+    """Get the analysis result of a completed background job."""
+    try:
+        job = job_manager.get(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {job['error']}")
+    result = job_manager.result(job_id)
+    if job["status"] != "completed" or result is None:
+        raise HTTPException(status_code=409, detail=f"Job not complete (stage: {job['stage']})")
+
+    return AnalysisResponse(**result)
+
+
+@app.get("/admin/profiling", response_model=ProfilingSettings)
+async def get_profiling():
+    """Whether every analyze/chat request is currently profiled."""
+    return ProfilingSettings(enabled=profiler.enabled)
+
+
+@app.post("/admin/profiling", response_model=ProfilingSettings)
+async def set_profiling(request: ProfilingSettings):
+    """Turn profiling of every analyze/chat request on or off."""
+    profiler.enabled = request.enabled
+    logger.info(f"Request profiling {'enabled' if request.enabled else 'disabled'}")
+    return ProfilingSettings(enabled=profiler.enabled)
+
+
+@app.get("/admin/metrics")
+async def get_metrics():
+    """Process memory, threads and in-memory session state, for load tests and monitoring."""
+    sessions = list(agent.sessions.values())
+    return {
+        **process_metrics(),
+        "sessions": len(sessions),
+        "chart_payload_bytes": sum(s["conversation"].payloads.total_bytes for s in sessions),
+    }
+
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    """List stored request profiles."""
+    return {"profiles": profiler.list()}
+
+
+@app.get("/admin/profiles/{request_id}")
+async def get_profile(request_id: str):
+    """Profile summary: duration, memory, allocation spans, top allocators and functions."""
+    try:
+        return profiler.summary(request_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+
+@app.get("/admin/profiles/{request_id}/{kind}")
+async def download_profile(request_id: str, kind: str):
+    """Download a profile as `pstats` (for pstats/snakeviz) or `collapsed` stacks (for flamegraphs)."""
+    if kind not in ("pstats", "collapsed"):
+        raise HTTPException(status_code=400, detail="Profile kind must be 'pstats' or 'collapsed'")
+    try:
+        path = profiler.artifact(request_id, kind)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    media_type = "text/plain" if kind == "collapsed" else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=path.name)
+
+
 @app.post("/webhook/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
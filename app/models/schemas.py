@@ -24,6 +24,42 @@ class ChatResponse(BaseModel):
     charts: Optional[List[str]] = None
 
 
+class DatasetRegisterRequest(BaseModel):
+    """Request to register a file already under the data directory."""
+    path: str  # relative to data_dir
+
+
+class DatasetInfo(BaseModel):
+    """Metadata for a registered dataset."""
+    dataset_id: str
+    path: str
+    fingerprint: str
+    size_bytes: int
+    rows: int
+    columns: List[str]
+    registered_at: str
+
+
+class JobStatus(BaseModel):
+    """Status of a background analysis job."""
+    job_id: str
+    status: str  # queued, running, completed, failed
+    stage: str  # queued, parsing, analyzing, charting, llm, completed, failed
+    filename: Optional[str] = None
+    dataset_id: Optional[str] = None
+    callback_url: Optional[str] = None
+    callback_status: Optional[str] = None
+    session_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+class ProfilingSettings(BaseModel):
+    """Request/response for toggling profiling of every analyze/chat request."""
+    enabled: bool
+
+
 class HealthResponse(BaseModel):
     """Response from health check endpoint."""
     status: str
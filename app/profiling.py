@@ -0,0 +1,263 @@
+"""On-demand CPU and allocation profiling of individual requests."""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEMALLOC_FRAMES = 25
+TOP_ENTRIES = 25
+PROCESS_START = time.time()
+# Request IDs become artifact file names, so only plain identifiers are accepted
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_request_id(request_id: str | None) -> bool:
+    return bool(request_id) and REQUEST_ID_PATTERN.match(request_id) is not None
+
+
+def _frame_label(frame) -> str:
+    """Collapsed-stack label for a frame: module:function."""
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+class ProfileSession:
+    """
+    Profile of one request: cProfile, a stack sampler and tracemalloc.
+
+    The sampler reads the profiled thread's stack every `interval` seconds
+    (like py-spy) and counts collapsed stacks for flamegraphs. Allocation
+    spans record net and peak traced memory for named code regions.
+
+    cProfile and tracemalloc see the whole process, so work done for other
+    requests during the session lands in the profile too. The summary's
+    `overlap` section records how many other requests were in flight and the
+    most threads seen, so a contaminated profile can be recognised.
+    """
+
+    def __init__(self, request_id: str, profile_dir: Path, interval_ms: float):
+        self.request_id = request_id
+        self.profile_dir = profile_dir
+        self.interval = interval_ms / 1000
+        self.thread_id = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.spans: Dict[str, Dict[str, Any]] = {}
+        self._peak_stack: List[int] = [0]
+        self.concurrent_requests = 0
+        self.max_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._profiler = cProfile.Profile()
+        self._sampler = threading.Thread(target=self._sample, name=f"profile-{request_id}", daemon=True)
+        self._started_tracemalloc = False
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start_memory = tracemalloc.get_traced_memory()[0]
+        self._start_time = time.perf_counter()
+        self._sampler.start()
+        self._profiler.enable()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.max_threads = max(self.max_threads, threading.active_count())
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def record_span(self, name: str, net_bytes: int, peak_bytes: int) -> None:
+        span = self.spans.setdefault(name, {"calls": 0, "net_bytes": 0, "max_peak_bytes": 0})
+        span["calls"] += 1
+        span["net_bytes"] += net_bytes
+        span["max_peak_bytes"] = max(span["max_peak_bytes"], peak_bytes)
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop profiling and write pstats, collapsed stacks and a summary."""
+        self._profiler.disable()
+        duration = time.perf_counter() - self._start_time
+        self._stop.set()
+        self._sampler.join()
+
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, self._peak_stack[0])
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self._profiler.dump_stats(self.profile_dir / f"{self.request_id}.pstats")
+        (self.profile_dir / f"{self.request_id}.collapsed").write_text(
+            "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        )
+
+        stats_text = io.StringIO()
+        pstats.Stats(self._profiler, stream=stats_text).sort_stats("cumulative").print_stats(TOP_ENTRIES)
+
+        summary = {
+            "request_id": self.request_id,
+            "duration_seconds": round(duration, 4),
+            "samples": sum(self.stacks.values()),
+            "memory": {
+                "peak_bytes": peak - self._start_memory,
+                "retained_bytes": current - self._start_memory,
+            },
+            "overlap": {
+                "concurrent_requests": self.concurrent_requests,
+                "max_threads": self.max_threads,
+            },
+            "allocation_spans": self.spans,
+            "top_allocators": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[:TOP_ENTRIES]
+            ],
+            "top_functions": stats_text.getvalue(),
+        }
+        (self.profile_dir / f"{self.request_id}.json").write_text(json.dumps(summary, indent=2))
+        return summary
+
+
+class Profiler:
+    """Coordinates profiling: one request at a time, opt-in per request or globally."""
+
+    def __init__(self, profile_dir: str | None = None):
+        self.profile_dir = Path(profile_dir or settings.profile_dir or Path(settings.data_dir) / ".profiles")
+        self.enabled = settings.profiling_enabled
+        self.active: Optional[ProfileSession] = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def request_started(self) -> None:
+        """Count a request in flight; it overlaps the active profile, if any."""
+        with self._lock:
+            self.in_flight += 1
+            if self.active is not None:
+                self.active.concurrent_requests += 1
+
+    def request_finished(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def start(self, request_id: str) -> Optional[ProfileSession]:
+        """Start a session, or return None if another request is being profiled."""
+        if not valid_request_id(request_id):
+            raise ValueError(f"Invalid profile request ID: {request_id!r}")
+        with self._lock:
+            if self.active is not None:
+                return None
+            self.active = ProfileSession(request_id, self.profile_dir, settings.profile_sample_interval_ms)
+            # Requests already running overlap from the start; the caller's own is not counted
+            self.active.concurrent_requests = max(self.in_flight - 1, 0)
+        self.active.start()
+        return self.active
+
+    def stop(self, session: ProfileSession) -> Dict[str, Any]:
+        try:
+            return session.stop()
+        finally:
+            with self._lock:
+                self.active = None
+
+    def _safe_path(self, request_id: str, suffix: str) -> Path:
+        path = (self.profile_dir / f"{request_id}{suffix}").resolve()
+        if path.parent != self.profile_dir.resolve():
+            raise KeyError(f"Unknown profile: {request_id}")
+        if not path.exists():
+            raise KeyError(f"Unknown profile: {request_id}")
+        return path
+
+    def summary(self, request_id: str) -> Dict[str, Any]:
+        return json.loads(self._safe_path(request_id, ".json").read_text())
+
+    def artifact(self, request_id: str, kind: str) -> Path:
+        """Path to a stored 'pstats' or 'collapsed' profile."""
+        return self._safe_path(request_id, f".{kind}")
+
+    def list(self) -> List[str]:
+        return sorted(p.stem for p in self.profile_dir.glob("*.json"))
+
+
+@contextmanager
+def allocation_span(name: str):
+    """
+    Record net and peak traced memory for a code region while profiling.
+
+    A no-op unless the current thread is being profiled.
+    """
+    session = profiler.active
+    if session is None or session.thread_id != threading.get_ident() or not tracemalloc.is_tracing():
+        yield
+        return
+
+    start_current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    session._peak_stack.append(0)
+    try:
+        yield
+    finally:
+        end_current, peak = tracemalloc.get_traced_memory()
+        # reset_peak() in nested spans hides their peaks from us, so fold them back in
+        peak = max(peak, session._peak_stack.pop())
+        session._peak_stack[-1] = max(session._peak_stack[-1], peak)
+        session.record_span(name, end_current - start_current, peak - start_current)
+
+
+def process_memory() -> Dict[str, int | None]:
+    """Current and peak resident set size of this process, in bytes."""
+    memory: Dict[str, int | None] = {"rss_bytes": None, "peak_rss_bytes": None}
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            key, _, value = line.partition(":")
+            if key == "VmRSS":
+                memory["rss_bytes"] = int(value.split()[0]) * 1024
+            elif key == "VmHWM":
+                memory["peak_rss_bytes"] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+
+    if memory["peak_rss_bytes"] is None:
+        # No /proc (e.g. macOS): only the peak is available, in bytes there and KiB on Linux
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return memory
+
+
+def process_metrics() -> Dict[str, Any]:
+    """Process-level resource usage: memory, threads and uptime."""
+    return {
+        **process_memory(),
+        "threads": threading.active_count(),
+        "traced_bytes": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        "uptime_seconds": round(time.time() - PROCESS_START, 3),
+    }
+
+
+# Global profiler instance
+profiler = Profiler()
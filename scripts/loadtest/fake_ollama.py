@@ -0,0 +1,164 @@
+"""
+Fake Ollama server for load testing without a GPU or network.
+
+Answers `/api/chat` with canned tool-call sequences after a configurable
+delay, and `/api/tags` so `/health` reports Ollama as connected. Point the
+app at it with `OLLAMA_HOST=http://localhost:11435`.
+
+Each request is answered from a script keyed by conversation phase: the
+first user message is the upload analysis ("analyze"), later ones are
+follow-up chats ("chat"). The step within a phase is the number of
+assistant replies since the last user message, so a script of
+[tool call, tool call, text] drives the agent loop through two tool
+rounds and a final answer. Steps past the end repeat the last step.
+
+Usage:
+    python scripts/loadtest/fake_ollama.py --port 11435 --latency-ms 200 --jitter-ms 100
+    python scripts/loadtest/fake_ollama.py --script my_script.json --error-rate 0.01
+
+A script file is JSON of the form {"analyze": [step, ...], "chat": [step, ...]},
+where each step is {"content": "..."} and/or
+{"tool_calls": [{"name": "analyze_data", "arguments": {...}}]}.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Any
+
+DEFAULT_SCRIPT = {
+    "analyze": [
+        {"tool_calls": [{"name": "analyze_data", "arguments": {"analysis_type": "all"}}]},
+        {"tool_calls": [{"name": "create_chart", "arguments": {"chart_type": "failure_by_type"}}]},
+        {"content": "## Production Line Health Report\n\nOverall failure rate is within range; "
+                    "heat dissipation failures lead. Review the flagged machines first."},
+    ],
+    "chat": [
+        {"tool_calls": [{"name": "analyze_data", "arguments": {"analysis_type": "high_risk_machines"}}]},
+        {"content": "The highest-risk machines are listed above; schedule inspections for the top three."},
+    ],
+}
+
+
+def pick_step(script: Dict[str, List[Dict[str, Any]]], messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Choose the canned reply for a conversation from its phase and position."""
+    user_turns = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+    phase = "analyze" if len(user_turns) <= 1 else "chat"
+    since_user = messages[user_turns[-1] + 1:] if user_turns else messages
+    step = sum(1 for m in since_user if m.get("role") == "assistant")
+    steps = script.get(phase) or script["analyze"]
+    return steps[min(step, len(steps) - 1)]
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Threaded HTTP server holding the script, latency settings and counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, script, latency_ms: float, jitter_ms: float, error_rate: float, model: str):
+        super().__init__(address, Handler)
+        self.script = script
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.model = model
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def count(self, error: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: FakeOllama
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model, "model": self.server.model}]})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        server = self.server
+        started = time.perf_counter()
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        if random.random() < server.error_rate:
+            server.count(error=True)
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        step = pick_step(server.script, request.get("messages", []))
+        elapsed_ns = int((time.perf_counter() - started) * 1e9)
+        server.count(error=False)
+        self._send_json(200, {
+            "model": request.get("model", server.model),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {
+                "role": "assistant",
+                "content": step.get("content", ""),
+                "tool_calls": [
+                    {"function": {"name": call["name"], "arguments": call.get("arguments", {})}}
+                    for call in step.get("tool_calls", [])
+                ] or None,
+            },
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": elapsed_ns,
+            "eval_count": len(step.get("content", "").split()),
+        })
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the output under load
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=200, help="Fixed delay per chat call")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Extra uniform random delay per chat call")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of chat calls answered with HTTP 500")
+    parser.add_argument("--script", type=Path, help="JSON file of canned steps (default: built-in script)")
+    parser.add_argument("--model", default="llama3.1")
+    args = parser.parse_args()
+
+    script = json.loads(args.script.read_text()) if args.script else DEFAULT_SCRIPT
+    server = FakeOllama(
+        (args.host, args.port), script, args.latency_ms, args.jitter_ms, args.error_rate, args.model
+    )
+    print(f"Fake Ollama listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms:g}+{args.jitter_ms:g}ms, error rate {args.error_rate:g})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {server.requests} chat calls ({server.errors} injected errors)")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
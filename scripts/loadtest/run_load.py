@@ -0,0 +1,221 @@
+"""
+Load test for the analyze and chat endpoints.
+
+Runs virtual users at a fixed concurrency. Each user uploads a data file to
+`/webhook/analyze`, then sends follow-up messages to `/webhook/chat` on the
+returned session. A background task samples `/admin/metrics` so the
+report shows how server memory grows with sessions. Pair it with
+`fake_ollama.py` to measure the app itself without a GPU.
+
+Usage:
+    python scripts/loadtest/run_load.py --concurrency 8 --users 40 --chats 3
+    python scripts/loadtest/run_load.py --concurrency 16 --duration 60 --json-out load.json
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint, and
+resident memory and session count over time.
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import httpx
+
+PROJECT_DIR = Path(__file__).resolve().parents[2]
+SAMPLE_FILE = PROJECT_DIR / "data" / "sample" / "predictive_maintenance.csv"
+CHAT_MESSAGES = [
+    "Which machines have the highest failure risk?",
+    "What are the main risk factors?",
+    "Show me the failure breakdown by type.",
+]
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class LoadTest:
+    """Virtual users, per-request results and server metric samples for one run."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.payload = args.file.read_bytes()
+        self.results: List[Dict[str, Any]] = []
+        self.samples: List[Dict[str, Any]] = []
+        self.users_started = 0
+        self.started = 0.0
+        self.finished = 0.0
+
+    async def _request(self, client: httpx.AsyncClient, endpoint: str, **kwargs) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        status, error, body = None, None, None
+        try:
+            response = await client.post(endpoint, **kwargs)
+            status = response.status_code
+            if response.is_success:
+                body = response.json()
+            else:
+                error = f"HTTP {status}"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        self.results.append({
+            "endpoint": endpoint,
+            "start": start - self.started,
+            "latency": time.perf_counter() - start,
+            "status": status,
+            "error": error,
+        })
+        return body
+
+    def _next_user(self) -> bool:
+        """Claim the next virtual user, or False when the run is over."""
+        if self.args.duration:
+            if time.perf_counter() - self.started >= self.args.duration:
+                return False
+        elif self.users_started >= self.args.users:
+            return False
+        self.users_started += 1
+        return True
+
+    async def _worker(self, client: httpx.AsyncClient) -> None:
+        while self._next_user():
+            body = await self._request(
+                client, "/webhook/analyze",
+                files={"file": (self.args.file.name, self.payload, "text/csv")}
+            )
+            if body is None:
+                continue
+            for i in range(self.args.chats):
+                await self._request(client, "/webhook/chat", json={
+                    "session_id": body["session_id"],
+                    "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)],
+                })
+
+    async def _sample_metrics(self, client: httpx.AsyncClient, stop: asyncio.Event) -> None:
+        while True:
+            try:
+                response = await client.get("/admin/metrics")
+                if response.is_success:
+                    self.samples.append({"t": round(time.perf_counter() - self.started, 2), **response.json()})
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.metrics_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> None:
+        limits = httpx.Limits(max_connections=self.args.concurrency + 1)
+        async with httpx.AsyncClient(base_url=self.args.url, timeout=self.args.timeout, limits=limits) as client:
+            stop = asyncio.Event()
+            self.started = time.perf_counter()
+            sampler = asyncio.create_task(self._sample_metrics(client, stop))
+            await asyncio.gather(*(self._worker(client) for _ in range(self.args.concurrency)))
+            self.finished = time.perf_counter()
+            stop.set()
+            await sampler
+
+    def report(self) -> Dict[str, Any]:
+        wall = self.finished - self.started
+        endpoints = {}
+        for endpoint in sorted({r["endpoint"] for r in self.results}):
+            results = [r for r in self.results if r["endpoint"] == endpoint]
+            ok = sorted(r["latency"] for r in results if r["error"] is None)
+            errors = [r["error"] for r in results if r["error"] is not None]
+            endpoints[endpoint] = {
+                "requests": len(results),
+                "errors": len(errors),
+                "error_rate": round(len(errors) / len(results), 4),
+                "error_kinds": {kind: errors.count(kind) for kind in sorted(set(errors))},
+                "throughput_rps": round(len(results) / wall, 3) if wall else None,
+                **{f"p{p}_seconds": percentile(ok, p) for p in PERCENTILES},
+                "max_seconds": ok[-1] if ok else None,
+            }
+
+        rss = [s["rss_bytes"] or s["peak_rss_bytes"] for s in self.samples]
+        return {
+            "config": {
+                "url": self.args.url,
+                "concurrency": self.args.concurrency,
+                "users": self.users_started,
+                "chats_per_user": self.args.chats,
+                "file": str(self.args.file),
+            },
+            "wall_seconds": round(wall, 3),
+            "total_requests": len(self.results),
+            "throughput_rps": round(len(self.results) / wall, 3) if wall else None,
+            "endpoints": endpoints,
+            "memory": {
+                "start_rss_bytes": rss[0] if rss else None,
+                "end_rss_bytes": rss[-1] if rss else None,
+                "max_rss_bytes": max(rss) if rss else None,
+                "samples": [
+                    {k: s.get(k) for k in ("t", "rss_bytes", "peak_rss_bytes", "sessions", "chart_payload_bytes", "threads")}
+                    for s in self.samples
+                ],
+            },
+        }
+
+
+def _mb(value: Optional[int]) -> str:
+    return f"{value / 2**20:.1f} MB" if value is not None else "n/a"
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    config = report["config"]
+    print(f"\n{report['total_requests']} requests from {config['users']} users at concurrency "
+          f"{config['concurrency']} in {report['wall_seconds']}s ({report['throughput_rps']} req/s)\n")
+    print(f"{'endpoint':<18}{'requests':>9}{'errors':>8}{'err %':>7}{'req/s':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<18}{stats['requests']:>9}{stats['errors']:>8}{stats['error_rate'] * 100:>7.1f}"
+              f"{stats['throughput_rps']:>8}{_ms(stats['p50_seconds']):>9}{_ms(stats['p95_seconds']):>9}"
+              f"{_ms(stats['p99_seconds']):>9}{_ms(stats['max_seconds']):>9}")
+        for kind, count in stats["error_kinds"].items():
+            print(f"    {kind}: {count}")
+
+    memory = report["memory"]
+    print(f"\nServer RSS: start {_mb(memory['start_rss_bytes'])}, end {_mb(memory['end_rss_bytes'])}, "
+          f"max {_mb(memory['max_rss_bytes'])}")
+    for sample in memory["samples"]:
+        print(f"  t={sample['t']:>7.1f}s  rss {_mb(sample['rss_bytes']):>10}  sessions {sample['sessions']:>5}"
+              f"  charts {_mb(sample['chart_payload_bytes']):>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000", help="App base URL")
+    parser.add_argument("--file", type=Path, default=SAMPLE_FILE, help="Data file each user uploads")
+    parser.add_argument("--concurrency", type=int, default=4, help="Virtual users running at once")
+    parser.add_argument("--users", type=int, default=20, help="Total virtual users (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="Keep starting users for this many seconds")
+    parser.add_argument("--chats", type=int, default=2, help="Chat messages per user after the upload")
+    parser.add_argument("--metrics-interval", type=float, default=1.0, help="Seconds between /admin/metrics samples")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json-out", type=Path, help="Also write the full report as JSON")
+    args = parser.parse_args()
+
+    test = LoadTest(args)
+    asyncio.run(test.run())
+    report = test.report()
+    print_report(report)
+    if args.json_out:
+        args.json_out.write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
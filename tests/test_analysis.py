@@ -1,4 +1,10 @@
 """Unit tests for analysis modules."""
+import base64
+import gzip
+import io
+import json
+import os
+import xml.etree.ElementTree as ET
 import pytest
 import pandas as pd
 import numpy as np
@@ -10,19 +16,47 @@ sys.path.insert(0, str(Path(__file__).parent.parent / 'app'))
 
 from analysis.data_loader import (
     load_csv_from_bytes,
+    load_data_from_bytes,
+    detect_file_format,
     validate_production_data,
     get_summary_stats,
-    normalize_columns
+    normalize_columns,
+    build_dataset_profile,
+    build_sketches
 )
 from analysis.production import (
     analyze_failure_rates,
     identify_risk_factors,
-    get_high_risk_machines
+    get_high_risk_machines,
+    compute_machine_aggregates,
+    analyze_failure_modes
 )
+from analysis.batch import analyze_dataset, summarize_for_llm, to_ndjson_line, get_process_pool, reset_process_pool
+from analysis.ranking import top_k_indices, rank_machines
+from analysis.registry import DatasetRegistry
+from analysis.sampling import (
+    stratified_sample,
+    build_sample,
+    approximate_failure_rates,
+    approximate_risk_factors,
+    approximate_high_risk_machines
+)
+from analysis.sketches import KLLSketch, HyperLogLog, DatasetSketches
+from analysis.anomaly import build_anomaly_state, update_anomaly_state, rank_anomalies
+from analysis.timeseries import build_rollups, window_failure_rates, failure_trend
 from analysis.visualizations import (
     create_failure_rate_by_type_chart,
     create_risk_factors_chart,
-    create_machine_comparison_chart
+    create_machine_comparison_chart,
+    create_failure_trend_chart,
+    create_plant_comparison_chart,
+    create_failure_distribution_chart,
+    create_failure_mode_heatmap,
+    create_anomaly_ranking_chart,
+    aggregate_failure_by_type,
+    render_failure_by_type,
+    aggregate_machine_comparison,
+    render_machine_comparison
 )
 
 
@@ -57,6 +91,39 @@ class TestDataLoader:
         assert len(loaded_df) == len(sample_df)
         assert list(loaded_df.columns) == list(sample_df.columns)
 
+    def test_detect_file_format(self):
+        """Test upload format detection from filenames."""
+        assert detect_file_format('plant.csv') == ('csv', None)
+        assert detect_file_format('plant.CSV.GZ') == ('csv', 'gzip')
+        assert detect_file_format('plant.csv.zst') == ('csv', 'zstd')
+        assert detect_file_format('plant.parquet') == ('parquet', None)
+        assert detect_file_format('plant.feather') == ('arrow', None)
+        assert detect_file_format('plant.xlsx') is None
+
+    def test_load_compressed_csv_projects_columns(self, sample_df):
+        """Test gzip CSV loading drops columns the analyses never use."""
+        df = sample_df.assign(Operator_Notes='checked')
+        csv_bytes = df.to_csv(index=False).encode('utf-8')
+        loaded_df = load_data_from_bytes(gzip.compress(csv_bytes), 'plant.csv.gz')
+        assert len(loaded_df) == len(sample_df)
+        assert 'Operator_Notes' not in loaded_df.columns
+        assert list(loaded_df.columns) == list(sample_df.columns)
+
+    def test_load_parquet_and_arrow(self, sample_df):
+        """Test Parquet and Arrow IPC uploads load the same frame."""
+        pytest.importorskip('pyarrow')
+        for filename, writer in [('plant.parquet', sample_df.to_parquet),
+                                 ('plant.feather', sample_df.to_feather)]:
+            buf = io.BytesIO()
+            writer(buf)
+            loaded_df = load_data_from_bytes(buf.getvalue(), filename)
+            pd.testing.assert_frame_equal(loaded_df, sample_df)
+
+    def test_load_unsupported_format(self):
+        """Test unsupported uploads raise ValueError."""
+        with pytest.raises(ValueError):
+            load_data_from_bytes(b'data', 'plant.xlsx')
+
     def test_validate_production_data_valid(self, sample_df):
         """Test validation with valid production data."""
         valid, message = validate_production_data(sample_df)
@@ -75,6 +142,43 @@ class TestDataLoader:
         assert 'failure_rate' in stats
         assert 0 <= stats['failure_rate'] <= 1
 
+    def test_build_dataset_profile(self, sample_df):
+        """Test the ingestion profile and the stats and validation read from it."""
+        df = sample_df.rename(columns={'Torque_Nm': 'Torque [Nm]'})
+        df.loc[:4, 'Torque [Nm]'] = np.nan
+        profile = build_dataset_profile(df)
+        assert json.loads(json.dumps(profile)) == profile
+
+        assert profile['roles']['target'] == 'Target'
+        assert profile['roles']['machine'] == 'Product_ID'
+        torque = profile['column_profiles']['Torque_Nm']
+        assert torque['nulls'] == 5
+        assert torque['quantiles']['p50'] == pytest.approx(df['Torque [Nm]'].median())
+        assert profile['column_profiles']['Type']['cardinality'] == 3
+        assert set(profile['column_profiles']['Type']['samples']) == {'L', 'M', 'H'}
+
+        stats = get_summary_stats(df, profile)
+        assert stats['failure_rate'] == pytest.approx(df['Target'].mean())
+        assert stats['total_failures'] == df['Target'].sum()
+        assert stats['unique_machines'] == df['Product_ID'].nunique()
+        assert validate_production_data(None, profile) == validate_production_data(df)
+
+        # Registry datasets pass their sketches; estimates agree with the exact profile
+        sketched = build_dataset_profile(df, build_sketches(df))
+        assert sketched['column_profiles']['Type']['cardinality'] == 3
+        assert sketched['column_profiles']['Torque_Nm']['quantiles']['p50'] == pytest.approx(torque['quantiles']['p50'], rel=0.05)
+
+    def test_colliding_normalized_names(self, sample_df):
+        """Test raw names that normalize alike keep separate, suffixed columns."""
+        df = sample_df.assign(**{'Torque (Nm)': sample_df['Torque_Nm'] * 2, 'Torque_Nm_2': 0.0})
+        df = df.rename(columns={'Torque_Nm': 'Torque [Nm]'})
+        profile = build_dataset_profile(df)
+        assert profile['columns'] == list(normalize_columns(df).columns)
+        assert {'Torque_Nm', 'Torque_Nm_3', 'Torque_Nm_2'} <= set(profile['columns'])
+        assert profile['column_profiles']['Torque_Nm']['mean'] == pytest.approx(df['Torque [Nm]'].mean())
+        assert profile['column_profiles']['Torque_Nm_3']['mean'] == pytest.approx(df['Torque (Nm)'].mean())
+        assert profile['column_profiles']['Torque_Nm_2']['mean'] == 0.0
+
     def test_normalize_columns(self):
         """Test column normalization."""
         df = pd.DataFrame({'Air temperature [K]': [1, 2], 'Process (temp)': [3, 4]})
@@ -83,6 +187,58 @@ class TestDataLoader:
         assert 'Process_temp' in normalized.columns
 
 
+class TestDatasetRegistry:
+    """Tests for registry module."""
+
+    def test_register_and_load(self, sample_df, tmp_path):
+        """Test registering a file and loading it by ID."""
+        sample_df.to_csv(tmp_path / 'plant.csv', index=False)
+        registry = DatasetRegistry(data_dir=str(tmp_path))
+        record = registry.register('plant.csv')
+        assert record['rows'] == 100
+        assert len(record['fingerprint']) == 64
+        loaded_df = registry.load(record['dataset_id'])
+        assert list(loaded_df.columns) == list(sample_df.columns)
+        # A fresh registry picks up the persisted index and sketches
+        reopened = DatasetRegistry(data_dir=str(tmp_path))
+        assert reopened.get(record['dataset_id'])['rows'] == 100
+        assert reopened.sketches(record['dataset_id']).rows == 100
+
+    def test_reparse_on_mtime_change(self, sample_df, tmp_path):
+        """Test a changed source file is re-parsed on load."""
+        path = tmp_path / 'plant.csv'
+        sample_df.to_csv(path, index=False)
+        registry = DatasetRegistry(data_dir=str(tmp_path))
+        record = registry.register('plant.csv')
+        sample_df.head(40).to_csv(path, index=False)
+        os.utime(path, ns=(path.stat().st_atime_ns, record['mtime_ns'] + 10**9))
+        assert len(registry.load(record['dataset_id'])) == 40
+        assert registry.profile(record['dataset_id'])['row_count'] == 40
+        assert registry.get(record['dataset_id'])['fingerprint'] != record['fingerprint']
+
+    def test_failed_parse_is_not_registered(self, sample_df, tmp_path):
+        """Test an unparseable file leaves no record, and parsed frames are LRU-bounded."""
+        (tmp_path / 'broken.parquet').write_bytes(b'not a parquet file')
+        registry = DatasetRegistry(data_dir=str(tmp_path), max_frames=1)
+        with pytest.raises(ValueError):
+            registry.register('broken.parquet')
+        assert registry.list() == []
+        assert DatasetRegistry(data_dir=str(tmp_path)).list() == []
+
+        for name in ('a.csv', 'b.csv'):
+            sample_df.to_csv(tmp_path / name, index=False)
+        first, second = registry.register('a.csv'), registry.register('b.csv')
+        assert list(registry._frames) == [second['dataset_id']]
+        assert len(registry.load(first['dataset_id'])) == 100
+        assert list(registry._frames) == [first['dataset_id']]
+
+    def test_rejects_paths_outside_data_dir(self, tmp_path):
+        """Test registration is confined to the data directory."""
+        registry = DatasetRegistry(data_dir=str(tmp_path / 'data'))
+        with pytest.raises(ValueError):
+            registry.register('../secrets.csv')
+
+
 class TestProduction:
     """Tests for production analysis module."""
 
@@ -108,6 +264,354 @@ class TestProduction:
         machines = get_high_risk_machines(sample_df, threshold=0.0)
         assert isinstance(machines, list)
         # With threshold=0, should return machines with any failures
+        rates = [m['failure_rate'] for m in machines]
+        assert rates == sorted(rates, reverse=True)
+        assert all(r > 0 for r in rates)
+
+    def test_get_high_risk_machines_top_k_options(self, sample_df):
+        """Test top-K, min-sample and precomputed-aggregate options."""
+        aggregates = compute_machine_aggregates(sample_df)
+        top3 = get_high_risk_machines(sample_df, threshold=-1, top_k=3, aggregates=aggregates)
+        assert len(top3) == 3
+        assert top3 == get_high_risk_machines(sample_df, threshold=-1)[:3]
+        assert get_high_risk_machines(sample_df, threshold=-1, min_samples=1000) == []
+
+    def test_analyze_failure_modes(self, sample_df):
+        """Test per-mode rates and the features x modes correlation matrix."""
+        df = sample_df.drop(columns=['Failure_Type'])
+        np.random.seed(7)
+        for flag in ('TWF', 'HDF', 'PWF', 'OSF', 'RNF'):
+            df[flag] = np.random.choice([0, 1], len(df), p=[0.9, 0.1])
+
+        result = analyze_failure_modes(df, top_k=3)
+        assert result['failure_modes'] == ['Target', 'TWF', 'HDF', 'PWF', 'OSF', 'RNF']
+        assert result['overall_rates']['HDF'] == pytest.approx(df['HDF'].mean())
+        assert result['by_product_type']['L']['TWF'] == pytest.approx(df[df['Type'] == 'L']['TWF'].mean())
+        assert all(len(m) <= 3 for m in result['high_risk_machines'].values())
+
+        corr = result['correlations']
+        assert 'TWF' not in corr['features']
+        i, j = corr['features'].index('Torque_Nm'), corr['modes'].index('OSF')
+        assert corr['matrix'][i][j] == pytest.approx(df['Torque_Nm'].corr(df['OSF']), abs=1e-4)
+
+    def test_analyze_failure_modes_from_failure_type(self, sample_df):
+        """Test failure type labels are one-hot encoded when there are no flag columns."""
+        result = analyze_failure_modes(sample_df)
+        assert result['failure_modes'][0] == 'Target'
+        assert set(result['failure_modes'][1:]) == {'Heat Dissipation', 'Tool Wear'}
+        assert 'Failure_Type' not in result['correlations']['features']
+
+
+class TestRanking:
+    """Tests for ranking module."""
+
+    def test_top_k_indices_matches_full_sort(self):
+        """Test partial selection returns the same top-K as a full sort."""
+        scores = np.random.default_rng(3).random(10_000)
+        expected = np.argsort(-scores)[:25]
+        np.testing.assert_array_equal(top_k_indices(scores, 25), expected)
+        assert len(top_k_indices(scores, 25, mask=scores > 0.999)) <= 25
+
+    def test_top_k_ties_at_cutoff_use_tiebreak(self):
+        """Test ties at the k-th score are resolved by the tiebreak, not the partition."""
+        scores = np.array([0.5] * 50 + [0.9])
+        tiebreak = np.zeros(51)
+        tiebreak[[7, 42]] = [2.0, 3.0]
+        np.testing.assert_array_equal(top_k_indices(scores, 3, tiebreak=tiebreak), [50, 42, 7])
+        # Without a tiebreak, tied entries keep index order
+        np.testing.assert_array_equal(top_k_indices(scores, 3), [50, 0, 1])
+
+    def test_high_risk_threshold_null_or_invalid(self, sample_df):
+        """Test a null threshold falls back to the default and out-of-range values are rejected."""
+        from agent.tools import execute_tool
+        args = {'analysis_type': 'high_risk_machines', 'threshold': None}
+        assert execute_tool('analyze_data', args, sample_df, {})['type'] == 'analysis'
+        result = execute_tool('analyze_data', {**args, 'threshold': 5}, sample_df, {})
+        assert result['type'] == 'error'
+
+    def test_rank_machines_threshold_and_min_samples(self):
+        """Test thresholds and minimum sample counts filter the ranking."""
+        aggregates = {
+            'machine_id': np.array(['A', 'B', 'C', 'D']),
+            'failures': np.array([1.0, 5.0, 2.0, 0.0]),
+            'sample_count': np.array([1, 50, 10, 40]),
+        }
+        ranked = rank_machines(aggregates, k=10, threshold=0.05, min_samples=5)
+        assert [m['machine_id'] for m in ranked] == ['C', 'B']
+        assert ranked[0]['failure_rate'] == pytest.approx(0.2)
+
+
+class TestSampling:
+    """Tests for sampling module."""
+
+    @pytest.fixture
+    def large_df(self):
+        """20k-row frame with a failure rate that depends on torque."""
+        rng = np.random.default_rng(7)
+        n = 20_000
+        torque = rng.normal(40, 10, n)
+        return pd.DataFrame({
+            'Product_ID': [f'M{i:03d}' for i in rng.integers(1, 21, n)],
+            'Type': rng.choice(['L', 'M', 'H'], n, p=[0.5, 0.3, 0.2]),
+            'Torque_Nm': torque,
+            'Target': (rng.random(n) < 0.01 + 0.1 * (torque > 55)).astype(int),
+        })
+
+    def test_stratified_sample_weights(self, large_df):
+        """Test per-stratum allocation and weights reproduce stratum sizes."""
+        sample = stratified_sample(large_df, ['Type', 'Target'], 2_000, min_stratum_size=300)
+        assert len(sample) < len(large_df)
+        assert sample['_weight'].sum() == pytest.approx(len(large_df))
+        # Rare failure strata are topped up to the minimum
+        assert (sample['Target'] == 1).sum() >= 300
+
+    def test_approximate_matches_exact(self, large_df):
+        """Test sampled estimates are close to the exact analysis and carry CIs."""
+        sample_info = build_sample(large_df, 4_000, min_stratum_size=500)
+        exact = analyze_failure_rates(large_df)
+        approx = approximate_failure_rates(sample_info)
+        assert approx['approximate'] is True
+        assert approx['overall_failure_rate'] == pytest.approx(exact['overall_failure_rate'])
+
+        factors = approximate_risk_factors(sample_info)
+        exact_torque = next(f for f in identify_risk_factors(large_df) if f['factor'] == 'Torque_Nm')
+        assert factors[0]['factor'] == 'Torque_Nm'
+        assert factors[0]['ci_low'] <= exact_torque['correlation'] <= factors[0]['ci_high']
+
+        machines = approximate_high_risk_machines(sample_info, threshold=0.0)
+        assert all(m['ci_low'] <= m['failure_rate'] <= m['ci_high'] for m in machines)
+        assert approx['total_machines'] == exact['total_machines']
+
+    def test_sampled_ranking_uses_effective_sample_size(self):
+        """Test a machine seen only through one oversampled failure row cannot top the ranking."""
+        frame = pd.DataFrame({
+            'Product_ID': ['GOOD'] * 200 + ['LOW'] * 400 + ['ONE'],
+            'Target': [1] * 80 + [0] * 520 + [1],
+            '_weight': [5.0] * 600 + [1.0],
+        })
+        sample_info = {'frame': frame, 'population': 3001, 'strata': ['Target']}
+        machines = approximate_high_risk_machines(sample_info, threshold=0.05, min_samples=5)
+        assert [m['machine_id'] for m in machines] == ['GOOD']
+        assert machines[0]['effective_samples'] == pytest.approx(200)
+        assert list(approximate_failure_rates(sample_info, min_samples=5)['high_risk_machines']) == ['GOOD']
+
+
+class TestSketches:
+    """Tests for sketches module."""
+
+    def test_kll_quantiles_and_merge(self):
+        """Test KLL quantiles stay within the rank error bound, also after a merge."""
+        values = np.random.default_rng(0).normal(40, 10, 200_000)
+        left, right = KLLSketch(), KLLSketch(seed=1)
+        for chunk in np.array_split(values[:100_000], 10):
+            left.update(chunk)
+        right.update(values[100_000:])
+        merged = KLLSketch.from_dict(json.loads(json.dumps(left.to_dict()))).merge(right)
+
+        ordered = np.sort(values)
+        assert merged.count == len(values)
+        assert merged.quantile(0) == ordered[0] and merged.quantile(1) == ordered[-1]
+        assert sum(len(level) for level in merged.levels) < 1000
+        for q in (0.01, 0.5, 0.9, 0.99):
+            assert abs(np.searchsorted(ordered, merged.quantile(q)) / len(values) - q) < 0.01
+
+    def test_hyperloglog_estimate_and_merge(self):
+        """Test HyperLogLog distinct counts for small and large cardinalities."""
+        small = HyperLogLog()
+        small.update(['M001', 'M002', 'M003', 'M001', None])
+        assert small.estimate() == 3
+
+        ids = pd.Series([f'M{i}' for i in range(50_000)])
+        left, right = HyperLogLog(), HyperLogLog()
+        left.update(ids[:30_000])
+        right.update(ids[20_000:])
+        assert left.merge(right).estimate() == pytest.approx(50_000, rel=0.05)
+        with pytest.raises(ValueError):
+            left.merge(HyperLogLog(precision=10))
+
+    def test_dataset_sketches_per_failure_class(self, sample_df):
+        """Test chunked dataset sketches match one pass and split by failure class."""
+        sketches = build_sketches(sample_df, chunk_rows=17)
+        assert sketches.rows == 100
+        assert sketches.distinct('Product_ID') == sample_df['Product_ID'].nunique()
+
+        summary = sketches.summary(['torque'], [0.5])
+        torque = summary['distributions']['Torque_Nm']
+        assert list(summary['distributions']) == ['Torque_Nm']
+        assert torque['failure']['count'] == sample_df['Target'].sum()
+        assert torque['Tool Wear']['count'] == (sample_df['Failure_Type'] == 'Tool Wear').sum()
+        assert 'No Failure' not in torque
+        # Small inputs are kept exactly, so quantiles match a full sort
+        assert torque['all']['p50'] == np.quantile(sample_df['Torque_Nm'], 0.5, method='inverted_cdf')
+
+        restored = DatasetSketches.from_dict(json.loads(json.dumps(sketches.to_dict())))
+        merged = restored.merge(build_sketches(sample_df))
+        assert merged.rows == 200
+        assert merged.summary(['torque'])['distributions']['Torque_Nm']['all']['count'] == 200
+
+
+class TestAnomaly:
+    """Tests for anomaly module."""
+
+    @pytest.fixture
+    def sensor_df(self):
+        """20 machines x 200 readings, with machine M07's torque drifting upward at the end."""
+        rng = np.random.default_rng(3)
+        n = 4000
+        df = pd.DataFrame({
+            'UDI': np.arange(1, n + 1),
+            'Product_ID': [f'M{i:02d}' for i in rng.integers(0, 20, n)],
+            'Air_temperature_K': rng.normal(300, 2, n),
+            'Torque_Nm': rng.normal(40, 10, n),
+            'Rotational_speed_rpm': rng.normal(1500, 100, n),
+            'Target': (rng.random(n) < 0.03).astype(int),
+        })
+        drifting = (df['Product_ID'] == 'M07') & (df['UDI'] > n - 400)
+        df.loc[drifting, 'Torque_Nm'] += np.linspace(10, 30, drifting.sum())
+        return df
+
+    def test_rank_anomalies_finds_drifting_machine(self, sensor_df):
+        """Test a machine with a drifting sensor ranks first and is flagged."""
+        result = rank_anomalies(build_anomaly_state(sensor_df), top_k=5)
+        top = result['top_machines'][0]
+        assert top['machine_id'] == 'M07'
+        assert top['leading_sensor'] == 'Torque_Nm'
+        assert 'drift' in top['flags'] and top['risk_score'] >= 1
+        assert result['sensors'] == ['Air_temperature_K', 'Torque_Nm', 'Rotational_speed_rpm']
+        assert build_anomaly_state(sensor_df.drop(columns=['Product_ID'])) is None
+
+    def test_incremental_update_matches_full_pass(self, sensor_df):
+        """Test feeding data in two batches gives the same scores as one pass."""
+        full = build_anomaly_state(sensor_df)
+        state = build_anomaly_state(sensor_df.iloc[:2500])
+        update_anomaly_state(state, sensor_df.iloc[2500:])
+        assert state.rows == full.rows
+        for name, values in full.scores().items():
+            order = full.machine_ids.get_indexer(state.machine_ids)
+            np.testing.assert_allclose(state.scores()[name], values[order], atol=1e-9)
+
+    def test_registry_folds_appended_rows(self, sensor_df, tmp_path, monkeypatch):
+        """Test rows appended to a registered CSV update the anomaly state without a rebuild."""
+        import analysis.registry as registry_module
+        path = tmp_path / 'plant.csv'
+        sensor_df.iloc[:2500].to_csv(path, index=False)
+        registry = DatasetRegistry(data_dir=str(tmp_path))
+        dataset_id = registry.register('plant.csv')['dataset_id']
+        before = registry.anomaly_state(dataset_id)
+
+        builds = []
+        monkeypatch.setattr(registry_module, 'build_anomaly_state', lambda df: builds.append(df))
+        sensor_df.iloc[2500:].to_csv(path, mode='a', header=False, index=False)
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+        after = registry.anomaly_state(dataset_id)
+
+        assert builds == []
+        assert before.rows == 2500 and after.rows == 4000
+        full = build_anomaly_state(registry.load(dataset_id))
+        order = full.machine_ids.get_indexer(after.machine_ids)
+        np.testing.assert_allclose(after.scores()['drift'], full.scores()['drift'][order], atol=1e-9)
+
+
+class TestTimeseries:
+    """Tests for timeseries module."""
+
+    @pytest.fixture
+    def timed_df(self, sample_df):
+        """Sample data with one reading every 3 hours over 12.5 days."""
+        timestamps = pd.date_range('2026-01-01', periods=len(sample_df), freq='3h')
+        return sample_df.assign(Timestamp=timestamps.astype(str))
+
+    def test_build_rollups(self, timed_df):
+        """Test rollups preserve record, failure and sensor totals."""
+        rollups = build_rollups(timed_df)
+        assert rollups['synthetic_time'] is False
+        assert rollups['time_source'] == 'Timestamp'
+        for table in ('hourly', 'daily'):
+            assert rollups[table]['records'].sum() == 100
+            assert rollups[table]['failures'].sum() == timed_df['Target'].sum()
+            assert rollups[table]['Torque_Nm'].sum() == pytest.approx(timed_df['Torque_Nm'].sum())
+
+    def test_null_machines_and_bad_timestamps(self, timed_df):
+        """Test null machine IDs stay in the totals and unparseable timestamps are reported."""
+        df = timed_df.copy()
+        df.loc[:9, 'Product_ID'] = None
+        df.loc[10:12, 'Timestamp'] = 'not a date'
+        rollups = build_rollups(df)
+        assert rollups['hourly']['records'].sum() == 97
+        assert rollups['dropped_rows'] == 3
+        result = window_failure_rates(rollups, '30d', '30d')
+        assert result['current']['records'] == 97
+        assert result['rows_without_timestamp'] == 3
+
+    def test_sensor_means_skip_missing_readings(self, timed_df):
+        """Test sensor means divide by non-null readings, not by record count."""
+        df = timed_df.assign(Torque_Nm=[40.0, np.nan] * 50)
+        rollups = build_rollups(df)
+        result = window_failure_rates(rollups, '30d', '30d')
+        assert result['current']['sensor_means']['Torque_Nm'] == pytest.approx(40.0)
+        assert all(t['sensor_means']['Torque_Nm'] == pytest.approx(40.0) for t in failure_trend(rollups, 'daily'))
+
+    def test_time_and_sequence_column_detection(self, timed_df):
+        """Test numeric 'time' columns are skipped and 'audio' is not a UDI column."""
+        df = timed_df.assign(Cycle_time_s=np.arange(100.0), Audio_level=np.ones(100))
+        df = df[['Cycle_time_s', *timed_df.columns, 'Audio_level']]
+        rollups = build_rollups(df)
+        assert rollups['time_source'] == 'Timestamp'
+        assert 'Audio_level' in rollups['sensors']
+        assert 'UDI' not in rollups['sensors']
+        assert build_rollups(pd.DataFrame({'Date': ['2026-01-01'] * 2, 'Timestamp': ['2026-01-02'] * 2,
+                                           'Target': [0, 1]}))['time_source'] == 'Timestamp'
+
+    def test_window_failure_rates_match_raw(self, timed_df):
+        """Test window answers equal a direct computation on the raw rows."""
+        result = window_failure_rates(build_rollups(timed_df), '24h', '7d', top_k=3)
+        times = pd.to_datetime(timed_df['Timestamp'])
+        last_day = timed_df[times > times.max() - pd.Timedelta('24h')]
+        assert result['current']['records'] == len(last_day)
+        assert result['current']['failures'] == last_day['Target'].sum()
+        assert result['baseline']['records'] == 56
+        assert len(result['top_machines']) <= 3
+
+    def test_sequence_fallback_and_trend(self, sample_df):
+        """Test UDI ordering stands in for missing timestamps."""
+        rollups = build_rollups(sample_df, sequence_interval_minutes=60)
+        assert rollups['synthetic_time'] is True
+        assert rollups['time_source'] == 'UDI'
+        trend = failure_trend(rollups, 'daily')
+        assert len(trend) == 5
+        assert sum(t['records'] for t in trend) == 100
+
+
+class TestBatch:
+    """Tests for batch module."""
+
+    def test_analyze_dataset_from_bytes_and_path(self, sample_df, tmp_path):
+        """Test the worker returns the same JSON-safe result for bytes and paths."""
+        csv_bytes = sample_df.to_csv(index=False).encode('utf-8')
+        (tmp_path / 'plant.csv').write_bytes(csv_bytes)
+        from_bytes = analyze_dataset('plant.csv', content=csv_bytes)
+        from_path = analyze_dataset('plant.csv', path=str(tmp_path / 'plant.csv'))
+        assert from_bytes == from_path
+        assert from_bytes['raw_stats']['total_records'] == 100
+        assert json.loads(to_ndjson_line(from_bytes)) == from_bytes
+
+    def test_summarize_for_llm(self, sample_df):
+        """Test the LLM digest keeps headline numbers and trims detail."""
+        result = analyze_dataset('plant.csv', content=sample_df.to_csv(index=False).encode('utf-8'))
+        digest = summarize_for_llm(result)
+        assert digest['records'] == 100
+        assert len(digest['top_risk_factors']) <= 3
+        assert len(digest['high_risk_machines']) <= 5
+
+    def test_reset_process_pool(self):
+        """Test a broken pool is replaced and a stale reset keeps the new pool."""
+        broken = get_process_pool()
+        reset_process_pool(broken)
+        fresh = get_process_pool()
+        assert fresh is not broken
+        reset_process_pool(broken)
+        assert get_process_pool() is fresh
+        reset_process_pool(fresh)
 
 
 class TestVisualizations:
@@ -133,6 +637,59 @@ class TestVisualizations:
         assert chart is not None
         assert chart.startswith('data:image/png;base64,')
 
+    def test_create_failure_trend_chart(self, sample_df):
+        """Test failure trend chart generation from rollups."""
+        trend = failure_trend(build_rollups(sample_df, sequence_interval_minutes=60), 'hourly')
+        chart = create_failure_trend_chart(trend, 'hourly')
+        assert chart is not None
+        assert chart.startswith('data:image/png;base64,')
+
+    def test_create_plant_comparison_chart(self, sample_df):
+        """Test cross-plant comparison chart generation."""
+        csv_bytes = sample_df.to_csv(index=False).encode('utf-8')
+        digests = [summarize_for_llm(analyze_dataset(name, content=csv_bytes)) for name in ('a.csv', 'b.csv')]
+        chart = create_plant_comparison_chart(digests)
+        assert chart is not None
+        assert chart.startswith('data:image/png;base64,')
+
+    def test_aggregate_then_render(self, sample_df):
+        """Test renderers only need the small aggregate payload."""
+        data = aggregate_failure_by_type(sample_df)
+        assert data['labels'] == sorted(sample_df['Type'].unique())
+        assert json.loads(json.dumps(data)) == data
+        assert render_failure_by_type(data) == create_failure_rate_by_type_chart(sample_df)
+
+        machines = aggregate_machine_comparison(sample_df, top_n=5)
+        assert len(machines['values']) == 5
+        assert render_machine_comparison(machines).startswith('data:image/png;base64,')
+
+    def test_svg_fast_path(self, sample_df):
+        """Test bar and pie charts render as standalone SVG."""
+        for chart in (create_failure_rate_by_type_chart(sample_df, fmt='svg'),
+                      create_machine_comparison_chart(sample_df, fmt='svg'),
+                      create_risk_factors_chart(identify_risk_factors(sample_df), fmt='svg'),
+                      create_failure_distribution_chart(sample_df, fmt='svg')):
+            assert chart.startswith('data:image/svg+xml;base64,')
+            svg = base64.b64decode(chart.split(',', 1)[1]).decode('utf-8')
+            assert ET.fromstring(svg).tag.endswith('svg')
+
+    def test_create_failure_mode_heatmap(self, sample_df):
+        """Test the failure mode heatmap renders as PNG and SVG."""
+        failure_modes = analyze_failure_modes(sample_df)
+        assert create_failure_mode_heatmap(failure_modes).startswith('data:image/png;base64,')
+        chart = create_failure_mode_heatmap(failure_modes, fmt='svg')
+        svg = base64.b64decode(chart.split(',', 1)[1]).decode('utf-8')
+        assert ET.fromstring(svg).tag.endswith('svg')
+        assert create_failure_mode_heatmap({'error': 'No failure mode columns found'}) is None
+
+    def test_create_anomaly_ranking_chart(self, sample_df):
+        """Test the anomaly ranking chart renders as PNG and SVG."""
+        anomalies = rank_anomalies(build_anomaly_state(sample_df))
+        assert create_anomaly_ranking_chart(anomalies).startswith('data:image/png;base64,')
+        chart = create_anomaly_ranking_chart(anomalies, fmt='svg')
+        svg = base64.b64decode(chart.split(',', 1)[1]).decode('utf-8')
+        assert ET.fromstring(svg).tag.endswith('svg')
+
     def test_chart_with_missing_columns(self):
         """Test chart generation with missing columns returns None."""
         incomplete_df = pd.DataFrame({'col1': [1, 2], 'col2': [3, 4]})
@@ -140,5 +697,141 @@ class TestVisualizations:
         assert chart is None
 
 
+class TestJobManager:
+    """Tests for jobs module."""
+
+    @pytest.fixture
+    def manager(self, tmp_path, monkeypatch):
+        """Job manager writing to a temp dir, with the LLM pipeline stubbed out."""
+        import jobs
+
+        def fake_create_analysis(df, on_progress=None, profile=None, sketches=None, anomaly_state=None):
+            on_progress('llm')
+            return {'session_id': 's1', 'summary': 'ok', 'charts': [], 'raw_stats': {'total_records': len(df)}}
+
+        monkeypatch.setattr(jobs.agent, 'create_analysis', fake_create_analysis)
+        return jobs.JobManager(jobs_dir=str(tmp_path), max_workers=1)
+
+    def test_submit_runs_to_completion(self, manager, sample_df):
+        """Test a submitted job completes and persists its result."""
+        job = manager.submit(filename='plant.csv', content=sample_df.to_csv(index=False).encode('utf-8'))
+        assert job['status'] == 'queued'
+        manager.executor.shutdown(wait=True)
+        status = manager.get(job['job_id'])
+        assert status['status'] == 'completed'
+        assert status['session_id'] == 's1'
+        assert manager.result(job['job_id'])['raw_stats']['total_records'] == 100
+
+    def test_rejects_disallowed_callback_urls(self, manager, monkeypatch):
+        """Test callbacks are limited to http(s) URLs on allowlisted hosts."""
+        import jobs
+        monkeypatch.setattr(jobs.settings, 'callback_allowed_hosts', 'n8n, hooks.example.com:8443')
+        jobs.validate_callback_url('http://n8n:5678/webhook/done')
+        jobs.validate_callback_url('https://hooks.example.com:8443/done')
+        for url in ('http://169.254.169.254/latest/meta-data', 'file:///etc/passwd',
+                    'https://hooks.example.com/done', 'http://n8n.evil.com/', 'http://user@localhost/'):
+            with pytest.raises(ValueError):
+                jobs.validate_callback_url(url)
+        with pytest.raises(ValueError):
+            manager.submit(dataset_id='d1', callback_url='http://localhost:8000/admin/profiling')
+        assert list(manager.jobs_dir.glob('*.json')) == []
+
+    def test_recover_requeues_unfinished_jobs(self, manager, sample_df, tmp_path):
+        """Test jobs interrupted mid-run are re-queued from persisted state."""
+        (tmp_path / 'j1.input').write_bytes(sample_df.to_csv(index=False).encode('utf-8'))
+        (tmp_path / 'j1.json').write_text(json.dumps({
+            'job_id': 'j1', 'status': 'running', 'stage': 'llm', 'filename': 'plant.csv',
+            'dataset_id': None, 'callback_url': None, 'session_id': None, 'error': None,
+            'created_at': '2026-01-01T00:00:00', 'updated_at': '2026-01-01T00:00:00'
+        }))
+        assert manager.recover() == 1
+        manager.executor.shutdown(wait=True)
+        assert manager.get('j1')['status'] == 'completed'
+
+
+class TestProfiling:
+    """Tests for profiling module."""
+
+    def test_profile_session_writes_artifacts(self, sample_df, tmp_path, monkeypatch):
+        """Test a profiled block produces pstats, collapsed stacks and allocation spans."""
+        from profiling import profiler
+        monkeypatch.setattr(profiler, 'profile_dir', tmp_path)
+
+        profiler.request_started()
+        session = profiler.start('req-1')
+        assert profiler.start('req-2') is None  # one profile at a time
+        profiler.request_started()  # another request overlaps the profile
+        for _ in range(20):
+            normalize_columns(sample_df)
+        profiler.request_finished()
+        summary = profiler.stop(session)
+        profiler.request_finished()
+
+        assert summary['overlap']['concurrent_requests'] == 1
+        assert summary['overlap']['max_threads'] >= 1
+        assert profiler.in_flight == 0
+
+        assert summary['allocation_spans']['normalize_columns']['calls'] == 20
+        assert summary['allocation_spans']['normalize_columns']['max_peak_bytes'] > 0
+        assert profiler.list() == ['req-1']
+        assert profiler.artifact('req-1', 'pstats').stat().st_size > 0
+        for line in profiler.artifact('req-1', 'collapsed').read_text().splitlines():
+            stack, count = line.rsplit(' ', 1)
+            assert int(count) > 0
+        with pytest.raises(KeyError):
+            profiler.artifact('../req-1', 'pstats')
+        with pytest.raises(ValueError):
+            profiler.start('../../x')  # IDs become file names
+        assert profiler.active is None
+
+    def test_process_metrics(self):
+        """Test process metrics report resident memory, threads and uptime."""
+        from profiling import process_metrics
+        metrics = process_metrics()
+
+        assert metrics['peak_rss_bytes'] > 0
+        if metrics['rss_bytes'] is not None:
+            assert 0 < metrics['rss_bytes'] <= metrics['peak_rss_bytes']
+        assert metrics['threads'] >= 1
+        assert metrics['uptime_seconds'] >= 0
+
+
+class TestConversation:
+    """Tests for agent conversation history."""
+
+    def test_chart_payloads_stored_once(self):
+        """Test identical charts are interned once and tool content holds only a reference."""
+        from agent.history import Conversation
+        conversation = Conversation('system')
+        image = 'data:image/png;base64,' + 'A' * 10000
+        chart = {'type': 'chart', 'chart_type': 'failure_by_type', 'image': image}
+
+        key = conversation.append_tool_result(chart)
+        assert conversation.append_tool_result(chart) == key
+        assert len(conversation.payloads) == 1
+        assert conversation.chart(key) == image
+        assert json.loads(conversation.messages[-1].content)['image'] == f'chart:{key}'
+        assert image not in conversation.messages[-1].content
+
+    def test_ollama_messages_built_incrementally(self):
+        """Test the Ollama message list is extended in place between turns."""
+        from agent.history import Conversation
+        conversation = Conversation('system')
+        conversation.append_user('hello')
+        first = conversation.ollama_messages()
+        assert [m['role'] for m in first] == ['system', 'user']
+
+        conversation.append_assistant('', [{'function': {'name': 'analyze_data'}}])
+        conversation.append_tool_result({'type': 'analysis', 'data': {}})
+        conversation.append_assistant('done')
+        second = conversation.ollama_messages()
+        assert second is first
+        assert [m['role'] for m in second] == ['system', 'user', 'assistant', 'tool', 'assistant']
+        assert conversation.last_assistant_content() == 'done'
+
+        conversation.reset()
+        assert conversation.ollama_messages() == [{'role': 'system', 'content': 'system'}]
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])